@@ -3,22 +3,31 @@
 api/fastapi_app.py
 
 FastAPI application for Pasty serverless deployment. Handles API endpoints, background tasks, and integrates Socket.IO for real-time updates.
+
+Cold starts are user-facing latency here, so the heavy parts load on first use instead of at import:
+the DB layer (SQLAlchemy, the engine and the schema check), Socket.IO, and the Jinja2 templates.
+Everything loaded stays in module state, so warm invocations reuse the engine and its connections.
 """
 
 from fastapi import FastAPI, Request, APIRouter, HTTPException, Depends
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
 from pydantic import BaseModel
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-import socketio
-import db
+from mangum import Mangum
+import assets
+import pages
+import presence
+import ratelimit
+import functools
+import importlib.util
 import logging
 import os
+import sys
 import asyncio
-import time
+import threading
+from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv()
@@ -27,9 +36,24 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Socket.IO setup
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins=[])
-socket_app = socketio.ASGIApp(sio)
+def lazy_import(name):
+    """Return module `name`, running its code only when one of its attributes is first used."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Importing db pulls in SQLAlchemy and builds the engine; that now happens in ready_db()
+db = lazy_import("db")
+
+# Socket.IO setup: the server is built on the first /socket.io request (see get_socket_app)
+sio = None
+_socket_app = None
 
 # FastAPI app and router
 # Support deployment under a path prefix (e.g., /pasty) via ROOT_PATH env and/or proxy header
@@ -37,8 +61,16 @@ ROOT_PATH = os.getenv("ROOT_PATH", "")
 app = FastAPI(root_path=ROOT_PATH)
 router = APIRouter()
 
+# Prefix for the links in the pages, which are rendered without a request
+PUBLIC_ROOT = os.getenv("PUBLIC_ROOT", ROOT_PATH).rstrip("/")
+if PUBLIC_ROOT and not PUBLIC_ROOT.startswith("/"):
+    PUBLIC_ROOT = "/" + PUBLIC_ROOT
+
+# Static files are hashed and compressed on the first request or page render, not at import
+static_assets = assets.AssetManifest("static", f"{PUBLIC_ROOT}/static")
+
 # Mount static directory for JS, CSS, etc.
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", assets.HashedStaticFiles(static_assets), name="static")
 
 # Optional: also mount static under an alternate prefix if the proxy doesn't strip
 ALT_STATIC_PREFIX = os.getenv("ALT_STATIC_PREFIX", "").rstrip("/")
@@ -46,10 +78,25 @@ if ALT_STATIC_PREFIX:
     mount_path = f"{ALT_STATIC_PREFIX}/static"
     if not mount_path.startswith("/"):
         mount_path = "/" + mount_path
-    app.mount(mount_path, StaticFiles(directory="static"), name="static_alt")
-
-# Jinja2 templates directory
-templates = Jinja2Templates(directory="templates")
+    app.mount(mount_path, assets.HashedStaticFiles(static_assets), name="static_alt")
+
+MAX_CONTENT_BYTES = int(os.getenv("MAX_CONTENT_BYTES", 512 * 1024))  # UTF-8 bytes per text
+EXPIRATION_HOURS = int(os.getenv("EXPIRATION_HOURS", 24))  # Same setting as db.py, read here so pages render without the DB layer
+
+@functools.lru_cache(maxsize=None)
+def get_templates():
+    """Jinja2 templates, loaded on the first page render."""
+    from fastapi.templating import Jinja2Templates
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals["MAX_CONTENT_BYTES"] = MAX_CONTENT_BYTES
+    templates.env.globals["PUBLIC_ROOT"] = PUBLIC_ROOT
+    templates.env.globals["asset_url"] = static_assets.url
+    return templates
+
+@functools.lru_cache(maxsize=None)
+def get_page_cache():
+    """Pages rendered once per warm container and served from memory with ETags."""
+    return pages.PageCache(get_templates(), {"EXPIRATION_HOURS": EXPIRATION_HOURS})
 
 # Middleware to respect X-Forwarded-Prefix from Caddy and similar proxies
 class PrefixMiddleware(BaseHTTPMiddleware):
@@ -70,63 +117,141 @@ class TextPayload(BaseModel):
 
 # ---- Utility Functions ----
 
+def content_too_large(content) -> bool:
+    """The limit is on UTF-8 bytes, so multi-byte text can't slip past a character count."""
+    return len(content) > MAX_CONTENT_BYTES or len(content.encode("utf-8")) > MAX_CONTENT_BYTES
+
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+def _initialize_db_once():
+    global _db_ready
+    with _db_lock:
+        if not _db_ready:
+            db.initialize_db()
+            db.refresh_row_count()
+            _db_ready = True
+            logger.info("Database initialized successfully.")
+
+async def ready_db():
+    """Import and initialize the DB layer on first use; later calls (and warm invocations) return at once.
 
-def delete_expired_entries_background():
-    """Background task to delete expired text entries from the database."""
-    db.delete_expired_entries()
+    initialize_db() skips schema creation when the stored schema is already current.
+    """
+    if not _db_ready:
+        await asyncio.to_thread(_initialize_db_once)
+    return db
+
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", 300))  # Seconds between expiry sweeps
+COUNT_BROADCAST_INTERVAL = float(os.getenv("COUNT_BROADCAST_INTERVAL", 1))  # Seconds between count broadcasts
+
+
+async def delete_expired_entries_background():
+    """Background task to delete expired text entries from the database.
+
+    Reads already treat expired rows as missing, so the sweep only reclaims space and IDs.
+    """
+    while True:
+        try:
+            await ready_db()
+            deleted = await db.run(db.delete_expired_entries)
+            if deleted:
+                logger.info(f"Deleted {deleted} expired entries")
+        except Exception as e:
+            logger.error(f"Failed to delete expired entries: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+
+
+_last_broadcast_count = None
 
 
 async def update_row_count():
-    """Emit the current row count to all connected Socket.IO clients."""
+    """Emit the current row count to all connected Socket.IO clients, if it changed since the last broadcast."""
+    global _last_broadcast_count
+    if sio is None or not _db_ready:
+        # Nobody can be connected yet, and nothing has been stored through this process
+        return
     try:
-        row_count = db.get_db_count()
+        row_count = db.get_row_count()
+        if row_count == _last_broadcast_count:
+            return
+        _last_broadcast_count = row_count
         logger.info(f"Broadcasting new row count: {row_count}")
         await sio.emit('count_update', {'count': row_count})
     except Exception as e:
         logger.error(f"Failed to update row count: {e}")
 
-# ---- Simple Rate Limiter (30 per minute) ----
-RATE_LIMIT_PER_MINUTE = 30
-_rate_buckets = {}
-_rate_lock = asyncio.Lock()
 
-def _client_ip(request: Request) -> str:
-    ip = request.headers.get('cf-connecting-ip')
+async def broadcast_row_count_background():
+    """Background task that coalesces row count changes into at most one broadcast per interval."""
+    while True:
+        await asyncio.sleep(COUNT_BROADCAST_INTERVAL)
+        await update_row_count()
+
+# ---- Rate Limiting ----
+# Per route/event limits as "name=hits/seconds"; names without an entry are not limited
+RATE_LIMITS = ratelimit.parse_limits(os.getenv("RATE_LIMITS", "ping=30/60,save_text=20/60,retrieve_text=30/60"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))  # Tracked clients per limiter
+rate_limiters = {
+    name: ratelimit.RateLimiter(limit, window, max_keys=RATE_LIMIT_MAX_CLIENTS)
+    for name, (limit, window) in RATE_LIMITS.items()
+}
+_sid_ips = {}  # Socket.IO sid -> client IP, recorded on connect
+
+# Connection counts maintained on connect/disconnect, so ping reads them in O(1)
+clients = presence.Presence()
+
+def _forwarded_ip(header) -> str:
+    # Prefer Cloudflare and proxy headers; `header` looks up a lower-case header name
+    ip = header('cf-connecting-ip')
     if not ip:
-        xff = request.headers.get('x-forwarded-for')
+        xff = header('x-forwarded-for')
         if xff:
             ip = xff.split(',')[0].strip()
     if not ip:
-        ip = request.headers.get('x-real-ip')
+        ip = header('x-real-ip')
+    return ip
+
+def _client_ip(request: Request) -> str:
+    ip = _forwarded_ip(request.headers.get)
     if not ip and request.client:
         ip = request.client.host
     return ip or 'unknown'
 
-async def rate_limit_ping(request: Request):
-    now = int(time.time())
-    window = now // 60
-    ip = _client_ip(request)
-    key = (ip, window)
-    async with _rate_lock:
-        for (k_ip, k_win) in list(_rate_buckets.keys()):
-            if k_win < window - 1:
-                _rate_buckets.pop((k_ip, k_win), None)
-        count = _rate_buckets.get(key, 0) + 1
-        _rate_buckets[key] = count
-        if count > RATE_LIMIT_PER_MINUTE:
+def _environ_ip(environ) -> str:
+    ip = _forwarded_ip(lambda name: environ.get('HTTP_' + name.upper().replace('-', '_')))
+    return ip or environ.get('REMOTE_ADDR') or 'unknown'
+
+def is_rate_limited(name, key) -> bool:
+    """Count a hit for `key` against the `name` limit and report whether it is over."""
+    limiter = rate_limiters.get(name)
+    return limiter is not None and not limiter.hit(key)
+
+def rate_limit(name):
+    """FastAPI dependency that rejects requests over the `name` limit with 429."""
+    async def dependency(request: Request):
+        if is_rate_limited(name, _client_ip(request)):
+            # Too Many Requests
             raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    return dependency
+
+rate_limit_ping = rate_limit("ping")
 
 # ---- Socket.IO Events ----
 
-@sio.event
 async def connect(sid, environ):
     logger.info(f"Client connected: {sid}")
-    # Send current count immediately on connect
-    await update_row_count()
+    _sid_ips[sid] = _environ_ip(environ)
+    clients.connect(sid)
+    await ready_db()
+    # Send current count to the new client only; everyone else is kept up to date by the ticker
+    await sio.emit('count_update', {'count': db.get_row_count()}, room=sid)
 
-@sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    _sid_ips.pop(sid, None)
+    clients.disconnect(sid)
 
 # @sio.event
 # async def ping(sid):
@@ -135,28 +260,26 @@ async def disconnect(sid):
 #         'active_connections': len(sio.manager.get_participants('/', None))
 #     }, room=sid)
 
-@sio.event
 async def ping(sid):
-    # Get all connected clients and count them
-    participants = list(sio.manager.get_participants('/', None))
     await sio.emit('pong', {
         'server_time': datetime.now(timezone.utc).isoformat(),
-        'active_connections': len(participants)
+        'active_connections': clients.count()
     }, room=sid)
 
-@sio.event
 async def save_text(sid, data):
     try:
-        if len(data['content']) > 2000:
+        if is_rate_limited('save_text', _sid_ips.get(sid, sid)):
+            await sio.emit('save_error', {'error': 'Too many requests. Please slow down.'}, room=sid)
+            return
+        if content_too_large(data['content']):
             await sio.emit('save_error', {'error': 'Text exceeds allowed length.'}, room=sid)
             return
         
         now = datetime.now(timezone.utc)
-        id_ = db.generate_unique_id()
-        ip_address = 'socket.io'  # Can't get IP directly from Socket.IO
+        ip_address = _sid_ips.get(sid, 'socket.io')
         
-        db.insert_text(id_, data['content'], now, now, ip_address)
-        await update_row_count()
+        await ready_db()
+        id_ = await db.run(db.create_text, data['content'], now, ip_address)
         
         await sio.emit('save_success', {
             'id': id_,
@@ -166,14 +289,15 @@ async def save_text(sid, data):
         logger.error(f"Error saving text: {e}")
         await sio.emit('save_error', {'error': str(e)}, room=sid)
 
-@sio.event
 async def retrieve_text(sid, text_id):
     try:
-        db.delete_expired_entries()
-        row = db.get_text_by_id(text_id)
+        if is_rate_limited('retrieve_text', _sid_ips.get(sid, sid)):
+            await sio.emit('retrieve_error', {'error': 'Too many requests. Please slow down.'}, room=sid)
+            return
+        await ready_db()
+        row = await db.run(db.consume_text, text_id)
         
-        if row:
-            db.update_last_accessed(text_id, datetime.now(timezone.utc))
+        if row is not None:
             await sio.emit('retrieve_success', {
                 'id': text_id,
                 'content': str(row)
@@ -186,35 +310,60 @@ async def retrieve_text(sid, text_id):
         logger.error(f"Error retrieving text: {e}")
         await sio.emit('retrieve_error', {'error': str(e)}, room=sid)
 
+def get_socket_app():
+    """Build the Socket.IO server and its ASGI app once; importing socketio is a large share of a cold start."""
+    global sio, _socket_app
+    if _socket_app is None:
+        import socketio
+        sio = socketio.AsyncServer(
+            async_mode='asgi',
+            cors_allowed_origins=[],
+            # Room for a full-size text after JSON escaping, which can double its size
+            max_http_buffer_size=max(1_000_000, 2 * MAX_CONTENT_BYTES + 64 * 1024),
+        )
+        for handler in (connect, disconnect, ping, save_text, retrieve_text):
+            sio.on(handler.__name__, handler)
+        _socket_app = socketio.ASGIApp(sio)
+    return _socket_app
+
+async def socket_app(scope, receive, send):
+    await get_socket_app()(scope, receive, send)
+
 # ---- Startup Events ----
+# The database is not touched at startup; ready_db() sets it up on first use
+
 
-@app.on_event("startup")
-def startup_event():
+@asynccontextmanager
+async def lifespan(app):
+    tasks = [
+        asyncio.create_task(delete_expired_entries_background()),
+        asyncio.create_task(broadcast_row_count_background()),
+    ]
     try:
-        db.initialize_db()
-        logger.info("Database initialized successfully.")
-    except Exception as e:
-        logger.error(f"Error initializing database: {e}")
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+app.router.lifespan_context = lifespan
 
 # ---- HTML Page Routes ----
 
 @app.get("/", response_class=HTMLResponse)
-def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "EXPIRATION_HOURS": db.EXPIRATION_HOURS
-    })
+async def read_root(request: Request):
+    return get_page_cache().response(request, "index.html")
 
 @app.get("/readme", response_class=HTMLResponse)
-def read_me(request: Request):
-    return templates.TemplateResponse("readme.html", {
-        "request": request,
-        "EXPIRATION_HOURS": db.EXPIRATION_HOURS
-    })
+async def readme(request: Request):
+    return get_page_cache().response(request, "readme.html")
 
 @app.get("/ping")
 async def ping_route(_: None = Depends(rate_limit_ping)):
     return {"status": "ok"}
 
 # Mount Socket.IO app
-app.mount("/socket.io", socket_app)
\ No newline at end of file
+app.mount("/socket.io", socket_app)
+
+# Netlify / AWS Lambda entry point. Lifespan is off because Mangum would run startup and shutdown
+# around every invocation; module state already lives as long as the warm container.
+handler = Mangum(app, lifespan="off")
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+assets.py
+
+Build-free static asset pipeline. On first use (at startup in main.py), every file in the static
+directory is read, fingerprinted by content hash, and compressed once with gzip and brotli.
+Templates link to assets through asset_url("app.js"), which returns the hashed URL
+(/static/app.3f2a9c1b0d4e.js). That URL is served with a year-long immutable Cache-Control, so
+clients keep their copy across restarts and fetch again only when the content changes.
+
+The plain names (/static/app.js) keep working with Cache-Control: no-cache and an ETag, for links
+cached from before a deploy. Files over MAX_ASSET_BYTES are left on disk, served by StaticFiles and
+linked as name?v=<hash>. Changes to the static directory are picked up on restart.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+
+from fastapi.staticfiles import StaticFiles
+from starlette.requests import Request
+
+import pages
+
+logger = logging.getLogger(__name__)
+
+MAX_ASSET_BYTES = 1024 * 1024  # Larger files are not held in memory
+HASH_LENGTH = 12  # Hex digits of the SHA-256 in a hashed file name
+HASH_CHUNK_BYTES = 1024 * 1024  # Read size when hashing files too large to hold in memory
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def hashed_name(name, digest):
+    """app.js -> app.<digest>.js; the hash goes before the extension so the type stays recognisable."""
+    directory, filename = os.path.split(name)
+    stem, ext = os.path.splitext(filename)
+    return os.path.join(directory, f"{stem}.{digest}{ext}")
+
+
+class AssetManifest:
+    """The fingerprinted contents of one static directory, shared by every mount that serves it."""
+
+    def __init__(self, directory, prefix="/static"):
+        self.directory = directory
+        self.prefix = prefix.rstrip("/")
+        self._urls = {}  # name -> URL given to templates
+        self._plain = {}  # name -> CachedBody
+        self._hashed = {}  # hashed name -> CachedBody
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Hash and compress every file once; later calls return at once."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            total = 0
+            for root, dirs, files in os.walk(self.directory):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, self.directory)
+                    total += self._add(name, path)
+            self._loaded = True
+            logger.info(f"Loaded {len(self._hashed)} static assets ({total} bytes) from {self.directory}")
+
+    def _add(self, name, path):
+        url_name = name.replace(os.sep, "/")
+        if os.path.getsize(path) > MAX_ASSET_BYTES:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()[:HASH_LENGTH]
+            self._urls[name] = f"{self.prefix}/{url_name}?v={digest}"
+            return 0
+        with open(path, "rb") as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        asset = pages.CachedBody(body, media_type, "no-cache")
+        self._plain[name] = asset
+        self._hashed[hashed_name(name, digest)] = asset
+        self._urls[name] = f"{self.prefix}/{hashed_name(url_name, digest)}"
+        return len(body)
+
+    def url(self, name):
+        """The cache-busting URL for static file `name`; the template global asset_url."""
+        self.load()
+        try:
+            return self._urls[name.replace("/", os.sep)]
+        except KeyError:
+            raise ValueError(f"Unknown static asset: {name}") from None
+
+    def response(self, request, path):
+        """The response for a request path relative to the mount, or None if it isn't held in memory."""
+        self.load()
+        asset = self._hashed.get(path)
+        if asset is not None:
+            return asset.response(request, {"Cache-Control": IMMUTABLE})
+        asset = self._plain.get(path)
+        if asset is not None:
+            return asset.response(request)
+        return None
+
+
+class HashedStaticFiles(StaticFiles):
+    """StaticFiles serving a manifest's assets from memory, in the encoding the client prefers.
+
+    Anything the manifest doesn't hold (large files, unknown paths) goes through StaticFiles as usual.
+    """
+
+    def __init__(self, manifest, **kwargs):
+        super().__init__(directory=manifest.directory, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path, scope):
+        if scope["method"] in ("GET", "HEAD"):
+            response = self.manifest.response(Request(scope), path)
+            if response is not None:
+                return response
+        return await super().get_response(path, scope)
@@ -0,0 +1,260 @@
+"""
+bench/bench_db.py
+
+Microbenchmarks for the db.py primitives on in-memory and on-file SQLite, at several table sizes:
+
+    empty     no rows
+    nearfull  99% of the ID space at the default ID_MAX_LENGTH (so allocation works in the last tier)
+    1m        1,000,000 rows (needs ID_MAX_LENGTH=11; the default space holds about 100k IDs)
+
+Each (backend, size) scenario runs in its own process on a fresh database, since db.py reads its
+settings at import time. Rows are preloaded in bulk with a tenth of them already expired, so the
+final expiry sweep has real work to do. Fast primitives are timed in --rounds rounds; per primitive
+the best round's median ("best") is reported next to the overall median and p95.
+
+Shared and virtual machines slow down as a whole for minutes at a time, which would swamp a plain
+comparison. So every round first times a fixed raw-sqlite3 workload, and each primitive's "score" is
+its lowest round median divided by that round's yardstick. Regressions are judged on the score.
+
+Baselines: --save writes the results to a JSON file; --check compares a run against one and exits 1
+when any primitive's score rose by more than --threshold and its best round got slower by more than
+--min-delta-us, so microsecond jitter on the in-memory primitives is not reported. Baselines are only meaningful on the
+machine they were recorded on.
+
+Usage:
+    python bench/bench_db.py [--backends memory,file] [--sizes empty,nearfull,1m] [--iterations 200]
+                             [--save bench/baselines/db.json] [--check bench/baselines/db.json] [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_ID_MAX_LENGTH = 8
+SIZES = {"empty": 0, "nearfull": None, "1m": 1_000_000}  # None: computed from the ID space
+EXPIRED_FRACTION = 0.1
+PRELOAD_CHUNK = 50_000
+BATCH = 50  # Entries per create_texts call
+WARMUP = 20  # Untimed calls per fast primitive, so statement caches and the page cache are warm
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def id_max_length_for(rows):
+    """Smallest ID_MAX_LENGTH whose ID space holds `rows` plus room for the benchmark's own inserts."""
+    import ids
+
+    length = DEFAULT_ID_MAX_LENGTH
+    space = sum(len(ids.ids_of_length(n)) for n in range(2, length + 1))
+    while space < rows * 1.1:
+        length += 1
+        space += len(ids.ids_of_length(length))
+    return length
+
+
+def nearfull_rows():
+    import ids
+
+    return int(sum(len(ids.ids_of_length(n)) for n in range(2, DEFAULT_ID_MAX_LENGTH + 1)) * 0.99)
+
+
+def preload(db, rows, size):
+    """Bulk insert `rows` texts under allocator IDs, EXPIRED_FRACTION of them past expiry."""
+    now = datetime.now(timezone.utc)
+    expired_at = now - timedelta(hours=db.EXPIRATION_HOURS + 1)
+    allocator = db.get_allocator()
+    content = "x" * size
+    expired = int(rows * EXPIRED_FRACTION)
+    done = 0
+    while done < rows:
+        n = min(PRELOAD_CHUNK, rows - done)
+        batch = [{"id": allocator.allocate(), "content": content, "ip_address": "bench", "retrieval_count": 0,
+                  "created_at": expired_at if done + i < expired else now, "last_accessed": now}
+                 for i in range(n)]
+        with db.engine.begin() as conn:
+            conn.execute(insert(db.Text), batch)
+        done += n
+    db.refresh_row_count()
+
+
+def calibrate(repeat=3):
+    """Seconds for a fixed raw-sqlite3 workload, best of `repeat`: a yardstick for how fast the machine is right now."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (id TEXT PRIMARY KEY, content TEXT)")
+        for i in range(500):
+            conn.execute("INSERT INTO t VALUES (?, ?)", (str(i), "x" * 100))
+            conn.execute("SELECT content FROM t WHERE id = ?", (str(i // 2),)).fetchone()
+        conn.commit()
+        conn.close()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def timed(samples, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def worker(args):
+    """Preload, time every primitive and print {primitive: [[calibration, [seconds per call, ...]] per round]}."""
+    import db
+
+    db.initialize_db()
+    preload(db, args.rows, args.size)
+    with db.get_session() as session:
+        stored = [id_ for (id_,) in session.execute(select(db.Text.id).where(
+            db.Text.created_at >= datetime.now(timezone.utc) - timedelta(hours=db.EXPIRATION_HOURS)).limit(10_000))]
+    content = "y" * args.size
+    now = datetime.now(timezone.utc)
+    n = args.iterations
+    for _ in range(WARMUP):
+        warm = db.create_text(content, now, "bench")
+        db.id_exists(warm)
+        db.update_last_accessed(warm, now)
+        db.consume_text(warm)
+        db.consume_text(warm)
+    samples = {name: [] for name in ("generate_unique_id", "create_text", "create_texts", "id_exists",
+                                     "update_last_accessed", "consume_text", "get_row_count",
+                                     "refresh_row_count", "reseed_allocator", "expire_nothing_due",
+                                     "expire_sweep")}
+
+    per_round = max(1, n // args.rounds)
+    for _ in range(args.rounds):
+        calibration = calibrate()
+        rnd = {name: [] for name in samples}
+        for _ in range(per_round):
+            db.id_allocator.release(timed(rnd["generate_unique_id"], db.generate_unique_id))
+        created = [timed(rnd["create_text"], db.create_text, content, now, "bench") for _ in range(per_round)]
+        for _ in range(max(1, per_round // BATCH)):
+            created += timed(rnd["create_texts"], db.create_texts, [(content, now, "bench")] * BATCH)
+        for _ in range(per_round):
+            timed(rnd["id_exists"], db.id_exists, random.choice(stored) if stored else "QW")
+            timed(rnd["update_last_accessed"], db.update_last_accessed, random.choice(created), now)
+            timed(rnd["get_row_count"], db.get_row_count)
+        # Two reads each: the first bumps the count, the second deletes the row
+        for id_ in created + created:
+            timed(rnd["consume_text"], db.consume_text, id_)
+        for name, values in rnd.items():
+            if values:
+                samples[name].append([calibration, values])
+    # Full-table primitives: every call is its own round
+    for _ in range(args.slow_iterations):
+        for name, func in (("refresh_row_count", db.refresh_row_count), ("reseed_allocator", db.reseed_allocator)):
+            samples[name].append([calibrate(), []])
+            timed(samples[name][-1][1], func)
+    # The sweep empties the expired tenth, so measure the common case (nothing due) afterwards
+    samples["expire_sweep"].append([calibrate(), []])
+    timed(samples["expire_sweep"][-1][1], db.delete_expired_entries)
+    for _ in range(args.rounds):
+        samples["expire_nothing_due"].append([calibrate(), []])
+        for _ in range(per_round):
+            timed(samples["expire_nothing_due"][-1][1], db.delete_expired_entries)
+    print(json.dumps(samples))
+
+
+def run_scenario(args, backend, size_name):
+    rows = SIZES[size_name]
+    if rows is None:
+        rows = nearfull_rows()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = "sqlite:///:memory:" if backend == "memory" else f"sqlite:///{tmp}/bench.db"
+        env = {**os.environ, "DATABASE_URL": url, "ID_MAX_LENGTH": str(id_max_length_for(rows)),
+               "SPOOL_DIR": os.path.join(tmp, "spool")}
+        command = [sys.executable, __file__, "--worker", "--rows", str(rows), "--size", str(args.size),
+                   "--iterations", str(args.iterations), "--rounds", str(args.rounds), "--slow-iterations", str(args.slow_iterations)]
+        out = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    summary = {}
+    for name, rounds in json.loads(out.splitlines()[-1]).items():
+        values = [value for _, round_ in rounds for value in round_]
+        summary[name] = {"best_us": min(statistics.median(round_) for _, round_ in rounds) * 1e6,
+                         "score": min(statistics.median(round_) / calibration for calibration, round_ in rounds),
+                         "median_us": statistics.median(values) * 1e6, "p95_us": percentile(values, 95) * 1e6,
+                         "calls": len(values)}
+    return summary
+
+
+def compare(results, baseline, threshold, min_delta_us):
+    """Return a line per primitive whose score rose by more than `threshold` and whose best round is `min_delta_us` slower."""
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if not before:
+            continue
+        if current["score"] > before["score"] * (1 + threshold) and current["best_us"] - before["best_us"] > min_delta_us:
+            regressions.append(f"{key}: score {before['score']:.4g} -> {current['score']:.4g} "
+                               f"(best round {before['best_us']:.1f} -> {current['best_us']:.1f} us)")
+    return regressions
+
+
+def main(args):
+    results = {}
+    for backend in args.backends.split(","):
+        for size_name in args.sizes.split(","):
+            if size_name not in SIZES:
+                raise SystemExit(f"Unknown size: {size_name} (choose from {', '.join(SIZES)})")
+            start = time.perf_counter()
+            scenario = run_scenario(args, backend, size_name)
+            print(f"\n{backend}/{size_name} ({time.perf_counter() - start:.0f}s)")
+            print(f"  {'primitive':<22} {'best us':>12} {'median us':>12} {'p95 us':>12} {'score':>10} {'calls':>6}")
+            for name, s in scenario.items():
+                print(f"  {name:<22} {s['best_us']:>12.1f} {s['median_us']:>12.1f} {s['p95_us']:>12.1f} "
+                      f"{s['score']:>10.4g} {s['calls']:>6}")
+                results[f"{backend}/{size_name}/{name}"] = s
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"config": {"size": args.size, "iterations": args.iterations, "rounds": args.rounds}, "results": results}, f, indent=2)
+            f.write("\n")
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta_us)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo primitive regressed beyond {args.threshold:.0%} versus {args.check}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="memory,file")
+    parser.add_argument("--sizes", default="empty,nearfull,1m")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per fast primitive")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds the fast primitives are split into")
+    parser.add_argument("--slow-iterations", type=int, default=3, help="calls per full-table primitive")
+    parser.add_argument("--size", type=int, default=100, help="bytes per preloaded text")
+    parser.add_argument("--save", help="write results as a baseline JSON file")
+    parser.add_argument("--check", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-delta-us", type=float, default=50,
+                        help="ignore slowdowns smaller than this, which are timer and scheduling noise")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+    else:
+        main(args)
@@ -0,0 +1,85 @@
+"""
+bench/bench_fanout.py
+
+Row count fan-out to many WebSocket clients: the old one-socket-at-a-time broadcast loop versus
+websocket.ConnectionManager. Simulated sockets take `--send-ms` per message, and a fraction of them
+are slow. Reports how long each broadcast call blocks and when the fast clients have the new count.
+
+Usage:
+    python bench/bench_fanout.py [--clients 5000] [--slow 0.01] [--send-ms 0.05] [--slow-ms 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket import ConnectionManager  # noqa: E402
+
+
+class SimSocket:
+    def __init__(self, delay):
+        self.delay = delay
+        self.last = None
+        self.received_at = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        await asyncio.sleep(self.delay)
+        self.last = data["count"]
+        self.received_at = time.perf_counter()
+
+    async def close(self, code=1000):
+        pass
+
+
+class SequentialManager:
+    """The previous broadcast: await each socket in turn."""
+
+    def __init__(self):
+        self.active_connections = []
+
+    async def connect(self, websocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    async def broadcast_count(self, count):
+        for connection in self.active_connections:
+            await connection.send_json({"type": "count_update", "count": count})
+
+
+async def run(manager, args):
+    sockets = [SimSocket(args.slow_ms / 1000 if i < args.clients * args.slow else args.send_ms / 1000)
+               for i in range(args.clients)]
+    fast = [s for s in sockets if s.delay == args.send_ms / 1000]
+    for socket in sockets:
+        await manager.connect(socket)
+    await asyncio.sleep(0.5)  # let initial counts drain
+    start = time.perf_counter()
+    await manager.broadcast_count(1)
+    blocked = time.perf_counter() - start
+    while not all(s.last == 1 for s in fast):
+        await asyncio.sleep(0.001)
+    delivered = max(s.received_at for s in fast) - start
+    return blocked, delivered
+
+
+async def main(args):
+    print(f"{args.clients} clients, {args.slow:.0%} slow ({args.slow_ms} ms/send), others {args.send_ms} ms/send")
+    for name, manager in (("sequential", SequentialManager()), ("fan-out", ConnectionManager())):
+        blocked, delivered = await run(manager, args)
+        print(f"{name:<11} broadcast blocks {blocked * 1000:9.2f} ms   all fast clients updated after {delivered * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--slow", type=float, default=0.01)
+    parser.add_argument("--send-ms", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""
+bench/bench_ratelimit.py
+
+Microbenchmark for ratelimit.RateLimiter: per-hit cost as the number of distinct client IPs grows.
+The old fixed-window limiter (a dict scanned on every request) is included at small sizes for contrast.
+
+Usage:
+    python bench/bench_ratelimit.py [--hits 1000000] [--clients 1000 10000 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ratelimit import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def bench_wheel(clients, hits):
+    """Round-robin over `clients` IPs while simulated time sweeps across several windows."""
+    clock = FakeClock()
+    limiter = RateLimiter(30, window=60, max_keys=max(clients, 1), clock=clock)
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(clients)]
+    # Advance time so the run crosses ~5 windows and the wheel evicts as it goes
+    step = 300.0 / hits
+    start = time.perf_counter()
+    for i in range(hits):
+        clock.now += step
+        limiter.hit(keys[i % clients])
+    elapsed = time.perf_counter() - start
+    return elapsed / hits, len(limiter)
+
+
+def bench_legacy(clients, hits):
+    """The previous per-minute fixed-window limiter, which scans every key on every request."""
+    buckets = {}
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(clients)]
+    start = time.perf_counter()
+    for i in range(hits):
+        window = int(i * 300.0 / hits) // 60
+        for (k_ip, k_win) in list(buckets.keys()):
+            if k_win < window - 1:
+                buckets.pop((k_ip, k_win), None)
+        key = (keys[i % clients], window)
+        buckets[key] = buckets.get(key, 0) + 1
+    elapsed = time.perf_counter() - start
+    return elapsed / hits, len(buckets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=1000000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--legacy-max-clients", type=int, default=1000,
+                        help="skip the legacy limiter above this many clients (it is O(clients) per hit)")
+    args = parser.parse_args()
+
+    print(f"{'clients':>10} {'wheel ns/hit':>14} {'tracked':>9} {'legacy ns/hit':>15}")
+    for clients in args.clients:
+        per_hit, tracked = bench_wheel(clients, args.hits)
+        legacy = "-"
+        if clients <= args.legacy_max_clients:
+            legacy_hits = min(args.hits, 20000)
+            legacy = f"{bench_legacy(clients, legacy_hits)[0] * 1e9:15.0f}"
+        print(f"{clients:>10} {per_hit * 1e9:14.0f} {tracked:>9} {legacy:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+bench/bench_sqlite.py
+
+Read/write concurrency on SQLite: the default rollback-journal profile versus the tuned WAL profile
+from db.py. Reader threads look up random stored IDs while writer threads insert pastes, both through
+the pooled engine, for a fixed duration. Each profile runs in its own process on a fresh file, since
+db.py reads its settings at import time.
+
+Usage:
+    python bench/bench_sqlite.py [--readers 4] [--writers 2] [--seconds 5] [--rows 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = {
+    # SQLite's own defaults, plus the 5 s lock wait the sqlite3 module applies
+    "default": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT_MS": "5000",
+                "SQLITE_MMAP_SIZE": "0", "SQLITE_CACHE_SIZE": "-2000"},
+    "tuned": {},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def worker(args):
+    """Run the workload with the settings in the environment and print the results as JSON."""
+    import db
+
+    db.initialize_db()
+    now = datetime.now(timezone.utc)
+    stored = db.create_texts([("x" * args.size, now, "bench")] * args.rows)
+    stored = [id_ for id_ in stored if isinstance(id_, str)]
+
+    stop = threading.Event()
+    results = {"read": [], "write": [], "errors": 0}
+    lock = threading.Lock()
+
+    def loop(op, name):
+        latencies, errors = [], 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                op()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        with lock:
+            results[name].extend(latencies)
+            results["errors"] += errors
+
+    def read():
+        db.id_exists(random.choice(stored))
+
+    def write():
+        db.create_text("x" * args.size, datetime.now(timezone.utc), "bench")
+
+    threads = [threading.Thread(target=loop, args=(read, "read")) for _ in range(args.readers)]
+    threads += [threading.Thread(target=loop, args=(write, "write")) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({"settings": db.check_sqlite_settings(), **results}))
+
+
+def main(args):
+    print(f"{args.readers} readers + {args.writers} writers for {args.seconds}s, {args.rows} rows preloaded")
+    for name, overrides in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, **overrides, "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+                   "DB_MAX_WORKERS": str(args.readers + args.writers)}
+            out = subprocess.run([sys.executable, __file__, "--worker", *sys.argv[1:]], env=env,
+                                 capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.splitlines()[-1])
+        settings = result["settings"]
+        print(f"\n{name}: journal_mode={settings['journal_mode']} synchronous={settings['synchronous']}")
+        for op in ("read", "write"):
+            latencies = result[op]
+            print(f"  {op:<5} {len(latencies) / args.seconds:10.0f} ops/s   "
+                  f"p50 {statistics.median(latencies) * 1000 if latencies else 0:7.2f} ms   "
+                  f"p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+        print(f"  errors {result['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+    else:
+        main(args)
@@ -0,0 +1,89 @@
+"""
+bench/bench_writes.py
+
+Save throughput and latency: one commit per paste (db.create_text) versus the group-commit
+WriteQueue (db.create_texts). Runs against a fresh on-disk SQLite file so commits pay for fsync.
+
+Usage:
+    python bench/bench_writes.py [--clients 50] [--saves 20] [--size 500]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(save, clients, saves, content):
+    """`clients` concurrent tasks each doing `saves` sequential saves; returns (elapsed, latencies)."""
+    latencies = []
+
+    async def client():
+        for _ in range(saves):
+            start = time.perf_counter()
+            await save(content)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, latencies
+
+
+def report(name, elapsed, latencies):
+    print(f"{name:<14} {len(latencies) / elapsed:10.0f} saves/s   "
+          f"p50 {statistics.median(latencies) * 1000:7.2f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+
+
+async def main(args):
+    import db
+    import writer
+
+    db.initialize_db()
+    content = "x" * args.size
+
+    async def per_row(text):
+        now = datetime.now(timezone.utc)
+        return await db.run(db.create_text, text, now, "bench")
+
+    queue = writer.WriteQueue(lambda entries: db.run(db.create_texts, entries),
+                              batch_size=args.batch_size, max_latency=args.max_latency_ms / 1000)
+
+    async def grouped(text):
+        now = datetime.now(timezone.utc)
+        return await queue.submit((text, now, "bench"))
+
+    print(f"{args.clients} clients x {args.saves} saves, {args.size} byte pastes")
+    report("per-row commit", *await drive(per_row, args.clients, args.saves, content))
+    with db.get_session() as session:
+        session.query(db.Text).delete()
+        session.query(db.Blob).delete()
+        session.commit()
+    db.reseed_allocator()
+    report("group commit", *await drive(grouped, args.clients, args.saves, content))
+    await queue.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-latency-ms", type=float, default=2)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # db reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        asyncio.run(main(args))
@@ -0,0 +1,242 @@
+"""
+bench/loadtest.py
+
+End-to-end load test. Starts the app with uvicorn on a free local port against a temporary SQLite
+database, then runs many concurrent virtual clients. Each client holds one Socket.IO connection and one
+HTTP client and loops over a weighted mix of operations:
+
+    save      Socket.IO save_text, timed until save_success
+    retrieve  Socket.IO retrieve_text of an ID the client saved, timed until retrieve_success
+    page      HTTP GET /
+    ping      HTTP GET /ping
+    static    HTTP GET /static/app.js
+
+Results (throughput, error count and p50/p95/p99 latency per operation) are printed and written as
+JSON. With --compare, the run is checked against an earlier results file and the exit status is 1 if
+any operation's throughput dropped or p99 rose by more than --threshold.
+
+Needs the Socket.IO asyncio client: pip install -r bench/requirements.txt
+
+Usage:
+    python bench/loadtest.py [--clients 50] [--duration 10] [--mix save=4,retrieve=4,page=1,ping=1,static=1]
+                             [--out results.json] [--compare baseline.json] [--threshold 0.10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("save", "retrieve", "page", "ping", "static")
+HTTP_PATHS = {"page": "/", "ping": "/ping", "static": "/static/app.js"}
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workdir, extra_env):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/loadtest.db",
+        "SPOOL_DIR": os.path.join(workdir, "spool"),
+        "RATE_LIMITS": "",  # measure the app, not the limiter
+        **extra_env,
+    }
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(base_url, timeout=20):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/ping")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise SystemExit("Server did not start")
+
+
+class VirtualClient:
+    """One simulated user: a Socket.IO connection plus an HTTP client, doing one operation at a time."""
+
+    def __init__(self, base_url, mix, size, results):
+        self.base_url = base_url
+        self.ops = list(mix)
+        self.weights = list(mix.values())
+        self.content = "x" * size
+        self.results = results
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.http = httpx.AsyncClient(base_url=base_url)
+        self.pending = None
+        self.saved = []  # IDs with reads left
+        for event in ("save_success", "save_error", "retrieve_success", "retrieve_error"):
+            self.sio.on(event, self._resolver(event))
+
+    def _resolver(self, event):
+        async def handler(data):
+            if self.pending is not None and not self.pending.done():
+                self.pending.set_result((event, data))
+        return handler
+
+    async def _emit(self, event, data, expect):
+        self.pending = asyncio.get_running_loop().create_future()
+        await self.sio.emit(event, data)
+        name, reply = await asyncio.wait_for(self.pending, 10)
+        return name == expect, reply
+
+    async def run(self, deadline):
+        await self.sio.connect(self.base_url, transports=["websocket"])
+        try:
+            while time.monotonic() < deadline:
+                op = random.choices(self.ops, self.weights)[0]
+                if op == "retrieve" and not self.saved:
+                    op = "save"
+                start = time.perf_counter()
+                try:
+                    ok = await self._do(op)
+                except Exception:
+                    ok = False
+                self.results[op]["latencies" if ok else "errors"].append(time.perf_counter() - start)
+        finally:
+            await self.sio.disconnect()
+            await self.http.aclose()
+
+    async def _do(self, op):
+        if op == "save":
+            ok, reply = await self._emit("save_text", {"content": self.content}, "save_success")
+            if ok:
+                self.saved.extend([reply["id"]] * 2)
+            return ok
+        if op == "retrieve":
+            id_ = self.saved.pop(random.randrange(len(self.saved)))
+            ok, _ = await self._emit("retrieve_text", {"lookup_id": id_, "captcha_input": "AB", "captcha_code": "AB"},
+                                     "retrieve_success")
+            return ok
+        response = await self.http.get(HTTP_PATHS[op])
+        return response.status_code < 400
+
+
+def summarize(results, duration):
+    summary = {}
+    for op, samples in results.items():
+        latencies = samples["latencies"]
+        if not latencies and not samples["errors"]:
+            continue
+        summary[op] = {
+            "count": len(latencies),
+            "errors": len(samples["errors"]),
+            "throughput": len(latencies) / duration,
+            **{f"p{pct}_ms": (percentile(latencies, pct) or 0) * 1000 for pct in (50, 95, 99)},
+        }
+    return summary
+
+
+def compare(summary, baseline, threshold):
+    """Return a list of regressions versus a baseline summary."""
+    regressions = []
+    for op, current in summary.items():
+        before = baseline.get(op)
+        if before is None:
+            continue
+        if before["throughput"] and current["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(f"{op}: throughput {before['throughput']:.1f} -> {current['throughput']:.1f}/s")
+        if before["p99_ms"] and current["p99_ms"] > before["p99_ms"] * (1 + threshold):
+            regressions.append(f"{op}: p99 {before['p99_ms']:.2f} -> {current['p99_ms']:.2f} ms")
+    return regressions
+
+
+async def drive(args, base_url):
+    mix = parse_mix(args.mix)
+    results = {op: {"latencies": [], "errors": []} for op in OPERATIONS}
+    clients = [VirtualClient(base_url, mix, args.size, results) for _ in range(args.clients)]
+    deadline = time.monotonic() + args.duration
+    start = time.monotonic()
+    await asyncio.gather(*(client.run(deadline) for client in clients))
+    return summarize(results, time.monotonic() - start)
+
+
+def main(args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, workdir, extra_env)
+        try:
+            asyncio.run(wait_ready(base_url))
+            summary = asyncio.run(drive(args, base_url))
+        except BaseException:
+            with open(os.path.join(workdir, "server.log"), errors="replace") as f:
+                sys.stderr.write(f.read()[-4000:])
+            raise
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.clients} clients for {args.duration}s, mix {args.mix}")
+    print(f"{'op':<9} {'ops/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op, s in summary.items():
+        print(f"{op:<9} {s['throughput']:>9.1f} {s['errors']:>7} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}, "results": summary}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(summary, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} versus {args.compare}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mix", default="save=4,retrieve=4,page=1,ping=1,static=1")
+    parser.add_argument("--size", type=int, default=500, help="bytes per saved text")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the server, e.g. --env STORE_BACKEND=memory")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="results JSON from an earlier run to check against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    main(parser.parse_args())
@@ -0,0 +1,105 @@
+"""
+bench/measure_compression.py
+
+Storage cost of pastes with and without at-rest compression. For each corpus (application logs,
+Python source from this repo, JSON API responses) and each size limit, it fills a fresh SQLite file
+with the same texts stored plain and stored through compression.compress, then reports the file size.
+After VACUUM that is page_count * page_size, i.e. the page cache needed to keep every entry hot.
+
+Usage:
+    python bench/measure_compression.py [--entries 500] [--limits 2000,524288]
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+import compression  # noqa: E402
+
+
+def log_corpus(rng):
+    levels = ["INFO", "INFO", "INFO", "WARNING", "ERROR", "DEBUG"]
+    paths = ["/", "/ping", "/save", "/get/QW", "/static/app.js", "/socket.io/"]
+    while True:
+        yield (f"2025-06-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:"
+               f"{rng.randint(0, 59):02d},{rng.randint(0, 999):03d} {rng.choice(levels)} uvicorn.access: "
+               f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}:{rng.randint(1024, 65535)} - "
+               f"\"GET {rng.choice(paths)} HTTP/1.1\" {rng.choice([200, 200, 200, 304, 404, 429])}\n")
+
+
+def code_corpus(rng):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "**", "*.py"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            sources.extend(f.readlines())
+    while True:
+        start = rng.randrange(len(sources))
+        yield from sources[start:start + 40]
+
+
+def json_corpus(rng):
+    while True:
+        yield json.dumps({
+            "id": rng.randint(1, 10 ** 9),
+            "user": {"name": f"user{rng.randint(1, 5000)}", "active": rng.random() > 0.2},
+            "tags": rng.sample(["alpha", "beta", "prod", "eu", "us", "mobile", "web"], 3),
+            "score": round(rng.random() * 100, 3),
+        }) + "\n"
+
+
+CORPORA = {"logs": log_corpus, "code": code_corpus, "json": json_corpus}
+
+
+def paste(lines, size):
+    """One paste of about `size` characters taken from a corpus."""
+    parts, length = [], 0
+    while length < size:
+        line = next(lines)
+        parts.append(line)
+        length += len(line)
+    return "".join(parts)[:size]
+
+
+def store(path, texts, compress):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE texts (id TEXT PRIMARY KEY, content TEXT, body BLOB)")
+    for i, text in enumerate(texts):
+        body = compression.compress(text) if compress else None
+        conn.execute("INSERT INTO texts VALUES (?, ?, ?)", (str(i), None if body is not None else text, body))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def main(args):
+    limits = [int(limit) for limit in args.limits.split(",")]
+    print(f"{args.entries} pastes per run, sizes uniform up to the limit; threshold {compression.COMPRESS_MIN_BYTES} B")
+    print(f"{'corpus':<6} {'limit':>8} {'raw text':>10} {'plain file':>11} {'compressed':>11} {'ratio':>6}")
+    for name, corpus in CORPORA.items():
+        for limit in limits:
+            rng = random.Random(args.seed)
+            lines = corpus(rng)
+            texts = [paste(lines, rng.randint(1, limit)) for _ in range(args.entries)]
+            raw = sum(len(t.encode("utf-8")) for t in texts)
+            with tempfile.TemporaryDirectory() as tmp:
+                plain = store(os.path.join(tmp, "plain.db"), texts, compress=False)
+                packed = store(os.path.join(tmp, "packed.db"), texts, compress=True)
+            print(f"{name:<6} {limit:>8} {raw / 1024:>8.0f} KB {plain / 1024:>8.0f} KB "
+                  f"{packed / 1024:>8.0f} KB {plain / packed:>5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--limits", default="2000,524288")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
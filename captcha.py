@@ -0,0 +1,111 @@
+"""
+captcha.py
+
+Async hCaptcha verification for Pasty. One keep-alive HTTP client is shared by all requests, the number
+of verifications in flight is capped, tokens that already passed are remembered briefly, and a circuit
+breaker stops calling the provider for a while after repeated failures instead of making every user wait.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HCAPTCHA_SECRET = os.getenv("HCAPTCHA_SECRET", "")
+HCAPTCHA_VERIFY_URL = os.getenv("HCAPTCHA_VERIFY_URL", "https://hcaptcha.com/siteverify")  # Point at a stub to test
+HCAPTCHA_TIMEOUT = float(os.getenv("HCAPTCHA_TIMEOUT", 3))  # Seconds per verification request
+HCAPTCHA_MAX_CONCURRENCY = int(os.getenv("HCAPTCHA_MAX_CONCURRENCY", 20))  # Verifications in flight
+HCAPTCHA_CACHE_TTL = float(os.getenv("HCAPTCHA_CACHE_TTL", 120))  # Seconds a verified token stays accepted
+HCAPTCHA_BREAKER_FAILURES = int(os.getenv("HCAPTCHA_BREAKER_FAILURES", 5))  # Consecutive failures that open the breaker
+HCAPTCHA_BREAKER_COOLDOWN = float(os.getenv("HCAPTCHA_BREAKER_COOLDOWN", 30))  # Seconds before trying the provider again
+
+CACHE_MAX_TOKENS = 10000
+
+
+class HCaptchaVerifier:
+    """Verifies hCaptcha tokens; verify() returns False for bad tokens and while the provider is unavailable."""
+
+    def __init__(self, secret=HCAPTCHA_SECRET, url=HCAPTCHA_VERIFY_URL, timeout=HCAPTCHA_TIMEOUT,
+                 max_concurrency=HCAPTCHA_MAX_CONCURRENCY, cache_ttl=HCAPTCHA_CACHE_TTL,
+                 breaker_failures=HCAPTCHA_BREAKER_FAILURES, breaker_cooldown=HCAPTCHA_BREAKER_COOLDOWN,
+                 transport=None, clock=time.monotonic):
+        self.secret = secret
+        self.url = url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._transport = transport
+        self._clock = clock
+        self._client = None
+        self._semaphore = None
+        self._verified = {}  # token -> time it stops being accepted
+        self._failures = 0
+        self._open_until = 0.0
+
+    def _get_client(self):
+        # Created lazily so the client and semaphore belong to the running loop
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=self._transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @property
+    def breaker_open(self):
+        return self._clock() < self._open_until
+
+    async def verify(self, token, remoteip=None) -> bool:
+        if not token:
+            return False
+        now = self._clock()
+        expires = self._verified.get(token)
+        if expires is not None:
+            if expires > now:
+                return True
+            del self._verified[token]
+        if self.breaker_open:
+            return False
+        client = self._get_client()
+        data = {"secret": self.secret, "response": token}
+        if remoteip:
+            data["remoteip"] = remoteip
+        try:
+            async with self._semaphore:
+                resp = await client.post(self.url, data=data)
+            resp.raise_for_status()
+            success = bool(resp.json().get("success", False))
+        except Exception as e:
+            logger.error(f"hCaptcha verification error: {e}")
+            self._record_failure()
+            return False
+        self._failures = 0
+        if success:
+            self._remember(token)
+        return success
+
+    def _record_failure(self):
+        self._failures += 1
+        if self._failures >= self.breaker_failures:
+            self._open_until = self._clock() + self.breaker_cooldown
+            self._failures = 0
+            logger.warning(f"hCaptcha provider failing; skipping verification calls for {self.breaker_cooldown}s")
+
+    def _remember(self, token):
+        now = self._clock()
+        if len(self._verified) >= CACHE_MAX_TOKENS:
+            self._verified = {t: exp for t, exp in self._verified.items() if exp > now}
+            if len(self._verified) >= CACHE_MAX_TOKENS:
+                # Dicts keep insertion order, so this drops the oldest entry
+                del self._verified[next(iter(self._verified))]
+        self._verified[token] = now + self.cache_ttl
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
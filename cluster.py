@@ -0,0 +1,250 @@
+"""
+cluster.py
+
+Shared state for running Pasty on several workers or hosts. Without SHARED_STATE_URL everything
+stays in process. With a redis:// URL the Socket.IO client manager, rate limits, connection counts
+and the row count go through Redis; memory:// does the same through an in-process broker and store,
+which is what the tests use.
+"""
+
+import asyncio
+import os
+import socket
+import time
+
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", 30))  # Seconds before a silent worker's connections stop counting
+
+# Sliding-window hit, run atomically on Redis: KEYS = current and previous window counters,
+# ARGV = limit, overlap of the previous window, counter TTL, cost. Rejected hits are not counted,
+# exactly like ratelimit.RateLimiter, so a client that keeps retrying gets back in as the window slides.
+SLIDING_WINDOW_HIT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local cost = tonumber(ARGV[4])
+if previous * tonumber(ARGV[2]) + current + cost - 1 >= tonumber(ARGV[1]) then
+    return 0
+end
+if redis.call('INCRBY', KEYS[1], cost) == cost then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+
+class InProcessBroker:
+    """Fan-out message bus for InProcessManager instances living in the same process."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        self.subscribers.append(queue)
+        return queue
+
+    async def publish(self, message):
+        for queue in self.subscribers:
+            queue.put_nowait(message)
+
+
+class InProcessManager(AsyncPubSubManager):
+    """Socket.IO pub/sub client manager backed by an InProcessBroker."""
+    name = 'inprocess'
+
+    def __init__(self, broker, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.broker = broker
+        self.queue = broker.subscribe()
+
+    async def _publish(self, data):
+        await self.broker.publish(data)
+
+    async def _listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+class MemoryKV:
+    """In-process stand-in for the handful of Redis commands SharedState uses."""
+
+    def __init__(self, clock=time.monotonic):
+        self._data = {}
+        self._expires = {}
+        self._clock = clock
+
+    def _live(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= self._clock():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    async def get(self, key):
+        return self._data[key] if self._live(key) else None
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and self._live(key):
+            return None
+        self._data[key] = str(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expires[key] = self._clock() + ex
+        return True
+
+    async def delete(self, key):
+        self._expires.pop(key, None)
+        return 1 if self._data.pop(key, None) is not None else 0
+
+    async def incrby(self, key, amount):
+        value = int(self._data[key]) + amount if self._live(key) else amount
+        self._data[key] = str(value)
+        return value
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def expire(self, key, seconds):
+        if self._live(key):
+            self._expires[key] = self._clock() + seconds
+
+    async def hset(self, key, field, value):
+        if not self._live(key):
+            self._data[key] = {}
+        added = field not in self._data[key]
+        self._data[key][field] = str(value)
+        return int(added)
+
+    async def hgetall(self, key):
+        return dict(self._data[key]) if self._live(key) else {}
+
+    async def hdel(self, key, *fields):
+        if not self._live(key):
+            return 0
+        removed = sum(self._data[key].pop(field, None) is not None for field in fields)
+        if not self._data[key]:
+            await self.delete(key)
+        return removed
+
+    def register_script(self, script):
+        """The Python emulation of a Lua script SharedState registers, called like a redis-py Script."""
+        emulations = {SLIDING_WINDOW_HIT: self._sliding_window_hit}
+        try:
+            return emulations[script]
+        except KeyError:
+            first_line = script.strip().splitlines()[0] if script.strip() else ""
+            raise ValueError(f"MemoryKV has no emulation for the script starting {first_line!r}") from None
+
+    async def _sliding_window_hit(self, keys, args):
+        """SLIDING_WINDOW_HIT. None of the awaits below suspend, so it is atomic like the Lua original."""
+        current_key, previous_key = keys
+        limit, overlap, ttl, cost = int(args[0]), float(args[1]), int(args[2]), int(args[3])
+        current = int(await self.get(current_key) or 0)
+        previous = int(await self.get(previous_key) or 0)
+        if previous * overlap + current + cost - 1 >= limit:
+            return 0
+        if await self.incrby(current_key, cost) == cost:
+            await self.expire(current_key, ttl)
+        return 1
+
+
+class SharedState:
+    """Cluster-wide counters kept in a Redis-like key/value store."""
+
+    def __init__(self, kv, prefix="pasty", worker_id=WORKER_ID):
+        self.kv = kv
+        self.prefix = prefix
+        self.worker_id = worker_id
+        self._hit_script = kv.register_script(SLIDING_WINDOW_HIT)
+
+    async def hit(self, name, key, limit, window, now=None, cost=1):
+        """Sliding-window rate limit shared by every worker; returns False when over the limit.
+
+        Same estimate as ratelimit.RateLimiter, and like it only allowed hits are counted.
+        A hit worth `cost` hits (one per item of a batch) is allowed only if all of them fit.
+        """
+        now = time.time() if now is None else now
+        current = int(now // window)
+        base = f"{self.prefix}:rl:{name}:{key}"
+        overlap = 1.0 - (now - current * window) / window
+        allowed = await self._hit_script(keys=[f"{base}:{current}", f"{base}:{current - 1}"],
+                                         args=[limit, repr(overlap), int(2 * window) + 1, cost])
+        return bool(int(allowed))
+
+    async def publish_connections(self, count, ttl=PRESENCE_TTL, now=None):
+        """Report this worker's connection count; it stops counting if the worker stops reporting.
+
+        Every worker's count is a field of one hash, valued "<count> <deadline>", so connections()
+        reads them all with a single HGETALL instead of scanning the keyspace.
+        """
+        now = time.time() if now is None else now
+        key = f"{self.prefix}:conns"
+        await self.kv.hset(key, self.worker_id, f"{count} {now + ttl!r}")
+        # The hash itself lapses once no worker has reported for a whole TTL
+        await self.kv.expire(key, ttl)
+
+    async def connections(self, now=None):
+        """Sum of the connection counts reported by live workers."""
+        now = time.time() if now is None else now
+        key = f"{self.prefix}:conns"
+        total = 0
+        stale = []
+        for worker, value in (await self.kv.hgetall(key)).items():
+            count, deadline = value.split()
+            if float(deadline) > now:
+                total += int(count)
+            else:
+                stale.append(worker)
+        if stale:
+            # Workers that stopped reporting; dropping them keeps the hash to the live ones
+            await self.kv.hdel(key, *stale)
+        return total
+
+    async def add_rows(self, delta):
+        return int(await self.kv.incrby(f"{self.prefix}:rows", delta))
+
+    async def set_rows(self, count, only_if_missing=False):
+        await self.kv.set(f"{self.prefix}:rows", count, nx=only_if_missing)
+
+    async def rows(self):
+        value = await self.kv.get(f"{self.prefix}:rows")
+        return int(value) if value is not None else None
+
+    async def add_pairing(self, code, ttl):
+        """Mark a pairing code as having a receiver; it lapses after `ttl` seconds if never removed."""
+        await self.kv.set(f"{self.prefix}:pair:{code}", self.worker_id, ex=ttl)
+
+    async def remove_pairing(self, code):
+        await self.kv.delete(f"{self.prefix}:pair:{code}")
+
+    async def has_pairing(self, code):
+        return await self.kv.get(f"{self.prefix}:pair:{code}") is not None
+
+
+_broker = InProcessBroker()
+_memory_kv = MemoryKV()
+
+
+def client_manager(url):
+    """Socket.IO client manager for the shared-state URL, or None for the default in-process one."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return InProcessManager(_broker)
+    import socketio
+    return socketio.AsyncRedisManager(url)
+
+
+def shared_state(url):
+    """SharedState for the shared-state URL, or None when running as a single process."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return SharedState(_memory_kv)
+    import redis.asyncio
+    return SharedState(redis.asyncio.from_url(url, decode_responses=True))
@@ -0,0 +1,46 @@
+"""
+compression.py
+
+At-rest compression for Pasty. Texts of COMPRESS_MIN_BYTES or more are stored as a blob: one codec
+byte followed by the encoded payload. Shorter texts, and texts that do not shrink, stay plain text,
+so rows written before compression existed read unchanged.
+"""
+
+import os
+import zlib
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))  # Smaller texts are stored as plain text
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))  # zlib level, 1 (fast) to 9 (small)
+
+CODEC_RAW = 0  # UTF-8 bytes as-is
+CODEC_ZLIB = 1
+
+_DECODERS = {
+    CODEC_RAW: lambda payload: payload,
+    CODEC_ZLIB: zlib.decompress,
+}
+
+
+def compress(content, min_bytes=COMPRESS_MIN_BYTES, level=COMPRESS_LEVEL):
+    """Return the blob to store for `content`, or None if it should be stored as plain text."""
+    raw = content.encode("utf-8")
+    if len(raw) < min_bytes:
+        return None
+    packed = zlib.compress(raw, level)
+    if len(packed) + 1 >= len(raw):
+        return None
+    return bytes([CODEC_ZLIB]) + packed
+
+
+def decompress(blob):
+    """Decode a blob written by compress() back to text."""
+    codec, payload = blob[0], blob[1:]
+    decoder = _DECODERS.get(codec)
+    if decoder is None:
+        raise ValueError(f"Unknown content codec: {codec}")
+    return decoder(payload).decode("utf-8")
+
+
+def stored_content(content, blob):
+    """The text of a stored entry, whichever column holds it."""
+    return content if blob is None else decompress(blob)
@@ -8,38 +8,128 @@ Database layer for Pasty. Handles text storage, retrieval, expiration, and uniqu
 from datetime import datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
-import random
+import asyncio
+import functools
+import hashlib
+from collections import namedtuple
+import logging
 import string
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func
+from sqlalchemy import event, create_engine, Column, Integer, LargeBinary, String, DateTime, func, select, insert, update, delete, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+import compression
+import ids
+import spool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Constants
 EXPIRATION_HOURS = int(os.getenv("EXPIRATION_HOURS", 24))
+MAX_RETRIEVALS = 2  # An entry is deleted on its second read
 db_url = os.getenv("DATABASE_URL", "sqlite:///text_store.db")  # Use SQLAlchemy URI format
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", 4))  # Threads (and pooled connections) used for DB calls
+ID_COLUMN_LENGTH = 16  # Room for IDs up to ids.ID_MAX_LENGTH; older databases used String(2)
+INSERT_ATTEMPTS = 5  # Retries when another process took the allocated ID first
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", 500))  # Rows deleted per expiry transaction
+DEDUP_MIN_BYTES = int(os.getenv("DEDUP_MIN_BYTES", 128))  # Shorter texts stay inline; a hash would cost more than it saves
+
+# SQLite tuning, applied to every pooled connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # WAL lets readers run alongside the writer
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable under WAL except on power loss
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))  # Wait this long for a lock instead of failing
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # Bytes of the file read through mmap
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -16000))  # Page cache; negative values are KiB
 
 # SQLAlchemy setup
 Base = declarative_base()
 
-engine = create_engine(db_url, connect_args={"check_same_thread": False} if 'sqlite' in db_url else {})
+# DATABASE_URL=memory:// selects the in-process store (storage.py) and leaves this engine idle
+sql_url = "sqlite:///:memory:" if db_url.startswith("memory://") else db_url
+
+# Size the pool to the executor so every DB thread can hold a connection without waiting.
+# In-memory SQLite uses a single shared connection and does not accept pool sizing.
+pool_args = {} if ':memory:' in sql_url else {"pool_size": DB_MAX_WORKERS}
+engine = create_engine(sql_url, connect_args={"check_same_thread": False} if 'sqlite' in sql_url else {}, **pool_args)
 Session = sessionmaker(bind=engine)
+
+def sqlite_pragmas():
+    """The PRAGMA settings applied to each SQLite connection, in the order they are set."""
+    return {
+        "journal_mode": SQLITE_JOURNAL_MODE,
+        "synchronous": SQLITE_SYNCHRONOUS,
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "cache_size": SQLITE_CACHE_SIZE,
+    }
+
+def configure_sqlite(engine):
+    """Set the tuning PRAGMAs on every new connection the engine opens (no-op for other databases)."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in sqlite_pragmas().items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+configure_sqlite(engine)
 current_session = None
 
+# Bounded executor that runs the blocking SQLAlchemy calls off the event loop
+executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="pasty-db")
+
+# In-memory pool of free IDs, seeded from the table on first use
+id_allocator = ids.IdAllocator()
+_seed_lock = threading.Lock()
+
+# Row count kept in memory and adjusted on insert/delete, so readers never run COUNT(*)
+row_count = None
+_count_lock = threading.Lock()
+
 # Define Text model
 
 class Text(Base):
     """SQLAlchemy model for text entries."""
     __tablename__ = 'texts'
 
-    id = Column(String(2), primary_key=True)
-    content = Column(String)
-    created_at = Column(DateTime, default=func.now())
+    id = Column(String(ID_COLUMN_LENGTH), primary_key=True)
+    content = Column(String)  # Plain text; NULL when the entry is stored compressed in `body`
+    body = Column(LargeBinary)  # Codec byte + payload from compression.compress
+    created_at = Column(DateTime, default=func.now(), index=True)
     last_accessed = Column(DateTime)
     ip_address = Column(String)
     retrieval_count = Column(Integer, default=0)
+    # File uploads keep their body in the spool directory; these are NULL for texts
+    spool_name = Column(String)
+    file_name = Column(String)
+    media_type = Column(String)
+    file_size = Column(Integer)
+    blob_hash = Column(String(64))  # Set when the content lives in `blobs`, shared with identical texts
+
+class Blob(Base):
+    """Content shared by every text with the same SHA-256, stored once and reference counted."""
+    __tablename__ = 'blobs'
+
+    hash = Column(String(64), primary_key=True)
+    content = Column(String)  # Same plain/compressed split as Text
+    body = Column(LargeBinary)
+    refs = Column(Integer, nullable=False, default=1)
+
+# What a file read returns; last_read means the row is gone and the spool file can go after sending
+FileInfo = namedtuple("FileInfo", "spool_name file_name media_type file_size last_read")
 
 # Set connection/session for global use
 
@@ -62,48 +152,328 @@ def get_session():
         finally:
             session.close()
 
+async def run(func, *args, **kwargs):
+    """Run a blocking database function on the DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
 def initialize_db():
-    """Create the table if it doesn't exist."""
-    Base.metadata.create_all(engine)
+    """Create the table if it doesn't exist and migrate older schemas.
+
+    On SQLite the schema's fingerprint is stored in PRAGMA user_version, so starting against a
+    database that is already up to date costs one PRAGMA read instead of a round of introspection.
+    """
+    sqlite = engine.dialect.name == "sqlite"
+    fingerprint = schema_fingerprint()
+    if sqlite and _stored_fingerprint() == fingerprint:
+        logger.debug("Schema is current; skipping creation and migrations")
+    else:
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            _migrate_id_column(conn)
+            _add_missing_columns(conn)
+            # create_all skips indexes on tables that already exist
+            for index in Text.__table__.indexes:
+                index.create(conn, checkfirst=True)
+            if sqlite:
+                conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+    if sqlite and ":memory:" not in sql_url:
+        check_sqlite_settings()
+
+def schema_fingerprint():
+    """A positive 31-bit checksum of the tables, columns and indexes the models define."""
+    parts = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        parts += [f"{column.name} {column.type} {column.nullable}" for column in table.columns]
+        parts += sorted(index.name for index in table.indexes)
+    return zlib.crc32("\n".join(parts).encode()) & 0x7FFFFFFF or 1
+
+def _stored_fingerprint():
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+def check_sqlite_settings():
+    """Read back the effective PRAGMA values, log them and warn about any that did not apply.
+
+    SQLite silently keeps the old journal mode when WAL is unavailable (in-memory databases,
+    some network filesystems), so this is the only way to know what is actually in effect.
+    """
+    with engine.connect() as conn:
+        effective = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in sqlite_pragmas()}
+    logger.info(f"SQLite settings: {effective}")
+    synchronous_levels = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+    for name, wanted in sqlite_pragmas().items():
+        actual = effective[name]
+        if name == "synchronous":
+            wanted = synchronous_levels.get(str(wanted).upper(), wanted)
+        if str(actual).lower() != str(wanted).lower():
+            logger.warning(f"SQLite {name} is {actual}, not the configured {wanted}")
+    return effective
+
+def _migrate_id_column(conn):
+    """Widen texts.id on databases created when IDs were limited to two characters."""
+    columns = {c["name"]: c for c in inspect(conn).get_columns("texts")}
+    length = getattr(columns["id"]["type"], "length", None)
+    if length is None or length >= ID_COLUMN_LENGTH:
+        return
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        # SQLite does not enforce VARCHAR lengths, so longer IDs already fit
+        return
+    if dialect == "postgresql":
+        conn.execute(text(f"ALTER TABLE texts ALTER COLUMN id TYPE VARCHAR({ID_COLUMN_LENGTH})"))
+    elif dialect in ("mysql", "mariadb"):
+        conn.execute(text(f"ALTER TABLE texts MODIFY id VARCHAR({ID_COLUMN_LENGTH})"))
+    else:
+        logger.warning(f"texts.id is VARCHAR({length}); widen it to {ID_COLUMN_LENGTH} to allow longer IDs")
+        return
+    logger.info(f"Widened texts.id from VARCHAR({length}) to VARCHAR({ID_COLUMN_LENGTH})")
+
+def _add_missing_columns(conn):
+    """Add columns introduced after the table was created (compressed bodies, file metadata)."""
+    existing = {c["name"] for c in inspect(conn).get_columns("texts")}
+    for column in Text.__table__.columns:
+        if column.name in existing or not column.nullable:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE texts ADD COLUMN {column.name} {column_type}"))
+        logger.info(f"Added texts.{column.name}")
+
+def get_allocator():
+    """Return the ID allocator, seeding it from the stored IDs on first use."""
+    if not id_allocator.seeded:
+        with _seed_lock:
+            if not id_allocator.seeded:
+                reseed_allocator()
+    return id_allocator
+
+def reseed_allocator():
+    """Rebuild the ID pool from the table, picking up IDs stored or freed by other processes."""
+    with get_session() as session:
+        id_allocator.seed(session.scalars(select(Text.id)).all())
 
 def generate_unique_id():
-    """Generate a unique 2-character ID using adjacent QWERTY keys."""
-    # QWERTY adjacent pairs (horizontal only, for simplicity)
-    qwerty_rows = [
-        "QWERTYUIOP",
-        "ASDFGHJKL",
-        "ZXCVBNM"
-    ]
-    pairs = []
-    for row in qwerty_rows:
-        for i in range(len(row)-1):
-            pairs.append(row[i:i+2])
-    while True:
-        id_ = random.choice(pairs)
-        if not id_exists(id_):
+    """Reserve a unique ID of adjacent QWERTY keys, preferring the shortest free one."""
+    return get_allocator().allocate()
+
+def _insert_with_new_id(build_row):
+    """Allocate an ID, insert the row `build_row(session, id_)` returns under it and return the ID.
+
+    A collision with an ID stored elsewhere retries with the next free one, up to INSERT_ATTEMPTS times.
+    """
+    allocator = get_allocator()
+    for _ in range(INSERT_ATTEMPTS):
+        id_ = allocator.allocate()
+        try:
+            with get_session() as session:
+                session.add(build_row(session, id_))
+                session.commit()
+            _adjust_row_count(1)
             return id_
+        except IntegrityError:
+            # Stored by someone else since the pool was seeded; keep it marked as used
+            continue
+        except Exception:
+            allocator.release(id_)
+            raise
+    raise ids.IdSpaceExhausted("Could not find a free ID")
+
+def create_text(content, created_at, ip_address):
+    """Allocate an ID, insert the entry under it and return the ID."""
+    return _insert_with_new_id(
+        lambda session, id_: _new_text(session, id_, content, created_at, created_at, ip_address))
+
+def create_file(spool_name, file_name, media_type, file_size, created_at, ip_address):
+    """Record an uploaded file already written to the spool and return its new ID."""
+    return _insert_with_new_id(
+        lambda session, id_: Text(id=id_, spool_name=spool_name, file_name=file_name, media_type=media_type,
+                                  file_size=file_size, created_at=created_at, last_accessed=created_at,
+                                  ip_address=ip_address))
+
+def create_texts(entries):
+    """Allocate IDs for and insert many (content, created_at, ip_address) entries in one transaction.
+
+    Returns one result per entry, in order: its new ID or, if only that entry failed, the exception.
+    When the ID space runs out partway, the entries that got an ID are still stored and only the
+    rest get IdSpaceExhausted, just as if each had been saved on its own.
+    """
+    entries = list(entries)
+    allocator = get_allocator()
+    batch_ids = []
+    leftovers = []
+    for _ in entries:
+        try:
+            batch_ids.append(allocator.allocate())
+        except ids.IdSpaceExhausted as e:
+            # Nothing is released while the batch is allocated, so no later entry can get an ID either
+            leftovers = [e] * (len(entries) - len(batch_ids))
+            break
+    if not batch_ids:
+        return leftovers
+    try:
+        with get_session() as session:
+            session.add_all([
+                _new_text(session, id_, content, created_at, created_at, ip_address)
+                for id_, (content, created_at, ip_address) in zip(batch_ids, entries)
+            ])
+            session.commit()
+    except IntegrityError:
+        # Another process stored one of these IDs; go row by row so only that entry retries
+        results = []
+        for id_, (content, created_at, ip_address) in zip(batch_ids, entries):
+            try:
+                insert_text(id_, content, created_at, created_at, ip_address)
+                results.append(id_)
+            except IntegrityError:
+                try:
+                    results.append(create_text(content, created_at, ip_address))
+                except Exception as e:
+                    results.append(e)
+            except Exception as e:
+                allocator.release(id_)
+                results.append(e)
+        return results + leftovers
+    except Exception:
+        for id_ in batch_ids:
+            allocator.release(id_)
+        raise
+    _adjust_row_count(len(batch_ids))
+    return batch_ids + leftovers
 
 def insert_text(id_, content, created_at, last_accessed, ip_address):
     """Insert a new text entry into the database."""
     with get_session() as session:
-        text = Text(id=id_, content=content, created_at=created_at, last_accessed=last_accessed, ip_address=ip_address)
-        session.add(text)
+        session.add(_new_text(session, id_, content, created_at, last_accessed, ip_address))
+        session.commit()
+    _adjust_row_count(1)
+
+def _new_text(session, id_, content, created_at, last_accessed, ip_address):
+    """Build a row; longer content is stored once in `blobs` and referenced by hash."""
+    fields = {"id": id_, "created_at": created_at, "last_accessed": last_accessed, "ip_address": ip_address}
+    raw = content.encode("utf-8")
+    if len(raw) < DEDUP_MIN_BYTES:
+        return Text(content=content, **fields)
+    return Text(blob_hash=_ref_blob(session, raw, content), **fields)
+
+def _ref_blob(session, raw, content):
+    """Add a reference to the blob holding `content`, creating it if needed; returns its hash."""
+    hash_ = hashlib.sha256(raw).hexdigest()
+    updated = session.execute(update(Blob).where(Blob.hash == hash_).values(refs=Blob.refs + 1),
+                              execution_options={"synchronize_session": False})
+    if updated.rowcount == 0:
+        # First copy: compress it once here rather than on every duplicate
+        body = compression.compress(content)
+        values = {"hash": hash_, "content": None if body is not None else content, "body": body, "refs": 1}
+        # A concurrent first copy may insert the blob after our UPDATE. Counting ourselves in on
+        # conflict keeps its primary key clash from reaching create_text as an ID collision.
+        upsert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(session.get_bind().dialect.name)
+        if upsert is not None:
+            session.execute(upsert(Blob).values(**values)
+                            .on_conflict_do_update(index_elements=[Blob.hash], set_={"refs": Blob.refs + 1}))
+        else:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(Blob).values(**values))
+            except IntegrityError:
+                session.execute(update(Blob).where(Blob.hash == hash_).values(refs=Blob.refs + 1),
+                                execution_options={"synchronize_session": False})
+    return hash_
+
+def _unref_blobs(session, hashes):
+    """Drop one reference per entry in `hashes` and delete blobs nobody references any more."""
+    counts = {}
+    for hash_ in hashes:
+        counts[hash_] = counts.get(hash_, 0) + 1
+    no_sync = {"synchronize_session": False}
+    for hash_, n in counts.items():
+        session.execute(update(Blob).where(Blob.hash == hash_).values(refs=Blob.refs - n), execution_options=no_sync)
+    if counts:
+        session.execute(delete(Blob).where(Blob.hash.in_(counts), Blob.refs <= 0), execution_options=no_sync)
+
+def consume_text(id_, now=None):
+    """Read a text entry in a single transaction.
+
+    Expired entries are treated as missing. A live entry gets its retrieval count
+    bumped and last_accessed set in the same statement, and is deleted on its last
+    allowed read. Returns the content, or None if the ID is unknown or expired.
+    """
+    return consume_texts([id_], now)[0]
+
+def consume_texts(ids_, now=None):
+    """Read many entries, with the same rules as consume_text, in one transaction.
+
+    Returns the contents in the order of `ids_`, with None for IDs that are unknown or
+    expired. An ID listed twice counts as two reads. File uploads are not texts and read as None.
+    """
+    now = now or datetime.now(timezone.utc)
+    with get_session() as session:
+        results = [_consume_text(session, id_, now) for id_ in ids_]
         session.commit()
+    _release_consumed(ids_, results)
+    # Decompress after the transaction so large entries don't hold the write lock
+    return [None if row is None else compression.stored_content(*row) for row, _ in results]
+
+def _consume_text(session, id_, now):
+    """_consume for a text; returns ((content, body), deleted), reading shared content from `blobs`."""
+    row, deleted = _consume(session, id_, now, (Text.content, Text.body, Text.blob_hash), Text.spool_name.is_(None))
+    if row is None:
+        return None, False
+    content, body, blob_hash = row
+    if blob_hash is None:
+        return (content, body), deleted
+    blob = session.execute(select(Blob.content, Blob.body).where(Blob.hash == blob_hash)).first()
+    if deleted:
+        _unref_blobs(session, [blob_hash])
+    return (tuple(blob) if blob is not None else None), deleted
+
+def consume_file(id_, now=None):
+    """Read a file upload with the same rules as consume_text; returns a FileInfo or None."""
+    now = now or datetime.now(timezone.utc)
+    columns = (Text.spool_name, Text.file_name, Text.media_type, Text.file_size)
+    with get_session() as session:
+        row, deleted = _consume(session, id_, now, columns, Text.spool_name.is_not(None))
+        session.commit()
+    _release_consumed([id_], [(row, deleted)])
+    return None if row is None else FileInfo(*row, last_read=deleted)
+
+def _release_consumed(ids_, results):
+    for id_, (_, deleted) in zip(ids_, results):
+        if deleted:
+            id_allocator.release(id_)
+            _adjust_row_count(-1)
+
+def _consume(session, id_, now, columns, *where):
+    """Count one read of `id_` inside the caller's transaction; returns (values of `columns`, deleted)."""
+    expiry_cutoff = now - timedelta(hours=EXPIRATION_HOURS)
+    live = (Text.id == id_, Text.created_at >= expiry_cutoff, *where)
+    bump = {"retrieval_count": Text.retrieval_count + 1, "last_accessed": now}
+    no_sync = {"synchronize_session": False}
+    if session.get_bind().dialect.update_returning:
+        # The UPDATE takes the row (SQLite: database) write lock, so concurrent
+        # readers are serialized and each sees a distinct retrieval count.
+        row = session.execute(
+            update(Text).where(*live).values(**bump).returning(*columns, Text.retrieval_count),
+            execution_options=no_sync,
+        ).first()
+    else:
+        row = session.execute(
+            select(*columns, Text.retrieval_count).where(*live).with_for_update()
+        ).first()
+        if row is not None:
+            session.execute(update(Text).where(Text.id == id_).values(**bump), execution_options=no_sync)
+            row = (*row[:-1], row[-1] + 1)
+    if row is None:
+        return None, False
+    *values, retrieval_count = row
+    deleted = retrieval_count >= MAX_RETRIEVALS
+    if deleted:
+        session.execute(delete(Text).where(Text.id == id_), execution_options=no_sync)
+    return tuple(values), deleted
 
 def get_text_by_id(id_):
     """Retrieve text content by ID and increment retrieval count. Clear DB after 2 retrievals."""
-    with get_session() as session:
-        text = session.query(Text).filter_by(id=id_).first()
-        if text:
-            text.retrieval_count += 1
-            session.commit()
-            content = text.content
-            if text.retrieval_count >= 2:
-                # Delete only this entry from DB
-                session.delete(text)
-                session.commit()
-            return content
-        return None
+    return consume_text(id_)
 
 def update_last_accessed(id_, timestamp):
     """Update the last accessed timestamp for a text entry."""
@@ -113,12 +483,44 @@ def update_last_accessed(id_, timestamp):
             text.last_accessed = timestamp
             session.commit()
 
-def delete_expired_entries():
-    """Delete expired entries based on the expiration cutoff."""
-    with get_session() as session:
-        expiry_cutoff = datetime.now(timezone.utc) - timedelta(hours=EXPIRATION_HOURS)
-        session.query(Text).filter(Text.created_at < expiry_cutoff).delete()
-        session.commit()
+def delete_expired_entries(batch_size=EXPIRY_BATCH_SIZE):
+    """Delete expired entries in batches, each in its own short transaction, and free their IDs.
+
+    Batches walk the created_at index oldest first, so writers are never locked out
+    for the length of a full sweep. Returns the number of deleted entries.
+    """
+    expiry_cutoff = datetime.now(timezone.utc) - timedelta(hours=EXPIRATION_HOURS)
+    expired = Text.created_at < expiry_cutoff
+    columns = (Text.id, Text.spool_name, Text.blob_hash)
+    no_sync = {"synchronize_session": False}
+    total = 0
+    while True:
+        with get_session() as session:
+            returning = session.get_bind().dialect.delete_returning
+            oldest = select(*columns).where(expired).order_by(Text.created_at).limit(batch_size)
+            if not returning:
+                # Lock the batch so a concurrent read can't delete one of its rows before our DELETE
+                oldest = oldest.with_for_update()
+            selected = session.execute(oldest).all()
+            rows = selected
+            if selected:
+                sweep = delete(Text).where(Text.id.in_([id_ for id_, _, _ in selected]), expired)
+                if returning:
+                    # Account only for the rows this DELETE removed: one that a concurrent read
+                    # deleted in between has had its blob, ID and count handled by that read
+                    rows = session.execute(sweep.returning(*columns), execution_options=no_sync).all()
+                else:
+                    session.execute(sweep, execution_options=no_sync)
+                _unref_blobs(session, [blob_hash for _, _, blob_hash in rows if blob_hash is not None])
+                session.commit()
+        for id_, spool_name, _ in rows:
+            id_allocator.release(id_)
+            if spool_name is not None:
+                spool.remove(spool_name)
+        _adjust_row_count(-len(rows))
+        total += len(rows)
+        if len(selected) < batch_size:
+            return total
 
 def id_exists(id_):
     """Check if a text entry with the given ID exists."""
@@ -128,4 +530,45 @@ def id_exists(id_):
 
 def get_db_count():
     with get_session() as session:
-        return session.query(Text).count()
\ No newline at end of file
+        return session.query(Text).count()
+
+
+def dedup_stats():
+    """Summarize deduplication: texts sharing blobs, unique blobs, and bytes stored versus referenced.
+
+    Sizes are as stored, i.e. after compression; plain blobs are measured by SQL length().
+    """
+    size = func.coalesce(func.length(Blob.body), func.length(Blob.content), 0)
+    with get_session() as session:
+        blobs, texts, stored, referenced = session.execute(select(
+            func.count(), func.coalesce(func.sum(Blob.refs), 0),
+            func.coalesce(func.sum(size), 0), func.coalesce(func.sum(size * Blob.refs), 0),
+        )).one()
+    return {
+        "texts": texts,
+        "blobs": blobs,
+        "stored_bytes": stored,
+        "referenced_bytes": referenced,
+        "saved_bytes": referenced - stored,
+        "ratio": referenced / stored if stored else 1.0,
+    }
+
+def refresh_row_count():
+    """Reseed the in-memory row count from the table and return it."""
+    global row_count
+    with _count_lock:
+        row_count = get_db_count()
+        return row_count
+
+def get_row_count():
+    """Return the in-memory row count, seeding it from the table on first use."""
+    if row_count is None:
+        return refresh_row_count()
+    return row_count
+
+def _adjust_row_count(delta):
+    global row_count
+    with _count_lock:
+        # Until seeded there is nothing to adjust; the seed will include this change
+        if row_count is not None:
+            row_count += delta
@@ -0,0 +1,162 @@
+"""
+ids.py
+
+ID allocation for Pasty. IDs are short runs of adjacent QWERTY keys so they are easy to type.
+The pool of free IDs is kept in memory, so allocating one needs no database round trip.
+"""
+
+import os
+import random
+import threading
+
+ID_MAX_LENGTH = int(os.getenv("ID_MAX_LENGTH", 8))  # Longest ID the allocator will grow to
+
+QWERTY_ROWS = [
+    "QWERTYUIOP",
+    "ASDFGHJKL",
+    "ZXCVBNM"
+]
+
+
+class IdSpaceExhausted(RuntimeError):
+    """Raised when every ID up to ID_MAX_LENGTH is in use."""
+
+
+def _neighbours():
+    """Map each key to the keys touching it: left/right, and the two above and below (rows are staggered)."""
+    position = {key: (r, c) for r, row in enumerate(QWERTY_ROWS) for c, key in enumerate(row)}
+    neighbours = {}
+    for key, (r, c) in position.items():
+        candidates = [(r, c - 1), (r, c + 1), (r - 1, c), (r - 1, c + 1), (r + 1, c - 1), (r + 1, c)]
+        neighbours[key] = [
+            QWERTY_ROWS[rr][cc] for rr, cc in candidates
+            if 0 <= rr < len(QWERTY_ROWS) and 0 <= cc < len(QWERTY_ROWS[rr])
+        ]
+    return neighbours
+
+
+NEIGHBOURS = _neighbours()
+
+
+def ids_of_length(length):
+    """Return every ID of the given length.
+
+    Two-character IDs are the original horizontal pairs. Longer IDs are walks over
+    touching keys (no key repeated), which keeps them typeable while the space grows
+    quickly with each extra character.
+    """
+    if length == 2:
+        return [row[i:i + 2] for row in QWERTY_ROWS for i in range(len(row) - 1)]
+    ids = []
+
+    def walk(path):
+        if len(path) == length:
+            ids.append("".join(path))
+            return
+        for key in NEIGHBOURS[path[-1]]:
+            if key not in path:
+                path.append(key)
+                walk(path)
+                path.pop()
+
+    for row in QWERTY_ROWS:
+        for key in row:
+            walk([key])
+    return ids
+
+
+class IdAllocator:
+    """Pool of free IDs, grouped by length, with O(1) allocate and release.
+
+    Shorter IDs are always preferred. A longer tier is only generated once every
+    shorter ID is taken, and allocation fails with IdSpaceExhausted instead of
+    retrying when ID_MAX_LENGTH is exhausted too.
+    """
+
+    def __init__(self, max_length=ID_MAX_LENGTH, rng=None):
+        self.max_length = max_length
+        self.seeded = False
+        self._rng = rng or random.SystemRandom()
+        self._lock = threading.Lock()
+        self._reset(())
+
+    def _reset(self, used_ids):
+        self._used = set(used_ids)
+        self._free = {}   # length -> list of free IDs
+        self._slot = {}   # free ID -> index in its list
+        # Open every tier that already holds IDs so releases land in the right pool
+        top = max((len(id_) for id_ in self._used), default=2)
+        for length in range(2, min(top, self.max_length) + 1):
+            self._open_tier(length)
+
+    def _open_tier(self, length):
+        free = [id_ for id_ in ids_of_length(length) if id_ not in self._used]
+        self._free[length] = free
+        for index, id_ in enumerate(free):
+            self._slot[id_] = index
+
+    def _take(self, length):
+        free = self._free[length]
+        index = self._rng.randrange(len(free))
+        id_ = free[index]
+        last = free.pop()
+        if last != id_:
+            # Move the last entry into the hole so removal stays O(1)
+            free[index] = last
+            self._slot[last] = index
+        del self._slot[id_]
+        return id_
+
+    def _discard_free(self, id_):
+        index = self._slot.pop(id_, None)
+        if index is None:
+            return
+        free = self._free[len(id_)]
+        last = free.pop()
+        if last != id_:
+            free[index] = last
+            self._slot[last] = index
+
+    def seed(self, used_ids):
+        """(Re)build the pool from the IDs currently stored."""
+        with self._lock:
+            self._reset(used_ids)
+            self.seeded = True
+
+    def allocate(self):
+        """Reserve and return a free ID, shortest available first."""
+        with self._lock:
+            for length in sorted(self._free):
+                if self._free[length]:
+                    id_ = self._take(length)
+                    self._used.add(id_)
+                    return id_
+            length = max(self._free) + 1
+            while length <= self.max_length:
+                self._open_tier(length)
+                if self._free[length]:
+                    id_ = self._take(length)
+                    self._used.add(id_)
+                    return id_
+                length += 1
+            raise IdSpaceExhausted(f"All IDs up to {self.max_length} characters are in use")
+
+    def mark_used(self, id_):
+        """Record an ID taken outside this allocator (e.g. by another process)."""
+        with self._lock:
+            self._used.add(id_)
+            self._discard_free(id_)
+
+    def release(self, id_):
+        """Return an ID to the pool once its entry is deleted or expired."""
+        with self._lock:
+            if id_ not in self._used:
+                return
+            self._used.discard(id_)
+            if len(id_) in self._free:
+                self._slot[id_] = len(self._free[len(id_)])
+                self._free[len(id_)].append(id_)
+
+    def __len__(self):
+        """Number of IDs currently in use."""
+        return len(self._used)
@@ -9,20 +9,33 @@ main.py
 Entry point for the Pasty FastAPI application. Handles routing, background tasks, and integrates Socket.IO for real-time updates.
 """
 
-from fastapi import FastAPI, Request, APIRouter, Form, Response, Depends, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, APIRouter, Response, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-import requests
+from contextlib import asynccontextmanager
+from urllib.parse import quote
 import os
 import asyncio
-import time
+import secrets
 import socketio
 import db
+import captcha
+import cluster
+import spool
+import storage
+import presence
+import ratelimit
+import writer
+import assets
+import metrics
+import pages
+import profiling
 import logging
 
 # Load environment variables
@@ -33,8 +46,25 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Socket.IO setup
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins=[])
+# SHARED_STATE_URL (redis://... or memory:// for a single process) turns on multi-worker mode:
+# emits are relayed between workers over pub/sub, and counters and rate limits live in the shared store.
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+# Several workers without sticky sessions can only serve websocket clients: set this to "websocket"
+SOCKETIO_TRANSPORTS = os.getenv("SOCKETIO_TRANSPORTS", "polling,websocket").split(",")
+MAX_CONTENT_BYTES = int(os.getenv("MAX_CONTENT_BYTES", 512 * 1024))  # UTF-8 bytes per text
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins=[],
+    transports=SOCKETIO_TRANSPORTS,
+    # Room for a full-size text after JSON escaping, which can double its size
+    max_http_buffer_size=max(1_000_000, 2 * MAX_CONTENT_BYTES + 64 * 1024),
+    client_manager=cluster.client_manager(SHARED_STATE_URL),
+)
 socket_app = socketio.ASGIApp(sio)
+shared = cluster.shared_state(SHARED_STATE_URL)
+
+# Storage backend (SQL by default; STORE_BACKEND=memory or DATABASE_URL=memory:// for in-process)
+store = storage.create_store()
 
 # FastAPI app and router
 # Keep app root_path empty so backend routes like /static work when the proxy strips prefixes.
@@ -47,8 +77,17 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
+# Provide PUBLIC_ROOT to templates for building absolute asset URLs under a prefix
+PUBLIC_ROOT = os.getenv("PUBLIC_ROOT", ROOT_PATH).rstrip("/")
+if PUBLIC_ROOT and not PUBLIC_ROOT.startswith("/"):
+    PUBLIC_ROOT = "/" + PUBLIC_ROOT
+
+# Static files are hashed and compressed once at startup; templates link them with asset_url()
+static_assets = assets.AssetManifest(STATIC_DIR, f"{PUBLIC_ROOT}/static")
+static_assets.load()
+
 # Mount static directory for JS, CSS, etc.
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/static", assets.HashedStaticFiles(static_assets), name="static")
 
 # Optional: also mount static under an alternate prefix if the proxy doesn't strip
 ALT_STATIC_PREFIX = os.getenv("ALT_STATIC_PREFIX", "").rstrip("/")
@@ -56,21 +95,21 @@ if ALT_STATIC_PREFIX:
     mount_path = f"{ALT_STATIC_PREFIX}/static"
     if not mount_path.startswith("/"):
         mount_path = "/" + mount_path
-    app.mount(mount_path, StaticFiles(directory=STATIC_DIR), name="static_alt")
+    app.mount(mount_path, assets.HashedStaticFiles(static_assets), name="static_alt")
 
 # Jinja2 templates directory
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
-
-# Provide PUBLIC_ROOT to templates for building absolute asset URLs under a prefix
-PUBLIC_ROOT = os.getenv("PUBLIC_ROOT", ROOT_PATH).rstrip("/")
-if PUBLIC_ROOT and not PUBLIC_ROOT.startswith("/"):
-    PUBLIC_ROOT = "/" + PUBLIC_ROOT
-ASSET_VER = os.getenv("ASSET_VER") or str(int(os.environ.get("START_TIME", "0") or __import__("time").time()))
 templates.env.globals.update({
     "PUBLIC_ROOT": PUBLIC_ROOT,
-    "ASSET_VER": ASSET_VER,
+    "asset_url": static_assets.url,
+    "SOCKETIO_TRANSPORTS": ",".join(SOCKETIO_TRANSPORTS),
+    "MAX_CONTENT_BYTES": MAX_CONTENT_BYTES,
 })
 
+# Pages are rendered once at startup and served from memory with ETags; call page_cache.render() again after changing any input
+page_cache = pages.PageCache(templates, {"EXPIRATION_HOURS": db.EXPIRATION_HOURS})
+page_cache.render("index.html", "readme.html")
+
 # Middleware to respect X-Forwarded-Prefix from Caddy and similar proxies
 # Prefix middleware is not required when using app.root_path and a proxy that strips the prefix.
 # Leaving implementation here for reference but not registering it to avoid route mismatches.
@@ -80,74 +119,292 @@ class PrefixMiddleware(BaseHTTPMiddleware):
 
 # ---- Models ----
 
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))  # Texts per batch request
+
 class TextPayload(BaseModel):
     """Pydantic model for text payloads submitted via API."""
     content: str
+    pair_code: Optional[str] = None  # Push the text to the receiver waiting on this code
+
+class SaveResponse(BaseModel):
+    id: str
+    delivered: bool = False  # True when a paired receiver already got the text
+
+class TextResponse(BaseModel):
+    content: str
+
+class CountResponse(BaseModel):
+    count: int
+
+class StatsResponse(BaseModel):
+    connections: int  # This worker
+    cluster_connections: Optional[int] = None  # All workers, in multi-worker mode
+    rooms: Dict[str, int]  # Clients per room kind, e.g. receivers waiting on a pairing code
+    count: int
+
+class BatchSavePayload(BaseModel):
+    contents: List[str] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class BatchSaveResponse(BaseModel):
+    # One entry per submitted text, in order; null where that text could not be stored
+    ids: List[Optional[str]]
+
+class BatchGetPayload(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+    @field_validator("ids")
+    @classmethod
+    def ids_unique(cls, ids):
+        # Each read uses up one of a text's two, so a repeated ID would spend both in one request
+        if len(set(ids)) != len(ids):
+            raise ValueError("IDs must not repeat")
+        return ids
+
+class BatchGetItem(BaseModel):
+    id: str
+    content: Optional[str]
+
+class BatchGetResponse(BaseModel):
+    # null content means the ID is unknown, expired or already read twice
+    texts: List[BatchGetItem]
 
 # ---- Utility Functions ----
 
+def content_too_large(content) -> bool:
+    """The limit is on UTF-8 bytes, so multi-byte text can't slip past a character count."""
+    return len(content) > MAX_CONTENT_BYTES or len(content.encode("utf-8")) > MAX_CONTENT_BYTES
+
+
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", 300))  # Seconds between expiry sweeps
+COUNT_BROADCAST_INTERVAL = float(os.getenv("COUNT_BROADCAST_INTERVAL", 1))  # Seconds between count broadcasts
+
+
+async def delete_expired_entries_background():
+    """Background task to delete expired text entries from the database.
+
+    Reads already treat expired rows as missing, so the sweep only reclaims space and IDs.
+    """
+    while True:
+        try:
+            deleted = await store.expire()
+            if deleted:
+                logger.info(f"Deleted {deleted} expired entries")
+            if shared is not None:
+                await reconcile_shared_state()
+        except Exception as e:
+            logger.error(f"Failed to delete expired entries: {e}")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+
+
+_last_broadcast_count = None
+
+# Multi-worker mode only
+_cluster_rows = None  # Last cluster-wide row count read from the shared store
+_pushed_rows = None  # Local row count already added to the shared counter
+cluster_connections = 0  # Connections across all live workers
 
-def delete_expired_entries_background():
-    """Background task to delete expired text entries from the database."""
-    db.delete_expired_entries()
+
+def current_row_count():
+    """Row count shown to clients: cluster-wide in multi-worker mode, this process's otherwise."""
+    if shared is not None and _cluster_rows is not None:
+        return _cluster_rows
+    return store.count()
+
+
+async def sync_shared_state():
+    """Push this worker's row count change and connection count, then pull the cluster totals."""
+    global _cluster_rows, _pushed_rows, cluster_connections
+    local = store.count()
+    if _pushed_rows is None:
+        # The first worker up seeds the shared counter; later ones just join it
+        await shared.set_rows(local, only_if_missing=True)
+        _pushed_rows = local
+    delta = local - _pushed_rows
+    _pushed_rows = local
+    _cluster_rows = await shared.add_rows(delta) if delta else await shared.rows()
+    await shared.publish_connections(clients.count())
+    cluster_connections = await shared.connections()
+
+
+async def reconcile_shared_state():
+    """Reset the shared row count from storage and pick up IDs other workers stored or freed."""
+    global _pushed_rows
+    count = await store.refresh()
+    _pushed_rows = count
+    await shared.set_rows(count)
 
 
 async def update_row_count():
-    """Emit the current row count to all connected Socket.IO clients."""
+    """Emit the current row count to all connected Socket.IO clients, if it changed since the last broadcast."""
+    global _last_broadcast_count
     try:
-        row_count = db.get_db_count()
+        if shared is not None:
+            await sync_shared_state()
+        row_count = current_row_count()
+        if row_count == _last_broadcast_count:
+            return
+        _last_broadcast_count = row_count
         logger.info(f"Broadcasting new row count: {row_count}")
-        await sio.emit('count_update', {'count': row_count})
+        # Every worker runs this ticker, so in multi-worker mode each one only notifies its own clients
+        await sio.emit('count_update', {'count': row_count}, ignore_queue=shared is not None)
     except Exception as e:
         logger.error(f"Failed to update row count: {e}")
 
-# ---- Simple Rate Limiter (30 per minute) ----
-RATE_LIMIT_PER_MINUTE = 30
-_rate_buckets = {}
-_rate_lock = asyncio.Lock()
 
-def _client_ip(request: Request) -> str:
-    # Prefer Cloudflare and proxy headers; fallback to client host
-    ip = request.headers.get('cf-connecting-ip')
+async def broadcast_row_count_background():
+    """Background task that coalesces row count changes into at most one broadcast per interval."""
+    while True:
+        await asyncio.sleep(COUNT_BROADCAST_INTERVAL)
+        await update_row_count()
+
+async def reconcile_presence_background():
+    """Periodically rebuild the connection counts from the Socket.IO manager to correct drift."""
+    while True:
+        await asyncio.sleep(PRESENCE_RECONCILE_INTERVAL)
+        try:
+            clients.reconcile((sid for sid, _ in sio.manager.get_participants('/', None)),
+                              {'pairing': list(_sid_pairs)})
+        except Exception as e:
+            logger.error(f"Failed to reconcile presence: {e}")
+
+# Group-commit pipeline for saves; entries are (content, created_at, ip_address)
+write_queue = writer.WriteQueue(lambda entries: store.insert_many(entries))
+
+# ---- Rate Limiting ----
+# Per route/event limits as "name=hits/seconds"; names without an entry are not limited
+RATE_LIMITS = ratelimit.parse_limits(os.getenv("RATE_LIMITS", "ping=30/60,save_text=20/60,retrieve_text=30/60,batch=10/60,upload=5/60"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))  # Tracked clients per limiter
+rate_limiters = {
+    name: ratelimit.RateLimiter(limit, window, max_keys=RATE_LIMIT_MAX_CLIENTS)
+    for name, (limit, window) in RATE_LIMITS.items()
+}
+_sid_ips = {}  # Socket.IO sid -> client IP, recorded on connect
+
+# Connection counts maintained on connect/disconnect, so ping and /api/stats read them in O(1)
+clients = presence.Presence()
+PRESENCE_RECONCILE_INTERVAL = int(os.getenv("PRESENCE_RECONCILE_INTERVAL", 60))  # Seconds between drift checks
+
+def _forwarded_ip(header) -> str:
+    # Prefer Cloudflare and proxy headers; `header` looks up a lower-case header name
+    ip = header('cf-connecting-ip')
     if not ip:
-        xff = request.headers.get('x-forwarded-for')
+        xff = header('x-forwarded-for')
         if xff:
             ip = xff.split(',')[0].strip()
     if not ip:
-        ip = request.headers.get('x-real-ip')
+        ip = header('x-real-ip')
+    return ip
+
+def _client_ip(request: Request) -> str:
+    ip = _forwarded_ip(request.headers.get)
     if not ip and request.client:
         ip = request.client.host
     return ip or 'unknown'
 
-async def rate_limit_ping(request: Request):
-    now = int(time.time())
-    window = now // 60  # per-minute fixed window
-    ip = _client_ip(request)
-    key = (ip, window)
-    async with _rate_lock:
-        # Cleanup old windows for this IP
-        # (optional light cleanup across all keys)
-        for (k_ip, k_win) in list(_rate_buckets.keys()):
-            if k_win < window - 1:
-                _rate_buckets.pop((k_ip, k_win), None)
-
-        count = _rate_buckets.get(key, 0) + 1
-        _rate_buckets[key] = count
-        if count > RATE_LIMIT_PER_MINUTE:
-            # Too Many Requests
-            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+def _environ_ip(environ) -> str:
+    ip = _forwarded_ip(lambda name: environ.get('HTTP_' + name.upper().replace('-', '_')))
+    return ip or environ.get('REMOTE_ADDR') or 'unknown'
+
+async def is_rate_limited(name, key, cost=1) -> bool:
+    """Count `cost` hits for `key` against the `name` limit and report whether they are over."""
+    limiter = rate_limiters.get(name)
+    if limiter is None:
+        return False
+    if shared is not None:
+        return not await shared.hit(name, key, limiter.limit, limiter.window, cost=cost)
+    return not limiter.hit(key, cost=cost)
+
+async def check_rate_limit(name, key, cost=1):
+    if await is_rate_limited(name, key, cost):
+        # Too Many Requests
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+def rate_limit(name):
+    """FastAPI dependency that rejects requests over the `name` limit with 429."""
+    async def dependency(request: Request):
+        await check_rate_limit(name, _client_ip(request))
+    return dependency
+
+rate_limit_ping = rate_limit("ping")
+rate_limit_save = rate_limit("save_text")
+rate_limit_retrieve = rate_limit("retrieve_text")
+rate_limit_batch = rate_limit("batch")
+rate_limit_upload = rate_limit("upload")
+
+# ---- Pairing ----
+# A receiver waits in the room for a server-issued pairing code; a save naming that code is pushed to
+# the room at once. Waiting costs a room membership and nothing else: no polling, no timers.
+PAIR_CODE_LENGTH = 6
+PAIR_CODE_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'  # No 0/O or 1/I to mistype
+PAIR_TTL = int(os.getenv("PAIR_TTL", 3600))  # Multi-worker mode only: seconds a pairing code stays valid
+_sid_pairs = {}  # Receiver sid -> its pairing code
+
+def _pair_room(code):
+    return f"pair:{code}"
+
+async def has_receiver(code) -> bool:
+    if shared is not None:
+        # Room members on other workers are invisible here, so the code is registered in the shared store
+        return await shared.has_pairing(code)
+    return any(True for _ in sio.manager.get_participants('/', _pair_room(code)))
+
+async def deliver_to_pair(code, id_, content) -> bool:
+    """Push a just-saved text to the receiver paired on `code`; returns whether it was delivered."""
+    code = (code or '').strip().upper()
+    if not code or not await has_receiver(code):
+        return False
+    # The push is the receiver's read, so it counts against the retrieval limit once
+    if await store.consume(id_) is None:
+        return False
+    await sio.emit('paste_delivered', {'id': id_, 'content': content}, room=_pair_room(code))
+    return True
+
+async def unpair(sid):
+    code = _sid_pairs.pop(sid, None)
+    if code is None:
+        return
+    await sio.leave_room(sid, _pair_room(code))
+    clients.leave(sid, 'pairing')
+    if shared is not None:
+        await shared.remove_pairing(code)
 
 # ---- Socket.IO Events ----
 
 @sio.event
 async def connect(sid, environ):
     logger.info(f"Client connected: {sid}")
-    # Send current count immediately on connect
-    await update_row_count()
+    _sid_ips[sid] = _environ_ip(environ)
+    clients.connect(sid)
+    # Send current count to the new client only; everyone else is kept up to date by the ticker
+    await sio.emit('count_update', {'count': current_row_count()}, room=sid)
 
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    await unpair(sid)
+    _sid_ips.pop(sid, None)
+    clients.disconnect(sid)
+
+@sio.event
+async def pair_listen(sid, data=None):
+    """Issue a pairing code to this client and wait for a paste saved with it."""
+    if await is_rate_limited('retrieve_text', _sid_ips.get(sid, sid)):
+        await sio.emit('pair_error', {'error': 'Too many requests. Please slow down.'}, room=sid)
+        return
+    await unpair(sid)
+    code = ''.join(secrets.choice(PAIR_CODE_CHARS) for _ in range(PAIR_CODE_LENGTH))
+    while await has_receiver(code):
+        code = ''.join(secrets.choice(PAIR_CODE_CHARS) for _ in range(PAIR_CODE_LENGTH))
+    _sid_pairs[sid] = code
+    await sio.enter_room(sid, _pair_room(code))
+    clients.join(sid, 'pairing')
+    if shared is not None:
+        await shared.add_pairing(code, PAIR_TTL)
+    await sio.emit('pair_code', {'code': code}, room=sid)
+
+@sio.event
+async def pair_cancel(sid, data=None):
+    await unpair(sid)
 
 # @sio.event
 # async def ping(sid):
@@ -158,30 +415,36 @@ async def disconnect(sid):
 
 @sio.event
 async def ping(sid):
-    # Get all connected clients and count them
-    participants = list(sio.manager.get_participants('/', None))
+    if shared is not None:
+        # Cluster-wide count, refreshed by the row count ticker
+        active_connections = cluster_connections
+    else:
+        active_connections = clients.count()
     await sio.emit('pong', {
         'server_time': datetime.now(timezone.utc).isoformat(),
-        'active_connections': len(participants)
+        'active_connections': active_connections
     }, room=sid)
 
 @sio.event
 async def save_text(sid, data):
     try:
-        if len(data['content']) > 2000:
+        if await is_rate_limited('save_text', _sid_ips.get(sid, sid)):
+            await sio.emit('save_error', {'error': 'Too many requests. Please slow down.'}, room=sid)
+            return
+        if content_too_large(data['content']):
             await sio.emit('save_error', {'error': 'Text exceeds allowed length.'}, room=sid)
             return
         
         now = datetime.now(timezone.utc)
-        id_ = db.generate_unique_id()
-        ip_address = 'socket.io'  # Can't get IP directly from Socket.IO
+        ip_address = _sid_ips.get(sid, 'socket.io')
         
-        db.insert_text(id_, data['content'], now, now, ip_address)
-        await update_row_count()
+        id_ = await write_queue.submit((data['content'], now, ip_address))
+        delivered = await deliver_to_pair(data.get('pair_code'), id_, data['content'])
         
         await sio.emit('save_success', {
             'id': id_,
-            'content': data['content']
+            'content': data['content'],
+            'delivered': delivered
         }, room=sid)
     except Exception as e:
         logger.error(f"Error saving text: {e}")
@@ -190,6 +453,9 @@ async def save_text(sid, data):
 @sio.event
 async def retrieve_text(sid, data):
     try:
+        if await is_rate_limited('retrieve_text', _sid_ips.get(sid, sid)):
+            await sio.emit('retrieve_error', {'error': 'Too many requests. Please slow down.'}, room=sid)
+            return
         # CAPTCHA check
         captcha_input = data.get('captcha_input', '').strip().upper()
         captcha_code = data.get('captcha_code', '').strip().upper()
@@ -198,10 +464,8 @@ async def retrieve_text(sid, data):
             return
 
         text_id = data.get('lookup_id', '')
-        db.delete_expired_entries()
-        row = db.get_text_by_id(str(text_id))
-        if row:
-            db.update_last_accessed(text_id, datetime.now(timezone.utc))
+        row = await store.consume(str(text_id))
+        if row is not None:
             await sio.emit('retrieve_success', {
                 'id': text_id,
                 'content': str(row)
@@ -216,15 +480,41 @@ async def retrieve_text(sid, data):
 
 # ---- Startup Events ----
 
-@app.on_event("startup")
-def startup_event():
+async def startup_event():
     try:
-        db.initialize_db()
-        logger.info("Database initialized successfully.")
+        await store.initialize()
+        removed = spool.remove_partials()
+        if removed:
+            logger.info(f"Removed {removed} partial uploads from the spool")
+        logger.info(f"Storage initialized successfully ({type(store).__name__}).")
+        if shared is not None and isinstance(store, storage.MemoryStore):
+            logger.warning("The memory store is per process: workers will not see each other's entries.")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
 
 
+@asynccontextmanager
+async def lifespan(app):
+    await startup_event()
+    write_queue.start()
+    tasks = [
+        asyncio.create_task(delete_expired_entries_background()),
+        asyncio.create_task(broadcast_row_count_background()),
+        asyncio.create_task(reconcile_presence_background()),
+    ]
+    if metrics.METRICS_ENABLED:
+        tasks.append(asyncio.create_task(metrics.monitor_loop_lag()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await write_queue.stop()
+        await hcaptcha.aclose()
+
+app.router.lifespan_context = lifespan
+
+
 # ---- HTML Page Routes ----
 
 @app.get("/ping")
@@ -233,49 +523,187 @@ async def ping_route(_: None = Depends(rate_limit_ping)):
     return {"status": "ok"}
 
 @app.head("/")
-def head_root():
-    return Response(status_code=200)
+async def head_root(request: Request):
+    # Same headers as GET from the cached page; the server drops the body
+    return page_cache.response(request, "index.html")
 
 @app.get("/", response_class=HTMLResponse)
-def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "EXPIRATION_HOURS": db.EXPIRATION_HOURS
-    })
+async def read_root(request: Request):
+    return page_cache.response(request, "index.html")
 
 @app.get("/readme", response_class=HTMLResponse)
-def readme(request: Request):
-    return templates.TemplateResponse("readme.html", {"request": request})
+async def readme(request: Request):
+    return page_cache.response(request, "readme.html")
 
 # ---- hCaptcha Verification Helper ----
-def verify_hcaptcha(token, remoteip=None):
+hcaptcha = captcha.HCaptchaVerifier()
+
+async def verify_hcaptcha(token, remoteip=None):
     """Verify hCaptcha response token with hCaptcha API."""
-    import os
-    secret = os.getenv("HCAPTCHA_SECRET", "")
-    url = "https://hcaptcha.com/siteverify"
-    data = {
-        "secret": secret,
-        "response": token
-    }
-    if remoteip:
-        data["remoteip"] = remoteip
+    return await hcaptcha.verify(token, remoteip)
+
+# ---- JSON API ----
+# Same storage path and limits as the Socket.IO events, for scripts and CLI clients.
+
+def check_content_length(content):
+    if content_too_large(content):
+        raise HTTPException(status_code=413, detail="Text exceeds allowed length.")
+
+@app.post("/save")
+async def save_text_api(payload: TextPayload, request: Request, _: None = Depends(rate_limit_save)) -> SaveResponse:
+    check_content_length(payload.content)
+    id_ = await write_queue.submit((payload.content, datetime.now(timezone.utc), _client_ip(request)))
+    return SaveResponse(id=id_, delivered=await deliver_to_pair(payload.pair_code, id_, payload.content))
+
+@app.get("/get/{text_id}")
+async def get_text_api(text_id: str, _: None = Depends(rate_limit_retrieve)) -> TextResponse:
+    content = await store.consume(text_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="ID not found")
+    return TextResponse(content=content)
+
+@app.get("/api/count")
+async def count_api() -> CountResponse:
+    return CountResponse(count=current_row_count())
+
+@app.get("/api/stats")
+async def stats_api() -> StatsResponse:
+    return StatsResponse(
+        connections=clients.count(),
+        cluster_connections=cluster_connections if shared is not None else None,
+        rooms=clients.rooms(),
+        count=current_row_count(),
+    )
+
+@app.post("/batch/save")
+async def batch_save_api(payload: BatchSavePayload, request: Request, _: None = Depends(rate_limit_batch)) -> BatchSaveResponse:
+    for content in payload.contents:
+        check_content_length(content)
+    now = datetime.now(timezone.utc)
+    ip_address = _client_ip(request)
+    # Every text counts against save_text, so batching doesn't multiply what one client may store
+    await check_rate_limit('save_text', ip_address, cost=len(payload.contents))
+    # Already a batch, so it goes straight to storage as one transaction instead of through the write queue
+    results = await store.insert_many([(content, now, ip_address) for content in payload.contents])
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error saving text in batch: {result}")
+    return BatchSaveResponse(ids=[None if isinstance(r, Exception) else r for r in results])
+
+@app.post("/batch/get")
+async def batch_get_api(payload: BatchGetPayload, request: Request, _: None = Depends(rate_limit_batch)) -> BatchGetResponse:
+    # Every ID counts against retrieve_text, the same as reading it on its own
+    await check_rate_limit('retrieve_text', _client_ip(request), cost=len(payload.ids))
+    contents = await store.consume_many(payload.ids)
+    return BatchGetResponse(texts=[BatchGetItem(id=id_, content=c) for id_, c in zip(payload.ids, contents)])
+
+# ---- File transfer ----
+# Bodies stream straight to the spool directory and back, so memory use doesn't depend on file size.
+
+@app.post("/files")
+async def upload_file(request: Request, name: str = "", _: None = Depends(rate_limit_upload)) -> SaveResponse:
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > spool.MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="File exceeds allowed size.")
     try:
-        resp = requests.post(url, data=data, timeout=5)
-        result = resp.json()
-        return result.get("success", False)
-    except Exception as e:
-        logger.error(f"hCaptcha verification error: {e}")
-        return False
-
-# ---- Save Text Endpoint (with hCaptcha) ----
-@app.post("/save", response_class=HTMLResponse)
-async def save_text_form(request: Request, content: str = Form(...), captcha_input: str = Form(...), captcha_code: str = Form(...)):
-    # Simple CAPTCHA verification
-    if captcha_input.strip().upper() != captcha_code.strip().upper():
-        return templates.TemplateResponse("index.html", {"request": request, "error": "CAPTCHA verification failed. Please try again."})
-    # ...existing save logic (call your db.insert_text etc.)...
-    # For demo, just return success
-    return templates.TemplateResponse("index.html", {"request": request, "success": True})
+        spool_name, size = await spool.receive(request.stream())
+    except spool.FileTooLarge:
+        raise HTTPException(status_code=413, detail="File exceeds allowed size.")
+    except spool.SpoolFull:
+        # Insufficient Storage
+        raise HTTPException(status_code=507, detail="File storage is full. Please try again later.")
+    file_name = os.path.basename(name)[:255] or "download"
+    media_type = request.headers.get("content-type") or "application/octet-stream"
+    try:
+        id_ = await store.insert_file(spool_name, file_name, media_type, size,
+                                      datetime.now(timezone.utc), _client_ip(request))
+    except Exception:
+        spool.remove(spool_name)
+        raise
+    return SaveResponse(id=id_)
+
+@app.get("/files/{file_id}")
+async def download_file(file_id: str, _: None = Depends(rate_limit_retrieve)):
+    info = await store.consume_file(file_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="ID not found")
+    # Open the body before responding: a concurrent last read may remove the name while we stream,
+    # but not the open file
+    try:
+        f, size = await asyncio.to_thread(spool.open_file, info.spool_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="ID not found")
+    # On the last read the row is already gone; drop the name once the body has been sent
+    background = BackgroundTask(spool.remove, info.spool_name) if info.last_read else None
+    file_name = quote(info.file_name)
+    disposition = (f'attachment; filename="{file_name}"' if file_name == info.file_name
+                   else f"attachment; filename*=utf-8''{file_name}")
+    return StreamingResponse(spool.stream(f), media_type=info.media_type, background=background,
+                             headers={"Content-Length": str(size), "Content-Disposition": disposition,
+                                      "X-Content-Type-Options": "nosniff"})
+
+
+# ---- Metrics ----
+# Installed only when enabled, after every handler and route exists; disabled, nothing is wrapped
+
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(db.engine)
+    metrics.instrument_socketio(sio)
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.registry.gauge("pasty_active_connections", "Socket.IO clients connected to this worker.",
+                           lambda: clients.count())
+    metrics.registry.gauge("pasty_table_rows", "Entries currently stored.", lambda: current_row_count())
+    metrics.registry.gauge("pasty_rate_limiter_keys", "Clients tracked by each local rate limiter.",
+                           lambda: {name: len(limiter) for name, limiter in rate_limiters.items()}, "limiter")
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_route():
+        return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# ---- Profiling ----
+# Opt-in: the admin routes need PROFILING_TOKEN; per-call cProfile and slow-step logging have their own switches
+
+sampler = profiling.SamplingProfiler()
+call_profiler = profiling.CallProfiler()
+
+if profiling.PROFILING_SLOW_CALLBACK_MS > 0:
+    profiling.install_slow_callback_monitor()
+
+if profiling.PROFILING_CPROFILE_EVERY > 0:
+    call_profiler.instrument_socketio(sio)
+    app.add_middleware(profiling.ProfileMiddleware, profiler=call_profiler)
+    if not profiling.PROFILING_TOKEN:
+        logger.warning("PROFILING_CPROFILE_EVERY is set but PROFILING_TOKEN is not: the stats cannot be downloaded.")
+
+def require_admin(request: Request):
+    """FastAPI dependency accepting only `Authorization: Bearer <PROFILING_TOKEN>`."""
+    supplied = request.headers.get("authorization", "").encode()
+    if not secrets.compare_digest(supplied, f"Bearer {profiling.PROFILING_TOKEN}".encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+def _attachment(name):
+    return {"Content-Disposition": f'attachment; filename="pasty-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{name}"'}
+
+if profiling.PROFILING_TOKEN:
+    @app.get("/admin/profile", include_in_schema=False)
+    async def profile_route(seconds: float = Query(10, gt=0), _: None = Depends(require_admin)):
+        """Sample every thread for `seconds` and return folded stacks for a flame graph."""
+        try:
+            folded = await asyncio.to_thread(sampler.capture, seconds)
+        except profiling.ProfilerBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return Response(folded, media_type="text/plain", headers=_attachment("folded"))
+
+    @app.get("/admin/cprofile", include_in_schema=False)
+    async def cprofile_route(reset: bool = False, _: None = Depends(require_admin)):
+        """Download the cProfile stats gathered from every PROFILING_CPROFILE_EVERY-th call."""
+        data = call_profiler.dump()
+        if data is None:
+            raise HTTPException(status_code=404, detail="No calls profiled yet")
+        if reset:
+            call_profiler.reset()
+        return Response(data, media_type="application/octet-stream", headers=_attachment("prof"))
 
 
 # Mount Socket.IO app
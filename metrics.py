@@ -0,0 +1,233 @@
+"""
+metrics.py
+
+Prometheus metrics for Pasty: latency histograms for Socket.IO events, HTTP routes and SQL statements,
+plus gauges read at scrape time. Everything is installed explicitly (instrument_socketio,
+instrument_engine, MetricsMiddleware, monitor_loop_lag), so with METRICS_ENABLED off nothing is wrapped
+and the hot paths run exactly as before. Rendering follows the Prometheus text exposition format.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")  # Serve /metrics and instrument the app
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 1))  # Seconds between event-loop lag probes
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """A histogram family: one set of bucket counters per combination of label values.
+
+    observe() may be called from the DB executor threads as well as the event loop, so updates
+    take a lock; it is uncontended almost always and costs far less than what is being timed.
+    """
+
+    def __init__(self, name, help_, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            # Buckets are inclusive upper bounds, so a value equal to a bound lands in that bucket
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is read when scraped; `read` returns a number, or {label value: number}."""
+
+    def __init__(self, name, help_, read, labelname=None):
+        self.name = name
+        self.help = help_
+        self.read = read
+        self.labelname = labelname
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.error(f"Failed to read gauge {self.name}: {e}")
+            return lines
+        if self.labelname is None:
+            lines.append(f"{self.name} {_number(value)}")
+        else:
+            for label, v in sorted(value.items()):
+                lines.append(f"{self.name}{_labels((self.labelname,), (label,))} {_number(v)}")
+        return lines
+
+
+class Registry:
+    """The metrics served by one process, rendered in registration order."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help_, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_, labelnames, buckets))
+
+    def gauge(self, name, help_, read, labelname=None):
+        return self._register(Gauge(name, help_, read, labelname))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+socketio_seconds = registry.histogram("pasty_socketio_event_seconds", "Time spent handling a Socket.IO event.", ("event",))
+http_seconds = registry.histogram("pasty_http_request_seconds", "Time to serve an HTTP request, by route template.",
+                                  ("method", "route"))
+db_seconds = registry.histogram("pasty_db_query_seconds", "Time spent executing a SQL statement, by statement kind.",
+                                ("operation",))
+loop_lag = 0.0  # Latest measured event-loop lag in seconds
+registry.gauge("pasty_event_loop_lag_seconds", "How late the event loop ran a timer at the last probe.", lambda: loop_lag)
+
+
+def instrument_socketio(sio, histogram=socketio_seconds, namespace="/"):
+    """Wrap every handler registered on `namespace` so its run time is observed under the event's name.
+
+    Call after all handlers are registered. Each wrapper passes on only as many arguments as the
+    handler accepts, so python-socketio's retries for older handler signatures are never timed twice.
+    """
+    handlers = sio.handlers.get(namespace, {})
+    for event, handler in list(handlers.items()):
+        if inspect.iscoroutinefunction(handler):
+            handlers[event] = _timed_handler(event, handler, histogram)
+
+
+def adapt_handler(handler):
+    """Return `handler` as a coroutine function taking the server's full argument list, dropping extras it doesn't accept."""
+    parameters = inspect.signature(handler).parameters.values()
+    if any(p.kind is p.VAR_POSITIONAL for p in parameters):
+        return handler
+    arity = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in parameters)
+
+    async def call(*args):
+        return await handler(*args[:arity])
+    return call
+
+
+def _timed_handler(event, handler, histogram):
+    call = adapt_handler(handler)
+
+    @functools.wraps(handler)
+    async def timed(*args):
+        start = time.perf_counter()
+        try:
+            return await call(*args)
+        finally:
+            histogram.observe(time.perf_counter() - start, event)
+    return timed
+
+
+def instrument_engine(engine, histogram=db_seconds):
+    """Observe every statement the SQLAlchemy engine runs, labelled by its first keyword (SELECT, INSERT, ...)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_start")
+        if starts:
+            histogram.observe(time.perf_counter() - starts.pop(), _operation(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def failed(context):
+        # after_cursor_execute does not fire for a failed statement; drop its start time
+        starts = context.connection.info.get("metrics_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def _operation(statement):
+    words = statement.lstrip()[:16].split(None, 1)
+    return words[0].upper() if words else "OTHER"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests by route template, so /get/{text_id} is one series, not one per ID."""
+
+    def __init__(self, app, histogram=http_seconds):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # The router records the matched route on the scope on its way down
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(time.perf_counter() - start, scope["method"], path)
+
+
+async def monitor_loop_lag(interval=METRICS_LOOP_LAG_INTERVAL):
+    """Sleep `interval` over and over and record how much later than asked the loop woke us up."""
+    global loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag = max(0.0, loop.time() - start - interval)
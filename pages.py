@@ -0,0 +1,138 @@
+"""
+pages.py
+
+Pre-rendered HTML pages. Everything the page templates use is fixed for the life of the process
+(EXPIRATION_HOURS, PUBLIC_ROOT, asset URLs, limits), so each page is rendered once, compressed once
+with gzip and brotli, and then served from memory with a strong ETag. A conditional GET whose
+If-None-Match matches gets a 304 and no body.
+
+Pages are rendered without a request: templates link with root-relative URLs under PUBLIC_ROOT
+rather than url_for, so nothing the client sends (such as the Host header) changes what is stored.
+"""
+
+import gzip
+import hashlib
+import threading
+
+from starlette.responses import Response
+
+GZIP_LEVEL = 9  # Compressed once per page, so the slowest level costs nothing per request
+BROTLI_QUALITY = 11
+
+
+def compress(body):
+    """{content-coding: bytes} for `body`: identity and gzip, plus br when the brotli package is installed."""
+    variants = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # A compressed variant that isn't smaller is not worth sending
+    return {coding: data for coding, data in variants.items() if coding == "identity" or len(data) < len(body)}
+
+
+def choose_encoding(accept_encoding, available):
+    """The content-coding to send, given the Accept-Encoding header and the codings on hand.
+
+    Prefers br over gzip and honours q=0. Identity is the fallback, as RFC 9110 allows even when
+    the client did not list it.
+    """
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    for coding in ("br", "gzip"):
+        if coding in available and accepted.get(coding, accepted.get("*", 0)) > 0:
+            return coding
+    return "identity"
+
+
+def etag_matches(if_none_match, etags):
+    """Whether an If-None-Match header matches any of `etags` (weak comparison, as RFC 9110 asks for)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return not candidates.isdisjoint(etags)
+
+
+class CachedBody:
+    """One representation set: the body in each content-coding, each with its own strong ETag."""
+
+    def __init__(self, body, media_type, cache_control):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.variants = compress(body)
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # Strong ETags must differ between encodings, since the bytes differ
+        self.etags = {coding: f'"{digest}"' if coding == "identity" else f'"{digest}-{coding}"'
+                      for coding in self.variants}
+
+    def response(self, request, extra_headers=None):
+        coding = choose_encoding(request.headers.get("accept-encoding"), self.variants)
+        headers = {"ETag": self.etags[coding], "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if extra_headers:
+            headers.update(extra_headers)
+        if etag_matches(request.headers.get("if-none-match"), self.etags.values()):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(self.variants[coding], headers=headers, media_type=self.media_type)
+
+
+class PageCache:
+    """Renders each template once and serves the stored bytes afterwards.
+
+    HTML is sent with Cache-Control: no-cache, so browsers revalidate it (cheaply, via the ETag) and
+    pick up new asset URLs after a deploy.
+    """
+
+    def __init__(self, templates, context=None):
+        self.templates = templates
+        self.context = dict(context or {})
+        self.renders = 0
+        self._pages = {}  # template name -> CachedBody
+        self._lock = threading.Lock()
+
+    def _build(self, name):
+        body = self.templates.get_template(name).render(self.context).encode()
+        self.renders += 1
+        return CachedBody(body, "text/html; charset=utf-8", "no-cache")
+
+    def render(self, *names):
+        """Render `names` now (at startup, or again after their inputs changed), replacing any stored copy."""
+        for name in names:
+            with self._lock:
+                self._pages[name] = self._build(name)
+
+    def get(self, name):
+        page = self._pages.get(name)
+        if page is None:
+            # A page that was not rendered at startup is rendered on its first request
+            with self._lock:
+                page = self._pages.get(name)
+                if page is None:
+                    page = self._pages[name] = self._build(name)
+        return page
+
+    def response(self, request, name):
+        return self.get(name).response(request)
+
+    def clear(self):
+        """Drop every rendered page, so each renders again on its next request."""
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,70 @@
+"""
+presence.py
+
+Connection counts for Pasty, kept up to date on connect/disconnect so reading them is O(1). Besides the
+total, clients can be counted per room kind (e.g. receivers waiting on a pairing code). reconcile()
+rebuilds the counts from the Socket.IO manager's own bookkeeping to correct any drift.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Presence:
+    """Connected sids and the room kinds each one is in, with running counts."""
+
+    def __init__(self):
+        self._sids = {}  # sid -> set of room kinds
+        self._rooms = {}  # room kind -> number of sids in it
+
+    def connect(self, sid):
+        self._sids.setdefault(sid, set())
+
+    def disconnect(self, sid):
+        for room in self._sids.pop(sid, ()):
+            self._decrement(room)
+
+    def join(self, sid, room):
+        rooms = self._sids.get(sid)
+        if rooms is None or room in rooms:
+            return
+        rooms.add(room)
+        self._rooms[room] = self._rooms.get(room, 0) + 1
+
+    def leave(self, sid, room):
+        rooms = self._sids.get(sid)
+        if rooms is None or room not in rooms:
+            return
+        rooms.discard(room)
+        self._decrement(room)
+
+    def _decrement(self, room):
+        remaining = self._rooms[room] - 1
+        if remaining:
+            self._rooms[room] = remaining
+        else:
+            del self._rooms[room]
+
+    def count(self, room=None) -> int:
+        """Connected clients, or clients in the given room kind."""
+        return len(self._sids) if room is None else self._rooms.get(room, 0)
+
+    def rooms(self) -> dict:
+        return dict(self._rooms)
+
+    def reconcile(self, sids, rooms=None) -> int:
+        """Reset to the connected `sids` and, per room kind, the sids in `rooms`; returns the drift corrected.
+
+        The drift is the number of sids added or dropped; room membership is rebuilt as given.
+        """
+        actual = set(sids)
+        drift = len(actual.symmetric_difference(self._sids))
+        self._sids = {sid: set() for sid in actual}
+        self._rooms = {}
+        for room, members in (rooms or {}).items():
+            for sid in members:
+                self.join(sid, room)
+        if drift:
+            logger.warning(f"Presence drifted by {drift} connections; reset to {len(actual)}")
+        return drift
@@ -0,0 +1,234 @@
+"""
+profiling.py
+
+On-demand profiling for a live Pasty process, all opt-in:
+
+- SamplingProfiler records the Python stacks of every thread for a few seconds and returns them in
+  the folded format read by flamegraph.pl, speedscope and inferno. Nothing runs between captures.
+- CallProfiler runs cProfile around every Nth Socket.IO event or HTTP request and accumulates the
+  stats, downloadable as a .prof file (snakeviz, or flameprof for a flame graph).
+- install_slow_callback_monitor() logs every event-loop step over a threshold, naming the coroutines
+  it resumed, which is what asyncio's debug mode reports without the cost of running in debug mode.
+"""
+
+import asyncio
+import cProfile
+import functools
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")  # Bearer token for the /admin/profile routes; unset disables them
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", 60))  # Longest sampling capture allowed
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 5))  # Time between stack samples
+PROFILING_CPROFILE_EVERY = int(os.getenv("PROFILING_CPROFILE_EVERY", 0))  # cProfile every Nth event/request; 0 is off
+PROFILING_SLOW_CALLBACK_MS = float(os.getenv("PROFILING_SLOW_CALLBACK_MS", 0))  # Log loop steps slower than this; 0 is off
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a sampling capture is requested while another one is running."""
+
+
+def _frame_name(code):
+    # One flame graph box per function, so the line number is the definition's, not the current line.
+    # co_qualname is Python 3.11+; older versions only have the bare name
+    name = f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval from a background thread."""
+
+    def __init__(self, interval=PROFILING_SAMPLE_INTERVAL_MS / 1000, max_seconds=PROFILING_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    def capture(self, seconds) -> str:
+        """Sample for `seconds` (capped at max_seconds) and return folded stacks, one "a;b;c count" per line.
+
+        Blocks the calling thread for the duration; run it off the event loop.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already being captured")
+        try:
+            return self._capture(min(float(seconds), self.max_seconds))
+        finally:
+            self._lock.release()
+
+    def _capture(self, seconds):
+        me = threading.get_ident()
+        counts = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(self.interval)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class CallProfiler:
+    """Runs cProfile around every `every`th call and keeps the combined stats.
+
+    cProfile hooks the whole thread, so a profiled async handler also records whatever other tasks
+    the event loop runs while it is suspended. Only one call is profiled at a time.
+    """
+
+    def __init__(self, every=PROFILING_CPROFILE_EVERY):
+        self.every = every
+        self.calls = 0
+        self.profiled = 0
+        self._active = False
+        self._stats = None
+
+    def _should_profile(self):
+        self.calls += 1
+        return self.every > 0 and self.calls % self.every == 0 and not self._active
+
+    async def run(self, call, *args):
+        """Await call(*args), profiling it if this is the Nth call."""
+        if not self._should_profile():
+            return await call(*args)
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return await call(*args)
+        finally:
+            profile.disable()
+            self._active = False
+            self._add(profile)
+
+    def _add(self, profile):
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+        self.profiled += 1
+
+    def dump(self):
+        """The accumulated stats in pstats' on-disk format, or None if nothing was profiled yet."""
+        return None if self._stats is None else marshal.dumps(self._stats.stats)
+
+    def reset(self):
+        self._stats = None
+        self.profiled = 0
+
+    def instrument_socketio(self, sio, namespace="/"):
+        """Wrap every coroutine handler on `namespace`; call after all handlers are registered."""
+        handlers = sio.handlers.get(namespace, {})
+        for event, handler in list(handlers.items()):
+            if asyncio.iscoroutinefunction(handler):
+                handlers[event] = self._wrap(handler)
+
+    def _wrap(self, handler):
+        call = metrics.adapt_handler(handler)
+
+        @functools.wraps(handler)
+        async def profiled(*args):
+            return await self.run(call, *args)
+        return profiled
+
+
+class ProfileMiddleware:
+    """ASGI middleware handing HTTP requests to a CallProfiler, which profiles every Nth one.
+
+    Paths under `exclude` are never profiled: Socket.IO long-polls and profile captures stay open for
+    seconds, and profiling one would hook the event loop for all of that time.
+    """
+
+    def __init__(self, app, profiler, exclude=("/socket.io", "/admin/")):
+        self.app = app
+        self.profiler = profiler
+        self.exclude = tuple(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            return await self.app(scope, receive, send)
+        return await self.profiler.run(self.app, scope, receive, send)
+
+
+def _coroutine_chain(task):
+    """The coroutines a task is suspended in, outermost first."""
+    chain = []
+    coro = task.get_coro()
+    while coro is not None and hasattr(coro, "cr_code"):
+        chain.append(coro)
+        coro = coro.cr_await
+    return chain
+
+
+def _describe(handle, task, before):
+    # The chain from before the step shows what was resumed; a task's first step only knows its
+    # outermost coroutine then, so prefer the chain it suspended in if that one goes deeper
+    chain = before
+    if task is not None and not task.done():
+        after = _coroutine_chain(task)
+        if len(after) > len(chain):
+            chain = after
+    if not chain:
+        return repr(handle)
+    return " -> ".join(_frame_name(coro.cr_code) for coro in chain)
+
+
+def install_slow_callback_monitor(threshold_ms=PROFILING_SLOW_CALLBACK_MS):
+    """Log any event-loop callback that runs longer than `threshold_ms`, with the task's coroutine chain.
+
+    Patches asyncio.Handle._run for the whole process (the pure-Python loop; uvloop is not covered).
+    The chain is taken before the step runs as well as after, since a finished handler leaves nothing to inspect.
+    Nothing the monitor does may raise out of _run: the event loop does not catch errors there and would stop.
+    """
+    threshold = threshold_ms / 1000
+    original = asyncio.events.Handle._run
+    if getattr(original, "slow_callback_monitor", False):
+        return
+
+    def _run(self):
+        try:
+            task = getattr(self._callback, "__self__", None)
+            if not isinstance(task, asyncio.Task):
+                task = None
+            chain = _coroutine_chain(task) if task is not None else []
+        except Exception:
+            task, chain = None, []
+        start = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed > threshold:
+                try:
+                    description = _describe(self, task, chain)
+                except Exception:
+                    description = repr(self)
+                try:
+                    logger.warning(f"Slow event-loop step: {elapsed * 1000:.1f} ms in {description}")
+                except Exception:
+                    pass
+
+    _run.slow_callback_monitor = True
+    _run.original = original
+    asyncio.events.Handle._run = _run
+
+
+def uninstall_slow_callback_monitor():
+    current = asyncio.events.Handle._run
+    if getattr(current, "slow_callback_monitor", False):
+        asyncio.events.Handle._run = current.original
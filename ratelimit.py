@@ -0,0 +1,120 @@
+"""
+ratelimit.py
+
+Rate limiting for Pasty's HTTP routes and Socket.IO events. Each limiter is a sliding-window
+counter per client key with O(1) hits; idle keys are evicted through a timing wheel so the
+cost of a hit does not depend on how many clients are tracked.
+"""
+
+import time
+
+
+def parse_limits(spec):
+    """Parse "name=limit/seconds,..." into {name: (limit, seconds)}."""
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, rule = item.partition("=")
+        limit, _, window = rule.partition("/")
+        limits[name.strip()] = (int(limit), float(window or 60))
+    return limits
+
+
+class _Entry:
+    """Counters for one key: hits in the current and previous fixed window."""
+    __slots__ = ("window", "previous", "current", "expires")
+
+    def __init__(self, window, expires):
+        self.window = window
+        self.previous = 0
+        self.current = 0
+        self.expires = expires
+
+
+class RateLimiter:
+    """Sliding-window rate limiter allowing `limit` hits per `window` seconds per key.
+
+    The sliding count is estimated from the current and previous fixed windows, weighting
+    the previous one by how much of it still overlaps the sliding window. An entry can be
+    dropped two windows after it was last hit; entries sit in a timing wheel bucket for
+    that deadline and are only looked at again when the wheel passes the bucket. Touching
+    a key does not move it, the sweep re-files it if its deadline moved on. At most
+    `max_keys` keys are tracked; beyond that the key closest to expiry is evicted.
+    """
+
+    def __init__(self, limit, window=60.0, max_keys=100_000, slots=64, clock=time.monotonic):
+        self.limit = limit
+        self.window = float(window)
+        self.max_keys = max_keys
+        self._clock = clock
+        self._entries = {}
+        # The wheel must span more than the two-window lifetime of an entry
+        self._resolution = 2 * self.window / (slots - 1)
+        self._wheel = [set() for _ in range(slots)]
+        self._cursor = int(clock() / self._resolution)
+
+    def __len__(self):
+        """Number of keys currently tracked."""
+        return len(self._entries)
+
+    def _slot(self, deadline):
+        return self._wheel[int(deadline / self._resolution) % len(self._wheel)]
+
+    def _advance(self, now):
+        """Sweep the wheel buckets whose time has passed since the last call."""
+        tick = int(now / self._resolution)
+        if tick == self._cursor:
+            return
+        # After a long idle gap one full turn covers every bucket
+        start = max(self._cursor + 1, tick - len(self._wheel) + 1)
+        self._cursor = tick
+        for t in range(start, tick + 1):
+            bucket = self._wheel[t % len(self._wheel)]
+            if not bucket:
+                continue
+            keys = list(bucket)
+            bucket.clear()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry.expires <= now:
+                    del self._entries[key]
+                else:
+                    self._slot(entry.expires).add(key)
+
+    def _evict_one(self):
+        """Drop the key in the nearest non-empty bucket to make room for a new one."""
+        n = len(self._wheel)
+        for offset in range(1, n + 1):
+            bucket = self._wheel[(self._cursor + offset) % n]
+            while bucket:
+                key = bucket.pop()
+                if self._entries.pop(key, None) is not None:
+                    return
+
+    def hit(self, key, now=None, cost=1):
+        """Record a hit worth `cost` hits for `key`; return False, counting nothing, if it would go over the limit."""
+        now = self._clock() if now is None else now
+        self._advance(now)
+        window = int(now // self.window)
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_keys:
+                self._evict_one()
+            entry = _Entry(window, (window + 2) * self.window)
+            self._entries[key] = entry
+            self._slot(entry.expires).add(key)
+        elif entry.window != window:
+            entry.previous = entry.current if entry.window == window - 1 else 0
+            entry.current = 0
+            entry.window = window
+            entry.expires = (window + 2) * self.window
+        overlap = 1.0 - (now - window * self.window) / self.window
+        # With cost 1 this is "already at the limit"; a batch needs room for all of its items
+        if entry.previous * overlap + entry.current + cost - 1 >= self.limit:
+            return False
+        entry.current += cost
+        return True
@@ -0,0 +1,30 @@
+"""
+scripts/dedup_report.py
+
+Print how much storage content-addressed deduplication is saving in the configured database
+(DATABASE_URL), using db.dedup_stats().
+
+Usage:
+    python scripts/dedup_report.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+def main():
+    db.initialize_db()
+    stats = db.dedup_stats()
+    print(f"texts:      {db.get_db_count()} ({stats['texts']} stored as shared blobs)")
+    print(f"blobs:      {stats['blobs']}")
+    print(f"referenced: {stats['referenced_bytes'] / 1024:.1f} KB")
+    print(f"stored:     {stats['stored_bytes'] / 1024:.1f} KB")
+    print(f"saved:      {stats['saved_bytes'] / 1024:.1f} KB (dedup ratio {stats['ratio']:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+spool.py
+
+On-disk storage for file uploads. Bodies are streamed chunk by chunk into SPOOL_DIR, so memory use does
+not grow with the upload size; the database row only holds the file's metadata and spool name.
+
+SPOOL_MAX_BYTES caps the directory as a whole. Usage is measured on disk when an upload starts, so it
+covers every worker's files, finished or still arriving; uploads running side by side can each take
+what was free at their start, so the cap can be overshot by at most their sizes.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Directory holding uploaded file bodies; the default sits next to this module so it doesn't depend on the CWD
+SPOOL_DIR = os.getenv("SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool"))
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", 100 * 1024 * 1024))  # Largest upload accepted
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", 10 * 1024 * 1024 * 1024))  # Total size of all spooled files
+CHUNK_SIZE = 64 * 1024  # Bytes per read when streaming a file back
+
+_PARTIAL = ".part"
+
+
+class FileTooLarge(Exception):
+    """Raised when an upload goes over the size limit; the partial file is already removed."""
+
+
+class SpoolFull(Exception):
+    """Raised when an upload would take the spool over SPOOL_MAX_BYTES; the partial file is already removed."""
+
+
+def path(name, directory=None):
+    return os.path.join(directory or SPOOL_DIR, name)
+
+
+def usage(directory=None):
+    """Bytes held in the spool directory, partial uploads included."""
+    total = 0
+    try:
+        entries = list(os.scandir(directory or SPOOL_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            total += entry.stat().st_size
+        except FileNotFoundError:
+            pass  # Removed while we were counting
+    return total
+
+
+async def receive(chunks, limit=None, directory=None):
+    """Write an async iterable of byte chunks to a new spool file; returns (name, size).
+
+    The body is written under a temporary name and renamed once complete, so a crash never
+    leaves a truncated file under a name the database could point to.
+    """
+    limit = MAX_FILE_BYTES if limit is None else limit
+    directory = directory or SPOOL_DIR
+    os.makedirs(directory, exist_ok=True)
+    free = SPOOL_MAX_BYTES - await asyncio.to_thread(usage, directory)
+    if free <= 0:
+        raise SpoolFull(f"Spool holds {SPOOL_MAX_BYTES} bytes or more")
+    name = uuid.uuid4().hex
+    partial = path(name, directory) + _PARTIAL
+    size = 0
+    f = await asyncio.to_thread(open, partial, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                raise FileTooLarge(f"Upload exceeds {limit} bytes")
+            if size > free:
+                raise SpoolFull(f"Upload would take the spool over {SPOOL_MAX_BYTES} bytes")
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+        os.replace(partial, path(name, directory))
+    except BaseException:
+        f.close()
+        _unlink(partial)
+        raise
+    return name, size
+
+
+def open_file(name, directory=None):
+    """Open a spool file for reading; returns (file, size).
+
+    An open file stays readable after its name is removed, so a download that has opened the file
+    is unaffected by another request's last read removing it.
+    """
+    f = open(path(name, directory), "rb")
+    return f, os.fstat(f.fileno()).st_size
+
+
+async def stream(f):
+    """Yield an open spool file in CHUNK_SIZE pieces, closing it at the end."""
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+def remove(name, directory=None):
+    """Delete a spool file; a file that is already gone is not an error."""
+    _unlink(path(name, directory))
+
+
+def remove_partials(directory=None):
+    """Delete uploads left half-written by a crash; returns how many were removed."""
+    directory = directory or SPOOL_DIR
+    if not os.path.isdir(directory):
+        return 0
+    partials = [entry for entry in os.listdir(directory) if entry.endswith(_PARTIAL)]
+    for entry in partials:
+        _unlink(os.path.join(directory, entry))
+    return len(partials)
+
+
+def _unlink(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Failed to remove spool file {file_path}: {e}")
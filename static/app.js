@@ -26,13 +26,16 @@ class SocketIOManager {
     const rootMeta = document.querySelector('meta[name="public-root"]');
     const rootPath = (rootMeta && rootMeta.content) ? rootMeta.content.replace(/\/$/, '') : '';
     const socketUrl = protocol + window.location.host; // keep base URL at origin; apply prefix in `path` only
+    // Multi-worker deployments without sticky sessions only allow websocket
+    const transportsMeta = document.querySelector('meta[name="socketio-transports"]');
+    const transports = (transportsMeta && transportsMeta.content) ? transportsMeta.content.split(',') : ['polling', 'websocket'];
         console.log(`Connecting to Socket.IO at ${socketUrl}`);
 
         this.socket = io(socketUrl, {
             reconnectionAttempts: this.maxReconnectAttempts,
             reconnectionDelay: this.reconnectDelay,
             reconnection: this.autoReconnect,
-            transports: ['polling', 'websocket'],
+            transports: transports,
             path: rootPath + '/socket.io'
         });
 
@@ -70,6 +73,22 @@ class SocketIOManager {
             this.showError(data.error);
         });
 
+        // Pairing: this device waits on a code and the paste is pushed here when it is saved
+        this.socket.on('pair_code', (data) => {
+            const status = document.getElementById('pair-status');
+            if (status) status.textContent = `Pairing code: ${data.code} (enter it when saving on the other device)`;
+        });
+
+        this.socket.on('paste_delivered', (data) => {
+            const status = document.getElementById('pair-status');
+            if (status) status.textContent = '';
+            this.showRetrievedContent(data.id, data.content);
+        });
+
+        this.socket.on('pair_error', (data) => {
+            this.showError(data.error);
+        });
+
         this.socket.on('disconnect', (reason) => {
             this.cleanupTimers();
             
@@ -135,11 +154,17 @@ class SocketIOManager {
                     captchaInput.value = '';
                     return;
                 }
+                if (textarea && !textarea.checkValidity()) {
+                    textarea.reportValidity();
+                    return;
+                }
                 if (textarea && textarea.value.trim()) {
+                    const pairCodeInput = document.getElementById('pair-code-input');
                     this.socket.emit('save_text', {
                         content: textarea.value,
                         captcha_input: captchaInput.value.trim().toUpperCase(),
-                        captcha_code: currentCaptcha
+                        captcha_code: currentCaptcha,
+                        pair_code: pairCodeInput ? pairCodeInput.value.trim() : ''
                     });
                     // Regenerate code after submit
                     currentCaptcha = generateCaptchaCode();
@@ -149,6 +174,14 @@ class SocketIOManager {
             });
         }
 
+        // Pairing: ask the server for a code to wait on
+        const pairListenBtn = document.getElementById('pair-listen-btn');
+        if (pairListenBtn) {
+            pairListenBtn.addEventListener('click', () => {
+                this.socket.emit('pair_listen');
+            });
+        }
+
         // Retrieve CAPTCHA setup
         let currentCaptchaRetrieve = generateCaptchaCode();
         const captchaCodeDivRetrieve = document.getElementById('captcha-code-retrieve');
@@ -188,14 +221,19 @@ class SocketIOManager {
             });
         }
 
-        // Character counter
+        // Size counter and limit; the server limit is on UTF-8 bytes, which maxlength (UTF-16 code units) can't express
         const textarea = document.querySelector('#save-tab textarea');
         if (textarea) {
+            const encoder = new TextEncoder();
+            const maxBytes = parseInt(textarea.dataset.maxBytes, 10);
             textarea.addEventListener('input', () => {
+                const bytes = encoder.encode(textarea.value).length;
                 const charCount = document.getElementById('charCount');
                 if (charCount) {
-                    charCount.textContent = textarea.value.length;
+                    charCount.textContent = bytes;
                 }
+                // An invalid textarea blocks the submit with the browser's own message
+                textarea.setCustomValidity(bytes > maxBytes ? `Text is ${bytes} bytes; the limit is ${maxBytes}.` : '');
             });
         }
     }
@@ -0,0 +1,209 @@
+"""
+storage.py
+
+Storage backends for Pasty behind one async interface. SQLStore is the SQLAlchemy code in db.py,
+run on the DB executor. MemoryStore keeps entries in process, which is enough for an ephemeral
+clipboard that does not need to survive a restart and avoids the database entirely.
+
+The backend is chosen with STORE_BACKEND ("sql" or "memory"), or by setting DATABASE_URL=memory://.
+"""
+
+import asyncio
+import heapq
+import os
+import time
+from typing import Optional, Protocol
+
+import compression
+import db
+import ids
+import spool
+
+STORE_BACKEND = os.getenv("STORE_BACKEND", "")
+
+
+class Store(Protocol):
+    """Operations the app needs from a storage backend.
+
+    Entries passed to insert_many are (content, created_at, ip_address) tuples; it returns one
+    result per entry, the new ID or the exception that entry failed with.
+    """
+
+    async def initialize(self) -> int:
+        """Prepare the backend and return the current row count."""
+
+    async def insert_many(self, entries) -> list:
+        """Store entries in one batch."""
+
+    async def consume(self, id_) -> Optional[str]:
+        """Read an entry, counting the read; None if missing or expired."""
+
+    async def consume_many(self, ids_) -> list:
+        """consume() for many IDs at once, in one transaction where the backend has them."""
+
+    async def insert_file(self, spool_name, file_name, media_type, file_size, created_at, ip_address) -> str:
+        """Record a file already written to the spool and return its ID."""
+
+    async def consume_file(self, id_) -> Optional[db.FileInfo]:
+        """Read a file upload, counting the read; None if missing, expired or not a file."""
+
+    def count(self) -> int:
+        """Current number of entries, without touching storage."""
+
+    async def refresh(self) -> int:
+        """Re-read the count and ID pool from storage (other processes may have written)."""
+
+    async def expire(self) -> int:
+        """Delete expired entries and return how many were removed."""
+
+
+class SQLStore:
+    """Store backed by the SQLAlchemy functions in db.py."""
+
+    async def initialize(self):
+        await db.run(db.initialize_db)
+        return await db.run(db.refresh_row_count)
+
+    async def insert_many(self, entries):
+        return await db.run(db.create_texts, entries)
+
+    async def consume(self, id_):
+        return await db.run(db.consume_text, id_)
+
+    async def consume_many(self, ids_):
+        return await db.run(db.consume_texts, ids_)
+
+    async def insert_file(self, spool_name, file_name, media_type, file_size, created_at, ip_address):
+        return await db.run(db.create_file, spool_name, file_name, media_type, file_size, created_at, ip_address)
+
+    async def consume_file(self, id_):
+        return await db.run(db.consume_file, id_)
+
+    def count(self):
+        return db.get_row_count()
+
+    async def refresh(self):
+        await db.run(db.reseed_allocator)
+        return await db.run(db.refresh_row_count)
+
+    async def expire(self):
+        return await db.run(db.delete_expired_entries)
+
+
+class _Record:
+    """One stored entry; times are POSIX timestamps."""
+    __slots__ = ("content", "body", "file", "created_at", "expires_at", "last_accessed", "ip_address",
+                 "retrieval_count")
+
+    def __init__(self, content, created_at, expires_at, ip_address, file=None):
+        # Compressed like SQL rows, so large pastes cost the same memory in either backend
+        self.body = None if content is None else compression.compress(content)
+        self.content = None if self.body is not None else content
+        self.file = file  # (spool_name, file_name, media_type, file_size) for file uploads
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.last_accessed = created_at
+        self.ip_address = ip_address
+        self.retrieval_count = 0
+
+
+class MemoryStore:
+    """In-process store: a dict of records plus a min-heap of (expires_at, id) for expiry.
+
+    Heap entries are not removed when a record is consumed; expire() skips any entry whose
+    record is gone or was replaced by a newer one under the same ID. Only call it from the
+    event loop thread.
+    """
+
+    def __init__(self, expiration_hours=db.EXPIRATION_HOURS, max_retrievals=db.MAX_RETRIEVALS,
+                 batch_size=db.EXPIRY_BATCH_SIZE, allocator=None, clock=time.time):
+        self.ttl = expiration_hours * 3600
+        self.max_retrievals = max_retrievals
+        self.batch_size = batch_size
+        self.allocator = allocator or ids.IdAllocator()
+        self.allocator.seed([])
+        self._clock = clock
+        self._records = {}
+        self._expiry = []
+
+    async def initialize(self):
+        return len(self._records)
+
+    async def insert_many(self, entries):
+        results = []
+        for content, created_at, ip_address in entries:
+            try:
+                results.append(self._insert(content, created_at, ip_address))
+            except ids.IdSpaceExhausted as e:
+                results.append(e)
+        return results
+
+    async def insert_file(self, spool_name, file_name, media_type, file_size, created_at, ip_address):
+        return self._insert(None, created_at, ip_address, file=(spool_name, file_name, media_type, file_size))
+
+    def _insert(self, content, created_at, ip_address, file=None):
+        id_ = self.allocator.allocate()
+        created = created_at.timestamp()
+        record = _Record(content, created, created + self.ttl, ip_address, file)
+        self._records[id_] = record
+        heapq.heappush(self._expiry, (record.expires_at, id_))
+        return id_
+
+    async def consume(self, id_, now=None):
+        record, _ = self._consume(id_, now, is_file=False)
+        return None if record is None else compression.stored_content(record.content, record.body)
+
+    async def consume_file(self, id_, now=None):
+        record, last_read = self._consume(id_, now, is_file=True)
+        return None if record is None else db.FileInfo(*record.file, last_read=last_read)
+
+    def _consume(self, id_, now, is_file):
+        """Count a read of a live record of the right kind; returns (record, last_read)."""
+        now = self._clock() if now is None else now
+        record = self._records.get(id_)
+        if record is None or record.expires_at <= now or (record.file is not None) != is_file:
+            return None, False
+        record.retrieval_count += 1
+        record.last_accessed = now
+        last_read = record.retrieval_count >= self.max_retrievals
+        if last_read:
+            del self._records[id_]
+            self.allocator.release(id_)
+        return record, last_read
+
+    async def consume_many(self, ids_, now=None):
+        now = self._clock() if now is None else now
+        return [await self.consume(id_, now) for id_ in ids_]
+
+    def count(self):
+        return len(self._records)
+
+    async def refresh(self):
+        return len(self._records)
+
+    async def expire(self, now=None):
+        now = self._clock() if now is None else now
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, id_ = heapq.heappop(self._expiry)
+            record = self._records.get(id_)
+            if record is not None and record.expires_at == expires_at:
+                del self._records[id_]
+                self.allocator.release(id_)
+                if record.file is not None:
+                    spool.remove(record.file[0])
+                removed += 1
+                if removed % self.batch_size == 0:
+                    # Let other handlers run between batches of a large sweep
+                    await asyncio.sleep(0)
+        return removed
+
+
+def create_store(backend=STORE_BACKEND, url=db.db_url) -> Store:
+    """Build the configured backend: STORE_BACKEND if set, else memory:// URLs select MemoryStore."""
+    backend = backend or ("memory" if url.startswith("memory://") else "sql")
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sql":
+        return SQLStore()
+    raise ValueError(f"Unknown STORE_BACKEND: {backend}")
@@ -1,12 +1,15 @@
 import unittest
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select
 from sqlalchemy.orm import sessionmaker
 import os 
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 # Add project root to sys.path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from db import initialize_db, insert_text, get_text_by_id, update_last_accessed, delete_expired_entries, generate_unique_id, id_exists, Text, Base
+from db import check_sqlite_settings, configure_sqlite, consume_file, create_file, create_text, create_texts, refresh_row_count, get_row_count, initialize_db, insert_text, get_text_by_id, consume_text, consume_texts, update_last_accessed, delete_expired_entries, generate_unique_id, id_exists, dedup_stats, Blob, Text, Base
 
 EXPIRATION_HOURS = int(os.getenv("EXPIRATION_HOURS", 24))
 
@@ -83,6 +86,141 @@ class TestTextStore(unittest.TestCase):
         self.assertEqual(text.retrieval_count, 1)
 
 
+    def test_consume_text(self):
+        """Test that consume_text counts reads and deletes the entry on the second one."""
+        id_ = generate_unique_id()
+        content = "Consume me"
+        created_at = datetime.now(timezone.utc)
+        insert_text(id_, content, created_at, created_at, "192.168.1.1")
+
+        self.assertEqual(consume_text(id_), content)
+        text = self.session.query(Text).filter_by(id=id_).first()
+        self.assertEqual(text.retrieval_count, 1)
+        self.assertGreaterEqual(text.last_accessed, created_at.replace(tzinfo=None))
+        self.session.rollback()
+
+        self.assertEqual(consume_text(id_), content)
+        self.assertIsNone(self.session.query(Text).filter_by(id=id_).first())
+        self.assertIsNone(consume_text(id_))
+
+    def test_consume_texts(self):
+        """Test that a batch read applies the per-ID rules, counting repeated IDs as separate reads."""
+        now = datetime.now(timezone.utc)
+        first, second = generate_unique_id(), generate_unique_id()
+        insert_text(first, "First", now, now, "192.168.1.1")
+        insert_text(second, "Second", now, now, "192.168.1.1")
+
+        self.assertEqual(consume_texts([first, second, second, "missing"]), ["First", "Second", "Second", None])
+        self.assertIsNone(self.session.query(Text).filter_by(id=second).first())
+        self.assertEqual(consume_texts([first]), ["First"])
+
+    def test_large_text_stored_compressed(self):
+        """Test that large texts are stored compressed in `body` and read back as text."""
+        id_ = generate_unique_id()
+        content = "INFO GET /ping 200\n" * 500
+        now = datetime.now(timezone.utc)
+        insert_text(id_, content, now, now, "192.168.1.1")
+
+        text = self.session.query(Text).filter_by(id=id_).first()
+        blob = self.session.query(Blob).filter_by(hash=text.blob_hash).first()
+        self.assertIsNone(blob.content)
+        self.assertLess(len(blob.body), len(content))
+        self.session.rollback()
+        self.assertEqual(consume_text(id_), content)
+
+    def test_duplicate_texts_share_a_blob(self):
+        """Test that identical texts share one reference-counted blob, removed with its last reference."""
+        content = "[server]\nport = 8080\n" * 20
+        now = datetime.now(timezone.utc)
+        first, second, expired = create_texts([(content, now, "192.168.1.1")] * 2 + [(content, now - timedelta(hours=EXPIRATION_HOURS + 1), "192.168.1.1")])
+        hash_ = self.session.query(Text).filter_by(id=first).one().blob_hash
+        blobs = self.session.query(Blob).filter_by(hash=hash_)
+        self.assertEqual(blobs.one().refs, 3)
+        self.assertGreaterEqual(dedup_stats()["saved_bytes"], 2 * len(content))
+        self.session.rollback()
+
+        self.assertEqual(delete_expired_entries(), 1)
+        self.assertEqual(consume_texts([first, first, second]), [content] * 3)
+        self.assertEqual(blobs.one().refs, 1)
+        self.session.rollback()
+        self.assertEqual(consume_text(second), content)
+        self.assertEqual(blobs.count(), 0)
+
+    def test_consume_file(self):
+        """Test that file uploads follow the two-read rule and are invisible to text reads."""
+        now = datetime.now(timezone.utc)
+        id_ = create_file("abc123", "notes.txt", "text/plain", 42, now, "192.168.1.1")
+
+        self.assertIsNone(consume_text(id_))
+        first = consume_file(id_)
+        self.assertEqual((first.spool_name, first.file_name, first.file_size, first.last_read),
+                         ("abc123", "notes.txt", 42, False))
+        self.assertTrue(consume_file(id_).last_read)
+        self.assertIsNone(consume_file(id_))
+
+    def test_create_retries_ids_stored_elsewhere(self):
+        """Test that text and file inserts move on to another ID when theirs was stored by another process."""
+        import db
+        now = datetime.now(timezone.utc)
+        for create in (lambda: create_text("Retried", now, "192.168.1.1"),
+                       lambda: create_file("def456", "retried.txt", "text/plain", 7, now, "192.168.1.1")):
+            taken, free = generate_unique_id(), generate_unique_id()
+            self.session.add(Text(id=taken, content="Elsewhere", created_at=now, ip_address="192.168.1.1"))
+            self.session.commit()
+            with patch.object(db.id_allocator, "allocate", side_effect=[taken, free]):
+                self.assertEqual(create(), free)
+            self.assertTrue(id_exists(free))
+
+    def test_consume_text_expired(self):
+        """Test that expired entries read as missing even before they are swept."""
+        id_ = generate_unique_id()
+        created_at = datetime.now(timezone.utc) - timedelta(hours=EXPIRATION_HOURS + 1)
+        insert_text(id_, "Old text", created_at, created_at, "192.168.1.1")
+
+        self.assertIsNone(consume_text(id_))
+        text = self.session.query(Text).filter_by(id=id_).first()
+        self.assertEqual(text.retrieval_count, 0)
+        self.session.rollback()
+        delete_expired_entries()
+
+    def test_consume_text_concurrent(self):
+        """Test that concurrent readers of one ID get exactly two successful reads."""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/race.db", connect_args={"check_same_thread": False})
+            Base.metadata.create_all(engine)
+            Session = sessionmaker(bind=engine)
+            with patch("db.get_session", lambda: Session()):
+                now = datetime.now(timezone.utc)
+                insert_text("QW", "Contended", now, now, "192.168.1.1")
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    results = list(pool.map(consume_text, ["QW"] * 8))
+            engine.dispose()
+        self.assertEqual(results.count("Contended"), 2)
+        self.assertEqual(results.count(None), 6)
+
+    def test_sqlite_settings(self):
+        """Test that pooled file connections run in WAL mode with the tuned pragmas."""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/tuned.db", connect_args={"check_same_thread": False})
+            configure_sqlite(engine)
+            with patch("db.engine", engine):
+                settings = check_sqlite_settings()
+            engine.dispose()
+        self.assertEqual(settings["journal_mode"], "wal")
+        self.assertEqual(settings["synchronous"], 1)  # NORMAL
+        self.assertEqual(settings["busy_timeout"], 5000)
+
+    def test_initialize_db_skips_current_schema(self):
+        """Test that a second start against an up-to-date database skips creation and migrations."""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/schema.db", connect_args={"check_same_thread": False})
+            with patch("db.engine", engine), patch("db.sql_url", "sqlite:///:memory:"):
+                initialize_db()
+                with patch.object(Base.metadata, "create_all") as create_all:
+                    initialize_db()
+            engine.dispose()
+        create_all.assert_not_called()
+
     def test_delete_expired_entries(self):
         """Test deleting expired entries based on the expiration cutoff."""
         id_ = generate_unique_id()
@@ -102,6 +240,123 @@ class TestTextStore(unittest.TestCase):
         text = self.session.query(Text).filter_by(id=id_).first()
         self.assertIsNone(text)
 
+    def test_delete_expired_entries_in_batches(self):
+        """Test that the sweep keeps deleting batches until no expired entries remain."""
+        created_at = datetime.now(timezone.utc) - timedelta(hours=EXPIRATION_HOURS + 1)
+        expired_ids = [generate_unique_id() for _ in range(5)]
+        for id_ in expired_ids:
+            insert_text(id_, "Old text", created_at, created_at, "192.168.1.1")
+        live_id = generate_unique_id()
+        insert_text(live_id, "New text", datetime.now(timezone.utc), None, "192.168.1.1")
+
+        self.assertEqual(delete_expired_entries(batch_size=2), 5)
+        self.assertEqual(self.session.query(Text).filter(Text.id.in_(expired_ids)).count(), 0)
+        self.assertTrue(id_exists(live_id))
+        consume_text(live_id)
+        consume_text(live_id)
+
+    def test_delete_expired_entries_skips_rows_deleted_concurrently(self):
+        """Test that the sweep only accounts for the rows its own DELETE removed."""
+        content = "Shared by two expired texts and a live one\n" * 8
+        now = datetime.now(timezone.utc)
+        old = now - timedelta(hours=EXPIRATION_HOURS + 1)
+        taken, swept, live = create_texts([(content, old, "192.168.1.1"), (content, old, "192.168.1.1"),
+                                           (content, now, "192.168.1.1")])
+        start = get_row_count()
+        raced = []
+
+        def concurrent_read(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("DELETE FROM texts") and not raced:
+                # A read deletes `taken` between the sweep's SELECT and DELETE, dropping its own blob reference
+                raced.append(taken)
+                cursor.connection.execute("DELETE FROM texts WHERE id = ?", (taken,))
+                cursor.connection.execute("UPDATE blobs SET refs = refs - 1")
+
+        event.listen(self.engine, "before_cursor_execute", concurrent_read)
+        try:
+            self.assertEqual(delete_expired_entries(), 1)
+        finally:
+            event.remove(self.engine, "before_cursor_execute", concurrent_read)
+        self.assertEqual(raced, [taken])
+        self.assertEqual(get_row_count(), start - 1)
+        self.assertEqual(consume_text(live), content)
+        consume_text(live)
+
+    def test_first_copies_of_a_blob_race(self):
+        """Test that a blob created by another writer after our UPDATE is counted, not a collision."""
+        content = "Saved by two clients at once\n" * 8
+        raced = []
+
+        def concurrent_save(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO blobs") and not raced:
+                raced.append(parameters)
+                cursor.connection.execute("INSERT INTO blobs (hash, content, refs) VALUES (?, ?, 1)",
+                                          (parameters[0], content))
+
+        event.listen(self.engine, "before_cursor_execute", concurrent_save)
+        try:
+            id_, = create_texts([(content, datetime.now(timezone.utc), "192.168.1.1")])
+        finally:
+            event.remove(self.engine, "before_cursor_execute", concurrent_save)
+        self.assertEqual(len(raced), 1)
+        hash_ = self.session.query(Text).filter_by(id=id_).one().blob_hash
+        self.assertEqual(self.session.query(Blob).filter_by(hash=hash_).one().refs, 2)
+        self.session.rollback()
+        self.assertEqual(consume_text(id_), content)
+        consume_text(id_)
+
+    def test_row_count_tracks_changes(self):
+        """Test that the in-memory row count follows inserts and deletes without recounting."""
+        start = refresh_row_count()
+        id_ = generate_unique_id()
+        insert_text(id_, "Counted", datetime.now(timezone.utc), None, "192.168.1.1")
+        self.assertEqual(get_row_count(), start + 1)
+        consume_text(id_)
+        consume_text(id_)
+        self.assertEqual(get_row_count(), start)
+
+    def test_create_texts(self):
+        """Test that a batch of entries is stored in one call with distinct IDs."""
+        start = refresh_row_count()
+        now = datetime.now(timezone.utc)
+        new_ids = create_texts([(f"Batch {i}", now, "192.168.1.1") for i in range(3)])
+        self.assertEqual(len(set(new_ids)), 3)
+        self.assertEqual(get_row_count(), start + 3)
+        for i, id_ in enumerate(new_ids):
+            self.assertEqual(consume_text(id_), f"Batch {i}")
+            consume_text(id_)
+
+    def test_create_texts_stores_what_fits_when_ids_run_out(self):
+        """Test that a batched save outcome matches one save at a time when only some IDs are left."""
+        import asyncio
+        import db
+        from ids import IdAllocator, IdSpaceExhausted, ids_of_length
+        from writer import WriteQueue
+
+        stored = set(self.session.scalars(select(Text.id)).all())
+        free = [id_ for id_ in ids_of_length(2) if id_ not in stored][:3]
+        allocator = IdAllocator(max_length=2)
+        allocator.seed([id_ for id_ in ids_of_length(2) if id_ not in free])
+        now = datetime.now(timezone.utc)
+
+        async def commit(entries):
+            # On the loop thread: the in-memory database is per connection
+            return create_texts(entries)
+
+        async def scenario():
+            queue = WriteQueue(commit, max_latency=0.01)
+            return await asyncio.gather(*(queue.submit((f"Save {i}", now, "192.168.1.1")) for i in range(5)),
+                                        return_exceptions=True)
+
+        with patch("db.id_allocator", allocator):
+            results = asyncio.run(scenario())
+        saved = [r for r in results if not isinstance(r, Exception)]
+        self.assertEqual(sorted(saved), sorted(free))
+        self.assertEqual(sum(isinstance(r, IdSpaceExhausted) for r in results), 2)
+        for id_ in saved:
+            consume_text(id_)
+            consume_text(id_)
+
     def test_generate_unique_id(self):
         """Test generating unique IDs."""
         id_1 = generate_unique_id()
@@ -1,43 +1,266 @@
 import pytest
 from fastapi.testclient import TestClient
+import asyncio
 import os 
 import sys
+import time
 # Add project root to sys.path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+import presence
+import storage
 from main import app  # adjust this if your app is in a different file
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 client = TestClient(app)
 
-# @patch("db.get_db_count", return_value=42)
-# def test_get_count(mock_count):
-#     response = client.get("/api/count")
-#     assert response.status_code == 200
-#     assert response.json() == {"count": 42}
-#     mock_count.assert_called_once()
-
-# @patch("db.generate_unique_id", return_value="abc123")
-# @patch("db.insert_text")
-# def test_api_save(mock_insert, mock_generate_id):
-#     response = client.post("/save", json={"content": "Hello world!"})
-#     assert response.status_code == 200
-#     assert response.json() == {"id": "abc123"}
-#     mock_insert.assert_called_once()
-
-# @patch("db.delete_expired_entries")
-# @patch("db.get_text_by_id", return_value=("This is the content",))
-# @patch("db.update_last_accessed")
-# def test_api_get_success(mock_update, mock_get, mock_delete):
-#     response = client.get("/get/test123")
-#     assert response.status_code == 200
-#     assert response.json() == {"content": "This is the content"}
-#     mock_get.assert_called_once_with("test123")
-#     mock_update.assert_called_once()
-
-# @patch("db.delete_expired_entries")
-# @patch("db.get_text_by_id", return_value=None)
-# def test_api_get_not_found(mock_get, mock_delete):
-#     response = client.get("/get/unknown")
-#     assert response.status_code == 404
-#     assert response.json() == {"detail": "ID not found"}
-#     mock_get.assert_called_once_with("unknown")
+@pytest.fixture
+def api(tmp_path):
+    """Client running the app lifespan against a fresh in-memory store, spool directory and presence."""
+    limiters = {name: main.ratelimit.RateLimiter(limit, window) for name, (limit, window) in main.RATE_LIMITS.items()}
+    with patch.object(main, "store", storage.MemoryStore()), \
+         patch.object(main, "clients", presence.Presence()), \
+         patch.dict(main.rate_limiters, limiters), \
+         patch("spool.SPOOL_DIR", str(tmp_path)), \
+         TestClient(app) as api_client:
+        yield api_client
+
+def test_pages_render(api):
+    response = api.get("/")
+    assert response.status_code == 200
+    assert f"{main.MAX_CONTENT_BYTES // 1024} KB" in response.text
+    # The limit is on UTF-8 bytes, enforced in app.js; maxlength would count UTF-16 code units
+    assert f'data-max-bytes="{main.MAX_CONTENT_BYTES}"' in response.text and "maxlength" not in response.text
+    assert api.get("/readme").status_code == 200
+
+def test_root_page_cached_with_etag(api):
+    response = api.get("/")
+    etag = response.headers["etag"]
+    assert api.head("/").headers["etag"] == etag
+    assert api.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+def test_get_count(api):
+    api.post("/save", json={"content": "Hello world!"})
+    response = api.get("/api/count")
+    assert response.status_code == 200
+    assert response.json() == {"count": 1}
+
+def test_api_save_and_get(api):
+    response = api.post("/save", json={"content": "Hello world!"})
+    assert response.status_code == 200
+    id_ = response.json()["id"]
+    assert api.get(f"/get/{id_}").json() == {"content": "Hello world!"}
+    assert api.get(f"/get/{id_}").json() == {"content": "Hello world!"}
+    # Deleted after the second read
+    response = api.get(f"/get/{id_}")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "ID not found"}
+
+def test_api_save_too_long(api):
+    response = api.post("/save", json={"content": "x" * (main.MAX_CONTENT_BYTES + 1)})
+    assert response.status_code == 413
+    # Limited on UTF-8 bytes: this is half the limit in characters but over it in bytes
+    response = api.post("/save", json={"content": "é" * (main.MAX_CONTENT_BYTES // 2 + 1)})
+    assert response.status_code == 413
+
+def test_api_batch_save_and_get(api):
+    response = api.post("/batch/save", json={"contents": ["one", "two", "three"]})
+    assert response.status_code == 200
+    ids = response.json()["ids"]
+    assert len(set(ids)) == 3
+    response = api.post("/batch/get", json={"ids": [ids[0], ids[1], "unknown"]})
+    assert response.json() == {"texts": [
+        {"id": ids[0], "content": "one"},
+        {"id": ids[1], "content": "two"},
+        {"id": "unknown", "content": None},
+    ]}
+    assert api.get("/api/count").json() == {"count": 3}
+
+def test_api_batch_limits(api):
+    assert api.post("/batch/save", json={"contents": []}).status_code == 422
+    too_many = {"ids": ["QW"] * (main.BATCH_MAX_ITEMS + 1)}
+    assert api.post("/batch/get", json=too_many).status_code == 422
+    # A repeated ID would spend both of a text's reads in one request
+    assert api.post("/batch/get", json={"ids": ["QW", "QW"]}).status_code == 422
+
+def test_batch_items_count_against_per_item_limits(api):
+    limiters = {"batch": main.ratelimit.RateLimiter(10, 60), "save_text": main.ratelimit.RateLimiter(5, 60),
+                "retrieve_text": main.ratelimit.RateLimiter(4, 60)}
+    with patch.dict(main.rate_limiters, limiters):
+        assert api.post("/batch/save", json={"contents": ["a", "b", "c"]}).status_code == 200
+        assert api.post("/batch/save", json={"contents": ["d", "e", "f"]}).status_code == 429
+        assert api.post("/batch/save", json={"contents": ["d", "e"]}).status_code == 200
+        assert api.post("/save", json={"content": "g"}).status_code == 429
+        assert api.post("/batch/get", json={"ids": ["QW", "WE", "ER", "RT", "TY"]}).status_code == 429
+        assert api.post("/batch/get", json={"ids": ["QW", "WE", "ER", "RT"]}).status_code == 200
+
+def test_file_upload_and_download(api, tmp_path):
+    body = os.urandom(300 * 1024)
+    response = api.post("/files?name=../dump.bin", content=body, headers={"content-type": "application/octet-stream"})
+    assert response.status_code == 200
+    id_ = response.json()["id"]
+    # Files are not texts
+    assert api.get(f"/get/{id_}").status_code == 404
+    for _ in range(2):
+        response = api.get(f"/files/{id_}")
+        assert response.status_code == 200
+        assert response.content == body
+        assert 'filename="dump.bin"' in response.headers["content-disposition"]
+    assert api.get(f"/files/{id_}").status_code == 404
+    # The body is removed from the spool after the last read
+    assert os.listdir(tmp_path) == []
+
+def test_file_download_survives_concurrent_last_read(api, tmp_path):
+    body = os.urandom(200 * 1024)
+    id_ = api.post("/files?name=race.bin", content=body).json()["id"]
+
+    async def first_read():
+        return await main.download_file(id_)
+
+    async def drain(response):
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    # The first read has been answered but not yet sent when the last read removes the body
+    response = asyncio.run(first_read())
+    assert api.get(f"/files/{id_}").content == body
+    assert os.listdir(tmp_path) == []
+    assert asyncio.run(drain(response)) == body
+    assert response.headers["content-length"] == str(len(body))
+
+def test_file_upload_too_large(api, tmp_path):
+    with patch("spool.MAX_FILE_BYTES", 1024):
+        response = api.post("/files?name=big.bin", content=iter([b"x" * 1000, b"x" * 1000]))
+    assert response.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+def test_file_upload_spool_full(api, tmp_path):
+    (tmp_path / "stored").write_bytes(b"x" * 1500)
+    with patch("spool.SPOOL_MAX_BYTES", 2048):
+        response = api.post("/files?name=big.bin", content=iter([b"x" * 500, b"x" * 500]))
+        assert response.status_code == 507
+        assert os.listdir(tmp_path) == ["stored"]
+        assert api.post("/files?name=small.bin", content=b"x" * 500).status_code == 200
+
+def test_uploads_have_their_own_limit(api):
+    limit = main.rate_limiters["upload"].limit
+    for _ in range(limit):
+        assert api.post("/files?name=a.txt", content=b"a").status_code == 200
+    assert api.post("/files?name=a.txt", content=b"a").status_code == 429
+    # Saving text is limited separately
+    assert api.post("/save", json={"content": "still allowed"}).status_code == 200
+
+def test_concurrent_saves_do_not_block_loop():
+    """Slow commits run on the DB executor, so saves don't serialize and the loop keeps ticking."""
+    delay = 0.2
+    saves = 4
+
+    def slow_commit(entries):
+        time.sleep(delay)
+        return [f"ID{i}" for i in range(len(entries))]
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*(main.save_text(f"sid{i}", {"content": "hello"}) for i in range(saves)))
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return elapsed, ticks
+
+    with patch("db.create_texts", side_effect=slow_commit), \
+         patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        elapsed, ticks = asyncio.run(scenario())
+
+    # Serialized on the loop this would take saves * delay with no ticks in between
+    assert elapsed < saves * delay * 0.75
+    assert ticks >= 5
+    success = [c for c in emit.call_args_list if c.args[0] == 'save_success']
+    assert len(success) == saves
+
+
+@patch("db.refresh_row_count", return_value=0)
+@patch("db.delete_expired_entries", return_value=0)
+@patch("db.initialize_db")
+def test_lifespan_starts_expiry_sweep(mock_init, mock_sweep, mock_count):
+    """The app lifespan initializes the DB and schedules the expiry sweep."""
+    with TestClient(app):
+        deadline = time.time() + 2
+        while not mock_sweep.called and time.time() < deadline:
+            time.sleep(0.01)
+    mock_init.assert_called_once()
+    mock_sweep.assert_called()
+
+
+@patch("db.get_row_count", return_value=7)
+def test_connect_sends_count_to_new_client_only(mock_count):
+    with patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        asyncio.run(main.connect("sid1", {}))
+    emit.assert_awaited_once_with('count_update', {'count': 7}, room="sid1")
+
+
+@patch("db.get_row_count", side_effect=[3, 3, 4])
+def test_update_row_count_skips_unchanged(mock_count):
+    main._last_broadcast_count = None
+
+    async def ticks():
+        for _ in range(3):
+            await main.update_row_count()
+
+    with patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        asyncio.run(ticks())
+    assert [c.args[1]['count'] for c in emit.call_args_list] == [3, 4]
+
+
+def test_save_text_rate_limited():
+    """save_text is limited per client like the HTTP routes."""
+    limiter = main.ratelimit.RateLimiter(1, window=60)
+    with patch.dict(main.rate_limiters, {"save_text": limiter}), \
+         patch.dict(main._sid_ips, {"sid1": "203.0.113.7"}), \
+         patch("db.create_texts", return_value=["QW"]), \
+         patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        asyncio.run(main.save_text("sid1", {"content": "one"}))
+        asyncio.run(main.save_text("sid1", {"content": "two"}))
+    assert [c.args[0] for c in emit.call_args_list] == ['save_success', 'save_error']
+
+
+def test_ping_rate_limited():
+    limiter = main.ratelimit.RateLimiter(2, window=60)
+    with patch.dict(main.rate_limiters, {"ping": limiter}):
+        codes = [client.get("/ping").status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+
+def test_pairing_pushes_save_to_receiver(api):
+    """A save naming a pairing code is pushed to the waiting receiver and counts as one read."""
+    async def listen():
+        sid = await main.sio.manager.connect("eio-receiver", "/")
+        await main.connect(sid, {})
+        await main.pair_listen(sid)
+        return sid
+
+    with patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        sid = api.portal.call(listen)
+        code = emit.call_args.args[1]["code"]
+        stats = api.get("/api/stats").json()
+        assert (stats["connections"], stats["rooms"]) == (1, {"pairing": 1})
+        response = api.post("/save", json={"content": "from the other laptop", "pair_code": code.lower()})
+        assert response.json()["delivered"] is True
+        id_ = response.json()["id"]
+        event, payload = emit.call_args.args
+        assert event == "paste_delivered"
+        assert payload == {"id": id_, "content": "from the other laptop"}
+        assert emit.call_args.kwargs == {"room": f"pair:{code}"}
+        # One read left after the push
+        assert api.get(f"/get/{id_}").status_code == 200
+        assert api.get(f"/get/{id_}").status_code == 404
+
+        api.portal.call(main.disconnect, sid)
+        api.portal.call(main.sio.manager.disconnect, sid, "/")
+        response = api.post("/save", json={"content": "nobody waiting", "pair_code": code})
+        assert response.json()["delivered"] is False
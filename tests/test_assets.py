@@ -0,0 +1,60 @@
+import gzip
+import os
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import assets
+
+
+def make_app(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('pasty');\n" * 50)
+    (tmp_path / "big.bin").write_bytes(b"x" * 64)
+    manifest = assets.AssetManifest(str(tmp_path), "/root/static")
+    app = FastAPI()
+    app.mount("/static", assets.HashedStaticFiles(manifest), name="static")
+    app.mount("/alt/static", assets.HashedStaticFiles(manifest), name="static_alt")
+    return app, manifest
+
+
+def test_hashed_url_changes_with_content(tmp_path):
+    _, manifest = make_app(tmp_path)
+    url = manifest.url("app.js")
+    assert url.startswith("/root/static/app.") and url.endswith(".js")
+    (tmp_path / "app.js").write_text("changed")
+    assert assets.AssetManifest(str(tmp_path), "/root/static").url("app.js") != url
+
+
+def test_hashed_asset_served_immutable_and_compressed(tmp_path):
+    app, manifest = make_app(tmp_path)
+    client = TestClient(app)
+    hashed = manifest.url("app.js").removeprefix("/root")
+    for path in (hashed, "/alt" + hashed):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == assets.IMMUTABLE
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-type"].startswith("text/javascript")
+        assert response.text == (tmp_path / "app.js").read_text()
+
+    plain = client.get("/static/app.js", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["cache-control"] == "no-cache"
+    assert "content-encoding" not in plain.headers
+    assert client.get("/static/app.js", headers={"If-None-Match": plain.headers["etag"]}).status_code == 304
+    assert gzip.decompress(manifest._hashed[os.path.basename(hashed)].variants["gzip"]) == plain.content
+    assert client.get("/static/missing.js").status_code == 404
+    assert client.post(hashed).status_code == 405
+
+
+def test_large_files_stay_on_disk(tmp_path):
+    with patch.object(assets, "MAX_ASSET_BYTES", 32):
+        app, manifest = make_app(tmp_path)
+        url = manifest.url("big.bin")
+    assert url.startswith("/root/static/big.bin?v=")
+    response = TestClient(app).get("/static/big.bin")
+    assert response.content == b"x" * 64
+    assert "big.bin" not in manifest._plain
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import httpx
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from captcha import HCaptchaVerifier
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubProvider:
+    """Stands in for the siteverify endpoint; counts calls and can be made to fail."""
+
+    def __init__(self, valid=("good",)):
+        self.valid = valid
+        self.calls = 0
+        self.failing = False
+
+    def __call__(self, request):
+        self.calls += 1
+        if self.failing:
+            return httpx.Response(503)
+        token = dict(httpx.QueryParams(request.content.decode()))["response"]
+        return httpx.Response(200, json={"success": token in self.valid})
+
+
+def make_verifier(provider, clock, **kwargs):
+    return HCaptchaVerifier(secret="s", url="http://stub/siteverify", transport=httpx.MockTransport(provider),
+                            clock=clock, **kwargs)
+
+
+def test_verified_tokens_are_cached():
+    provider, clock = StubProvider(), FakeClock()
+    verifier = make_verifier(provider, clock, cache_ttl=60)
+
+    async def scenario():
+        results = [await verifier.verify("good"), await verifier.verify("good"), await verifier.verify("bad")]
+        clock.now += 61
+        results.append(await verifier.verify("good"))
+        await verifier.aclose()
+        return results
+
+    assert asyncio.run(scenario()) == [True, True, False, True]
+    assert provider.calls == 3
+
+
+def test_breaker_opens_after_failures_and_recovers():
+    provider, clock = StubProvider(), FakeClock()
+    verifier = make_verifier(provider, clock, breaker_failures=2, breaker_cooldown=30)
+
+    async def scenario():
+        provider.failing = True
+        results = [await verifier.verify("good") for _ in range(4)]
+        calls_while_open = provider.calls
+        provider.failing = False
+        clock.now += 31
+        results.append(await verifier.verify("good"))
+        await verifier.aclose()
+        return results, calls_while_open
+
+    results, calls_while_open = asyncio.run(scenario())
+    assert results == [False, False, False, False, True]
+    assert calls_while_open == 2
+
+
+def test_concurrency_is_capped():
+    in_flight = peak = 0
+
+    async def provider(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"success": True})
+
+    verifier = make_verifier(provider, FakeClock(), max_concurrency=3)
+
+    async def scenario():
+        results = await asyncio.gather(*(verifier.verify(f"t{i}") for i in range(10)))
+        await verifier.aclose()
+        return results
+
+    assert all(asyncio.run(scenario()))
+    assert peak == 3
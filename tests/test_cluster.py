@@ -0,0 +1,154 @@
+import asyncio
+import os
+import sys
+import pytest
+from unittest.mock import patch, AsyncMock
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cluster import InProcessBroker, InProcessManager, MemoryKV, SharedState
+from presence import Presence
+from ratelimit import RateLimiter
+import main
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limit_shared_between_workers():
+    kv = MemoryKV()
+    a, b = SharedState(kv, worker_id="a"), SharedState(kv, worker_id="b")
+
+    async def scenario():
+        hits = []
+        for state in (a, b, a, b):
+            hits.append(await state.hit("save_text", "203.0.113.7", 3, 60, now=1200.0))
+        return hits
+
+    assert asyncio.run(scenario()) == [True, True, True, False]
+
+
+def test_shared_and_local_limits_agree_under_steady_load():
+    """A client retrying once a second for ten minutes gets the same number of hits through either way."""
+    state = SharedState(MemoryKV(clock=FakeClock(0.0)))
+    local = RateLimiter(20, 60, clock=FakeClock(0.0))
+
+    async def scenario():
+        shared_allowed = local_allowed = 0
+        for second in range(600):
+            now = 1200.0 + second
+            shared_allowed += await state.hit("save_text", "203.0.113.7", 20, 60, now=now)
+            local_allowed += local.hit("203.0.113.7", now=now)
+        return shared_allowed, local_allowed
+
+    shared_allowed, local_allowed = asyncio.run(scenario())
+    assert shared_allowed == local_allowed
+    assert local_allowed > 100  # not locked out after the first window
+
+
+def test_shared_limit_charges_batches_like_local():
+    state = SharedState(MemoryKV())
+    local = RateLimiter(5, 60, clock=FakeClock(1200.0))
+    costs = [3, 3, 2, 1]
+
+    async def scenario():
+        return [await state.hit("save_text", "203.0.113.7", 5, 60, now=1200.0, cost=cost) for cost in costs]
+
+    assert asyncio.run(scenario()) == [local.hit("203.0.113.7", now=1200.0, cost=cost) for cost in costs] == [True, False, True, False]
+
+
+def test_connections_summed_and_expire_with_worker():
+    clock = FakeClock()
+    kv = MemoryKV(clock=clock)
+    a, b = SharedState(kv, worker_id="a"), SharedState(kv, worker_id="b")
+
+    async def scenario():
+        await a.publish_connections(3, ttl=30, now=clock.now)
+        await b.publish_connections(4, ttl=30, now=clock.now)
+        total = await a.connections(now=clock.now)
+        clock.now += 20
+        await a.publish_connections(2, ttl=30, now=clock.now)
+        clock.now += 20  # b stopped reporting and its entry expired
+        later = await b.connections(now=clock.now)
+        reporting = sorted(await kv.hgetall("pasty:conns"))
+        clock.now += 40  # Nobody reports any more; the hash goes too
+        return total, later, reporting, await kv.hgetall("pasty:conns")
+
+    assert asyncio.run(scenario()) == (7, 2, ["a"], {})
+
+
+def test_memory_kv_rejects_unknown_scripts():
+    with pytest.raises(ValueError, match="return redis.call"):
+        MemoryKV().register_script("return redis.call('TIME')")
+
+
+def test_rows_counter():
+    state = SharedState(MemoryKV())
+
+    async def scenario():
+        await state.set_rows(10, only_if_missing=True)
+        await state.set_rows(99, only_if_missing=True)  # another worker joining
+        await state.add_rows(2)
+        await state.add_rows(-1)
+        return await state.rows()
+
+    assert asyncio.run(scenario()) == 11
+
+
+def test_in_process_manager_relays_messages():
+    broker = InProcessBroker()
+    sender, receiver = InProcessManager(broker), InProcessManager(broker)
+    message = {'method': 'emit', 'event': 'count_update', 'data': [{'count': 1}], 'host_id': sender.host_id}
+
+    async def scenario():
+        await sender._publish(message)
+        return await receiver._listen().__anext__()
+
+    assert asyncio.run(scenario()) == message
+
+
+def test_main_uses_cluster_totals():
+    """In shared mode broadcasts and pings report cluster-wide numbers and emit only locally."""
+    kv = MemoryKV()
+    other = SharedState(kv, worker_id="other")
+
+    async def scenario():
+        await other.publish_connections(5)
+        await other.set_rows(40)
+        await main.update_row_count()
+        await main.ping("sid1")
+
+    local_clients = Presence()
+    for sid in ("sid1", "sid2"):
+        local_clients.connect(sid)
+
+    with patch.object(main, "shared", SharedState(kv, worker_id="me")), \
+         patch.object(main, "_pushed_rows", None), \
+         patch.object(main, "_cluster_rows", None), \
+         patch.object(main, "_last_broadcast_count", None), \
+         patch.dict(main._sid_ips, {"sid1": "203.0.113.7", "sid2": "203.0.113.8"}, clear=True), \
+         patch.object(main, "clients", local_clients), \
+         patch("db.get_row_count", return_value=3), \
+         patch.object(main.sio, "emit", new=AsyncMock()) as emit:
+        asyncio.run(scenario())
+
+    count_call, pong_call = emit.call_args_list
+    assert count_call.args == ('count_update', {'count': 40})
+    assert count_call.kwargs == {'ignore_queue': True}
+    assert pong_call.args[1]['active_connections'] == 7
+
+
+def test_pairing_registered_in_shared_store():
+    state = SharedState(MemoryKV())
+
+    async def scenario():
+        await state.add_pairing("ABC234", ttl=60)
+        registered = await state.has_pairing("ABC234")
+        await state.remove_pairing("ABC234")
+        return registered, await state.has_pairing("ABC234")
+
+    assert asyncio.run(scenario()) == (True, False)
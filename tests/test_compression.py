@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from compression import CODEC_RAW, CODEC_ZLIB, compress, decompress, stored_content
+
+
+def test_small_text_stays_plain():
+    assert compress("short", min_bytes=1024) is None
+    assert stored_content("short", None) == "short"
+
+
+def test_round_trip():
+    text = "2025-06-01 INFO GET /ping 200 ünïcode\n" * 200
+    blob = compress(text, min_bytes=1024)
+    assert blob[0] == CODEC_ZLIB
+    assert len(blob) < len(text)
+    assert decompress(blob) == text
+    assert stored_content(None, blob) == text
+
+
+def test_codecs():
+    assert decompress(bytes([CODEC_RAW]) + "plain".encode()) == "plain"
+    with pytest.raises(ValueError):
+        decompress(bytes([255]) + b"data")
@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+import random
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ids import IdAllocator, IdSpaceExhausted, ids_of_length, NEIGHBOURS
+
+
+class TestIdAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.allocator = IdAllocator(max_length=3, rng=random.Random(0))
+        self.allocator.seed([])
+
+    def test_ids_of_length(self):
+        """Two-character IDs are the horizontal pairs; longer ones walk touching keys."""
+        pairs = ids_of_length(2)
+        self.assertEqual(len(pairs), 23)
+        self.assertIn("QW", pairs)
+        for id_ in ids_of_length(3):
+            self.assertEqual(len(set(id_)), 3)
+            self.assertIn(id_[1], NEIGHBOURS[id_[0]])
+            self.assertIn(id_[2], NEIGHBOURS[id_[1]])
+
+    def test_allocate_prefers_short_ids(self):
+        """All pairs are handed out before the allocator grows to triples."""
+        first = {self.allocator.allocate() for _ in range(23)}
+        self.assertEqual(first, set(ids_of_length(2)))
+        self.assertEqual(len(self.allocator.allocate()), 3)
+
+    def test_release_returns_id_to_pool(self):
+        """A released pair is reused ahead of longer IDs."""
+        for _ in range(24):
+            self.allocator.allocate()
+        self.allocator.release("QW")
+        self.assertEqual(self.allocator.allocate(), "QW")
+
+    def test_seed_skips_used_ids(self):
+        """Seeded IDs are never allocated again."""
+        used = [id_ for id_ in ids_of_length(2) if id_ != "AS"]
+        self.allocator.seed(used)
+        self.assertEqual(self.allocator.allocate(), "AS")
+        self.assertEqual(len(self.allocator.allocate()), 3)
+
+    def test_mark_used(self):
+        """IDs taken elsewhere are removed from the free pool."""
+        self.allocator.seed(ids_of_length(2)[1:])
+        self.allocator.mark_used(ids_of_length(2)[0])
+        self.assertEqual(len(self.allocator.allocate()), 3)
+
+    def test_exhausted(self):
+        """Allocation fails instead of looping when the ID space is full."""
+        allocator = IdAllocator(max_length=2)
+        allocator.seed(ids_of_length(2))
+        with self.assertRaises(IdSpaceExhausted):
+            allocator.allocate()
+
+
+if __name__ == '__main__':
+    unittest.main()
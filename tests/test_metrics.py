@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("pasty_test_seconds", "Test.", ("event",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "save_text")
+    assert histogram.render() == [
+        "# HELP pasty_test_seconds Test.",
+        "# TYPE pasty_test_seconds histogram",
+        'pasty_test_seconds_bucket{event="save_text",le="0.1"} 2',
+        'pasty_test_seconds_bucket{event="save_text",le="1.0"} 3',
+        'pasty_test_seconds_bucket{event="save_text",le="+Inf"} 4',
+        'pasty_test_seconds_sum{event="save_text"} 3.65',
+        'pasty_test_seconds_count{event="save_text"} 4',
+    ]
+
+
+def test_registry_renders_gauges_and_escapes_labels():
+    registry = metrics.Registry()
+    registry.gauge("pasty_rows", "Rows.", lambda: 7)
+    registry.gauge("pasty_keys", "Keys.", lambda: {'a"b': 2}, "limiter")
+    registry.gauge("pasty_broken", "Broken.", lambda: 1 / 0)
+    assert registry.render().splitlines() == [
+        "# HELP pasty_rows Rows.", "# TYPE pasty_rows gauge", "pasty_rows 7",
+        "# HELP pasty_keys Keys.", "# TYPE pasty_keys gauge", 'pasty_keys{limiter="a\\"b"} 2',
+        "# HELP pasty_broken Broken.", "# TYPE pasty_broken gauge",
+    ]
+
+
+def test_instrument_socketio_times_handlers_with_fewer_arguments():
+    class FakeServer:
+        handlers = {"/": {}}
+
+    calls = []
+
+    async def connect(sid, environ):
+        calls.append((sid, environ))
+
+    async def save_text(sid, data):
+        calls.append((sid, data))
+
+    sio = FakeServer()
+    sio.handlers["/"] = {"connect": connect, "save_text": save_text}
+    histogram = metrics.Histogram("pasty_test_event_seconds", "Test.", ("event",))
+    metrics.instrument_socketio(sio, histogram)
+
+    async def emit():
+        # python-socketio passes auth as a third argument; the legacy handler never sees it
+        await sio.handlers["/"]["connect"]("sid1", {"REMOTE_ADDR": "1.2.3.4"}, None)
+        await sio.handlers["/"]["save_text"]("sid1", {"content": "hi"})
+
+    asyncio.run(emit())
+    assert calls == [("sid1", {"REMOTE_ADDR": "1.2.3.4"}), ("sid1", {"content": "hi"})]
+    rendered = "\n".join(histogram.render())
+    assert 'pasty_test_event_seconds_count{event="connect"} 1' in rendered
+    assert 'pasty_test_event_seconds_count{event="save_text"} 1' in rendered
+
+
+def test_instrument_engine_times_statements_by_kind():
+    engine = create_engine("sqlite:///:memory:")
+    histogram = metrics.Histogram("pasty_test_db_seconds", "Test.", ("operation",))
+    metrics.instrument_engine(engine, histogram)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        conn.execute(text("\n  select x from t"))
+        try:
+            conn.execute(text("SELECT nope FROM t"))
+        except Exception:
+            pass
+    rendered = "\n".join(histogram.render())
+    assert 'pasty_test_db_seconds_count{operation="INSERT"} 1' in rendered
+    assert 'pasty_test_db_seconds_count{operation="SELECT"} 1' in rendered
+    with engine.connect() as conn:
+        assert not conn.info.get("metrics_start")
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get("/get/{text_id}")
+    async def get_text(text_id: str):
+        return {"id": text_id}
+
+    histogram = metrics.Histogram("pasty_test_http_seconds", "Test.", ("method", "route"))
+    app.add_middleware(metrics.MetricsMiddleware, histogram=histogram)
+    client = TestClient(app)
+    client.get("/get/QW")
+    client.get("/get/ER")
+    client.get("/missing")
+    rendered = "\n".join(histogram.render())
+    assert 'pasty_test_http_seconds_count{method="GET",route="/get/{text_id}"} 2' in rendered
+    assert 'pasty_test_http_seconds_count{method="GET",route="unmatched"} 1' in rendered
@@ -0,0 +1,76 @@
+import gzip
+import os
+import sys
+
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pages
+
+
+def make_app(tmp_path):
+    (tmp_path / "page.html").write_text("<a href=\"{{ PUBLIC_ROOT }}/\">{{ greeting }}</a>" + " padding" * 100)
+    cache = pages.PageCache(Jinja2Templates(directory=str(tmp_path)), {"greeting": "hello", "PUBLIC_ROOT": "/pasty"})
+    app = FastAPI()
+
+    @app.get("/")
+    async def page(request: Request):
+        return cache.response(request, "page.html")
+    return app, cache
+
+
+def test_choose_encoding():
+    available = {"identity": b"", "gzip": b"", "br": b""}
+    assert pages.choose_encoding("gzip, deflate, br", available) == "br"
+    assert pages.choose_encoding("br;q=0, gzip;q=0.5", available) == "gzip"
+    assert pages.choose_encoding("*", {"identity": b"", "gzip": b""}) == "gzip"
+    assert pages.choose_encoding("gzip;q=0", available) == "identity"
+    assert pages.choose_encoding(None, available) == "identity"
+
+
+def test_page_rendered_once_and_revalidated_with_etag(tmp_path):
+    app, cache = make_app(tmp_path)
+    client = TestClient(app)
+    first = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert 'href="/pasty/">hello</a>' in first.text
+    assert first.headers["cache-control"] == "no-cache"
+    etag = first.headers["etag"]
+    assert client.get("/", headers={"Accept-Encoding": "identity"}).headers["etag"] == etag
+
+    not_modified = client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get("/", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert cache.renders == 1
+
+    cache.clear()
+    client.get("/")
+    assert cache.renders == 2
+    cache.render("page.html")
+    assert cache.renders == 3
+
+
+def test_page_served_compressed(tmp_path):
+    app, _ = make_app(tmp_path)
+    client = TestClient(app)
+    plain = client.get("/", headers={"Accept-Encoding": "identity"})
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] != plain.headers["etag"]
+    assert response.text == plain.text  # httpx decodes the body
+    assert gzip.decompress(pages.compress(plain.content)["gzip"]) == plain.content
+    # Either representation's ETag validates
+    assert client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["etag"]}).status_code == 304
+
+
+def test_host_header_does_not_render_again(tmp_path):
+    app, cache = make_app(tmp_path)
+    cache.render("page.html")
+    bodies = {TestClient(app, base_url=f"http://{host}").get("/").text for host in ("a.test", "b.test", "c.test")}
+    assert len(bodies) == 1
+    assert cache.renders == 1
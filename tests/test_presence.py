@@ -0,0 +1,31 @@
+import os
+import sys
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from presence import Presence
+
+
+def test_counts_follow_connects_and_rooms():
+    presence = Presence()
+    for sid in ("a", "b", "c"):
+        presence.connect(sid)
+    presence.join("a", "pairing")
+    presence.join("a", "pairing")  # joining twice counts once
+    presence.join("b", "pairing")
+    assert (presence.count(), presence.count("pairing")) == (3, 2)
+
+    presence.leave("b", "pairing")
+    presence.disconnect("a")
+    presence.disconnect("a")  # already gone
+    assert (presence.count(), presence.rooms()) == (2, {})
+
+
+def test_reconcile_corrects_drift():
+    presence = Presence()
+    for sid in ("a", "b", "stale"):
+        presence.connect(sid)
+    presence.join("stale", "pairing")
+
+    # "stale" missed its disconnect and "c" its connect
+    assert presence.reconcile(["a", "b", "c"], {"pairing": ["c"]}) == 2
+    assert (presence.count(), presence.rooms()) == (3, {"pairing": 1})
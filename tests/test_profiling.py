@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+import profiling
+
+
+def busy_worker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_returns_folded_stacks():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_worker, args=(stop,), name="busy")
+    thread.start()
+    try:
+        folded = profiling.SamplingProfiler(interval=0.001).capture(0.2)
+    finally:
+        stop.set()
+        thread.join()
+    lines = folded.splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert any(line.startswith("busy;") and "busy_worker (test_profiling.py:" in line for line in lines)
+
+
+def test_sampling_profiler_runs_one_capture_at_a_time():
+    sampler = profiling.SamplingProfiler(interval=0.001, max_seconds=0.2)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(sampler.capture(60)))
+    thread.start()
+    time.sleep(0.05)
+    with pytest.raises(profiling.ProfilerBusy):
+        sampler.capture(0.1)
+    thread.join(timeout=5)
+    assert results  # capped at max_seconds instead of the 60 requested
+
+
+def test_call_profiler_profiles_every_nth_call():
+    calls = []
+
+    class FakeServer:
+        handlers = {"/": {}}
+
+    async def save_text(sid, data):
+        calls.append(data)
+        return "ok"
+
+    sio = FakeServer()
+    sio.handlers["/"] = {"save_text": save_text}
+    profiler = profiling.CallProfiler(every=2)
+    assert profiler.dump() is None
+    profiler.instrument_socketio(sio)
+
+    async def emit():
+        for i in range(4):
+            assert await sio.handlers["/"]["save_text"]("sid", i) == "ok"
+
+    asyncio.run(emit())
+    assert calls == [0, 1, 2, 3]
+    assert profiler.profiled == 2
+    stats = marshal.loads(profiler.dump())
+    assert any(name == "save_text" for _, _, name in stats)
+    profiler.reset()
+    assert profiler.dump() is None
+
+
+def test_profile_middleware_skips_excluded_paths():
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    @app.get("/admin/profile")
+    async def admin():
+        return {}
+
+    profiler = profiling.CallProfiler(every=1)
+    app.add_middleware(profiling.ProfileMiddleware, profiler=profiler)
+    client = TestClient(app)
+    client.get("/admin/profile")
+    assert profiler.profiled == 0
+    client.get("/ping")
+    assert profiler.profiled == 1
+
+
+def test_slow_callback_monitor_logs_the_handler(caplog):
+    async def retrieve_text():
+        await asyncio.sleep(0)
+        time.sleep(0.03)
+
+    async def quick():
+        await asyncio.sleep(0)
+
+    profiling.install_slow_callback_monitor(10)
+    try:
+        with caplog.at_level(logging.WARNING, logger="profiling"):
+            asyncio.run(quick())
+            assert not caplog.records
+            asyncio.run(retrieve_text())
+    finally:
+        profiling.uninstall_slow_callback_monitor()
+    assert "Slow event-loop step" in caplog.text
+    assert "retrieve_text (test_profiling.py:" in caplog.text
+    assert not getattr(asyncio.events.Handle._run, "slow_callback_monitor", False)
+
+
+def test_frame_name_without_qualname():
+    # Python < 3.11 code objects have no co_qualname
+    code = SimpleNamespace(co_name="save_text", co_filename="/app/main.py", co_firstlineno=12)
+    assert profiling._frame_name(code) == "save_text (main.py:12)"
+
+
+def test_slow_callback_monitor_errors_do_not_stop_the_loop():
+    async def slow():
+        await asyncio.sleep(0)
+        time.sleep(0.02)
+        return "done"
+
+    profiling.install_slow_callback_monitor(1)
+    try:
+        with patch.object(profiling, "_describe", side_effect=AttributeError("co_qualname")), \
+             patch.object(profiling, "_coroutine_chain", side_effect=RuntimeError):
+            assert asyncio.run(slow()) == "done"
+    finally:
+        profiling.uninstall_slow_callback_monitor()
+
+
+def test_admin_routes_require_the_token():
+    app = FastAPI()
+
+    @app.get("/admin/check")
+    async def check(_: None = Depends(main.require_admin)):
+        return {"ok": True}
+
+    client = TestClient(app)
+    with patch.object(profiling, "PROFILING_TOKEN", "secret"):
+        assert client.get("/admin/check").status_code == 403
+        assert client.get("/admin/check", headers={"Authorization": "Bearer wrong"}).status_code == 403
+        assert client.get("/admin/check", headers={"Authorization": "Bearer secret"}).status_code == 200
@@ -0,0 +1,80 @@
+import unittest
+import os
+import sys
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ratelimit import RateLimiter, parse_limits
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(3, window=60, clock=self.clock)
+
+    def test_limit_enforced(self):
+        """Hits beyond the limit within one window are rejected."""
+        self.clock.now = 1200.0  # start of a fixed window
+        self.assertEqual([self.limiter.hit("a") for _ in range(4)], [True, True, True, False])
+        self.assertTrue(self.limiter.hit("b"))
+
+    def test_sliding_window(self):
+        """Hits from the previous window count in proportion to their overlap."""
+        self.clock.now = 1200.0
+        for _ in range(3):
+            self.limiter.hit("a")
+        self.clock.now = 1260.0 + 15  # 75% overlap: 2.25 of the 3 hits still count
+        self.assertEqual([self.limiter.hit("a") for _ in range(2)], [True, False])
+        self.clock.now = 1260.0 + 30  # 50% overlap: 1.5 old hits plus 1 new one
+        self.assertEqual([self.limiter.hit("a") for _ in range(2)], [True, False])
+
+    def test_cost(self):
+        """A hit worth several hits is allowed only if all of them fit, and counts them all."""
+        self.clock.now = 1200.0
+        self.assertFalse(self.limiter.hit("a", cost=4))
+        self.assertTrue(self.limiter.hit("a", cost=2))
+        self.assertFalse(self.limiter.hit("a", cost=2))
+        self.assertTrue(self.limiter.hit("a"))
+        self.assertFalse(self.limiter.hit("a"))
+
+    def test_idle_keys_evicted(self):
+        """Keys are dropped once two windows have passed since their last hit."""
+        for i in range(100):
+            self.limiter.hit(f"ip{i}")
+        self.assertEqual(len(self.limiter), 100)
+        self.clock.now += 180
+        self.limiter.hit("fresh")
+        self.assertEqual(len(self.limiter), 1)
+
+    def test_active_keys_kept(self):
+        """A key hit in every window survives wheel sweeps with its counters intact."""
+        for _ in range(10):
+            self.limiter.hit("busy")
+            self.clock.now += 50
+        self.assertEqual(len(self.limiter), 1)
+
+    def test_max_keys(self):
+        """The number of tracked keys never exceeds max_keys."""
+        limiter = RateLimiter(3, window=60, max_keys=10, clock=self.clock)
+        for i in range(50):
+            limiter.hit(f"ip{i}")
+            self.clock.now += 0.1
+        self.assertEqual(len(limiter), 10)
+
+    def test_parse_limits(self):
+        self.assertEqual(
+            parse_limits("ping=30/60, save_text=5/10,retrieve_text=7"),
+            {"ping": (30, 60.0), "save_text": (5, 10.0), "retrieve_text": (7, 60.0)},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+import pytest
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import MemoryStore, SQLStore, create_store
+
+
+def make_store():
+    return MemoryStore(expiration_hours=1, max_retrievals=2, batch_size=2)
+
+
+def test_memory_store_two_reads_then_delete():
+    store = make_store()
+
+    async def scenario():
+        [id_] = await store.insert_many([("hello", datetime.now(timezone.utc), "203.0.113.7")])
+        reads = [await store.consume(id_) for _ in range(3)]
+        return id_, reads
+
+    id_, reads = asyncio.run(scenario())
+    assert len(id_) == 2
+    assert reads == ["hello", "hello", None]
+    assert store.count() == 0
+
+
+def test_memory_store_expiry():
+    store = make_store()
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        old = await store.insert_many([("old", now - timedelta(hours=2), "ip")] * 3)
+        [new] = await store.insert_many([("new", now, "ip")])
+        # Expired entries read as missing before the sweep runs
+        missing = await store.consume(old[0])
+        removed = await store.expire()
+        return missing, removed, await store.consume(new)
+
+    assert asyncio.run(scenario()) == (None, 3, "new")
+    assert store.count() == 1
+
+
+def test_memory_store_skips_stale_heap_entries():
+    """An ID freed by consume and reused later is not expired by its old heap entry."""
+    store = make_store()
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        [first] = await store.insert_many([("first", now - timedelta(minutes=59), "ip")])
+        await store.consume(first)
+        await store.consume(first)
+        store.allocator.seed([])
+        store.allocator.release(first)
+        reused = None
+        while reused != first:
+            [reused] = await store.insert_many([("second", now, "ip")])
+        removed = await store.expire(now=now.timestamp() + 120)
+        return removed, await store.consume(first)
+
+    assert asyncio.run(scenario()) == (0, "second")
+
+
+def test_create_store_selection():
+    assert isinstance(create_store("memory", "sqlite:///x.db"), MemoryStore)
+    assert isinstance(create_store("", "memory://"), MemoryStore)
+    assert isinstance(create_store("", "sqlite:///x.db"), SQLStore)
+    with pytest.raises(ValueError):
+        create_store("redis", "sqlite:///x.db")
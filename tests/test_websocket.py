@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from websocket import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("gone")
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def time_now():
+    return asyncio.get_running_loop().time()
+
+
+def counts(socket):
+    return [m["count"] for m in socket.sent if m.get("type") == "count_update"]
+
+
+def test_slow_client_does_not_delay_others():
+    manager = ConnectionManager()
+    fast, slow = FakeSocket(), FakeSocket(delay=0.5)
+
+    async def scenario():
+        await manager.connect(fast)
+        await manager.connect(slow)
+        await asyncio.sleep(0.01)
+        start = time_now()
+        await manager.broadcast_count(7)
+        await asyncio.sleep(0.01)
+        return time_now() - start
+
+    elapsed = asyncio.run(scenario())
+    assert elapsed < 0.1
+    assert counts(fast) == [0, 7]
+
+
+def test_slow_client_gets_latest_count_only():
+    manager = ConnectionManager()
+    slow = FakeSocket(delay=0.05)
+
+    async def scenario():
+        await manager.connect(slow)
+        await asyncio.sleep(0)  # the sender picks up the initial count
+        for count in range(1, 50):
+            await manager.broadcast_count(count)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert counts(slow) == [0, 49]
+
+
+def test_backed_up_client_is_evicted():
+    clock = [0.0]
+    manager = ConnectionManager(queue_limit=2, evict_after=5, clock=lambda: clock[0])
+    stuck = FakeSocket(delay=10)
+
+    async def scenario():
+        await manager.connect(stuck)
+        await asyncio.sleep(0)
+        for i in range(3):
+            await manager.broadcast({"type": "note", "n": i})
+        backed_up = stuck in manager.active_connections
+        clock[0] = 6
+        await manager.broadcast({"type": "note", "n": 3})
+        await asyncio.sleep(0)
+        return backed_up
+
+    assert asyncio.run(scenario()) is True
+    assert stuck not in manager.active_connections
+    assert stuck.closed == 1013
+
+
+def test_failed_send_disconnects():
+    manager = ConnectionManager()
+    broken = FakeSocket(fail=True)
+
+    async def scenario():
+        await manager.connect(broken)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert manager.active_connections == {}
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+import pytest
+# Add project root to sys.path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from writer import WriteQueue
+
+
+class RecordingCommit:
+    def __init__(self, delay=0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, entries):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(entries))
+        return [f"id-{entry}" for entry in entries]
+
+
+def test_concurrent_saves_share_a_commit():
+    commit = RecordingCommit()
+    queue = WriteQueue(commit, batch_size=4, max_latency=0.01)
+
+    async def scenario():
+        return await asyncio.gather(*(queue.submit(i) for i in range(10)))
+
+    assert asyncio.run(scenario()) == [f"id-{i}" for i in range(10)]
+    assert [len(b) for b in commit.batches] == [4, 4, 2]
+
+
+def test_ack_waits_for_commit():
+    commit = RecordingCommit(delay=0.05)
+    queue = WriteQueue(commit, max_latency=0)
+
+    async def scenario():
+        result = await queue.submit("a")
+        return result, len(commit.batches)
+
+    assert asyncio.run(scenario()) == ("id-a", 1)
+
+
+def test_entry_failure_is_isolated():
+    async def commit(entries):
+        return [ValueError("bad") if entry == "bad" else entry for entry in entries]
+
+    queue = WriteQueue(commit)
+
+    async def scenario():
+        return await asyncio.gather(queue.submit("ok"), queue.submit("bad"), return_exceptions=True)
+
+    ok, bad = asyncio.run(scenario())
+    assert ok == "ok"
+    assert isinstance(bad, ValueError)
+
+
+def test_commit_failure_fails_batch():
+    async def commit(entries):
+        raise RuntimeError("disk full")
+
+    queue = WriteQueue(commit)
+
+    async def scenario():
+        await queue.submit("a")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+
+def test_stop_flushes_pending():
+    commit = RecordingCommit()
+    queue = WriteQueue(commit, max_latency=1)
+
+    async def scenario():
+        pending = asyncio.ensure_future(queue.submit("last"))
+        await asyncio.sleep(0)
+        await queue.stop()
+        return await pending
+
+    assert asyncio.run(scenario()) == "id-last"
@@ -1,50 +1,135 @@
-
 """
 websocket.py
 
-Manages WebSocket connections for real-time row count updates in Pasty.
+Manages WebSocket connections for real-time row count updates in Pasty. Every connection gets its own
+outbound queue and sender task, so a slow client only delays itself; row counts are coalesced so a
+client that falls behind skips straight to the latest value, and one that stays backed up is evicted.
 """
 
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
 from fastapi import WebSocket
-from typing import List
+
+logger = logging.getLogger(__name__)
+
+WS_QUEUE_LIMIT = int(os.getenv("WS_QUEUE_LIMIT", 32))  # Queued messages per connection before it counts as backed up
+WS_EVICT_AFTER = float(os.getenv("WS_EVICT_AFTER", 5))  # Seconds a connection may stay backed up
+WS_CLOSE_TIMEOUT = 1  # Seconds to wait for an evicted client to acknowledge the close
+
+
+class _Connection:
+    """Outbound state for one socket: queued messages plus the latest undelivered count."""
+    __slots__ = ("websocket", "queue", "count", "wakeup", "task", "backed_up_since")
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.queue = deque()
+        self.count: Optional[int] = None
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.backed_up_since = None
 
 
 class ConnectionManager:
     """Manages active WebSocket connections and broadcasts row count updates."""
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, queue_limit=WS_QUEUE_LIMIT, evict_after=WS_EVICT_AFTER, clock=time.monotonic):
+        # Keyed by socket: set semantics with O(1) removal
+        self.active_connections: Dict[WebSocket, _Connection] = {}
         self.current_count: int = 0
+        self.queue_limit = queue_limit
+        self.evict_after = evict_after
+        self._clock = clock
 
     async def connect(self, websocket: WebSocket):
         """Accept and register a new WebSocket connection."""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        connection = _Connection(websocket)
+        self.active_connections[websocket] = connection
+        connection.task = asyncio.create_task(self._sender(connection))
         # Send current count immediately upon connection
-        await self.send_count_to_client(websocket, self.current_count)
+        self._push_count(connection, self.current_count)
 
     async def disconnect(self, websocket: WebSocket):
-        """Remove a WebSocket connection from the active list."""
-        try:
-            self.active_connections.remove(websocket)
-        except ValueError:
-            pass
+        """Remove a WebSocket connection and stop its sender."""
+        connection = self.active_connections.pop(websocket, None)
+        if connection is not None and connection.task is not asyncio.current_task():
+            connection.task.cancel()
 
     async def broadcast_count(self, count: int):
-        """Broadcast the current row count to all active connections."""
+        """Queue the current row count for every connection; never waits on a client."""
         self.current_count = count
-        for connection in self.active_connections:
-            try:
-                await self.send_count_to_client(connection, count)
-            except Exception as e:
-                print(f"Error broadcasting to client: {e}")
-                await self.disconnect(connection)
+        for connection in list(self.active_connections.values()):
+            self._push_count(connection, count)
+
+    async def broadcast(self, message: dict):
+        """Queue a message for every connection."""
+        for connection in list(self.active_connections.values()):
+            self._push(connection, message)
+
+    async def send(self, websocket: WebSocket, message: dict):
+        """Queue a message for one connection."""
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            self._push(connection, message)
 
     async def send_count_to_client(self, websocket: WebSocket, count: int):
-        """Send the row count to a specific WebSocket client."""
+        """Queue the row count for a specific WebSocket client."""
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            self._push_count(connection, count)
+
+    def _push_count(self, connection, count):
+        # Latest value wins: an undelivered older count is simply replaced
+        connection.count = count
+        connection.wakeup.set()
+
+    def _push(self, connection, message):
+        connection.queue.append(message)
+        if len(connection.queue) > self.queue_limit:
+            now = self._clock()
+            if connection.backed_up_since is None:
+                connection.backed_up_since = now
+            # Hard cap so a stalled client can't grow its queue for the whole grace period
+            elif now - connection.backed_up_since >= self.evict_after or len(connection.queue) > 2 * self.queue_limit:
+                self._evict(connection)
+                return
+        connection.wakeup.set()
+
+    def _evict(self, connection):
+        logger.warning(f"Evicting WebSocket client with {len(connection.queue)} queued messages")
+        self.active_connections.pop(connection.websocket, None)
+        connection.task.cancel()
+        asyncio.create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), WS_CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _sender(self, connection):
+        websocket = connection.websocket
         try:
-            await websocket.send_json({"type": "count_update", "count": count})
+            while True:
+                await connection.wakeup.wait()
+                connection.wakeup.clear()
+                while connection.queue or connection.count is not None:
+                    if connection.queue:
+                        await websocket.send_json(connection.queue.popleft())
+                        if len(connection.queue) <= self.queue_limit:
+                            connection.backed_up_since = None
+                    else:
+                        count, connection.count = connection.count, None
+                        await websocket.send_json({"type": "count_update", "count": count})
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Error sending to client: {e}")
+            logger.error(f"Error sending to client: {e}")
             await self.disconnect(websocket)
 
 
@@ -56,4 +141,4 @@ connected_clients = []
 
 async def notify_clients(count: int):
     """Notify all clients of a new row count."""
-    await manager.broadcast_count(count)
\ No newline at end of file
+    await manager.broadcast_count(count)
@@ -0,0 +1,99 @@
+"""
+writer.py
+
+Group-commit write pipeline for Pasty. Saves are queued and a single writer task commits them in
+batches, so a burst of pastes costs one transaction (and one fsync) per batch instead of one per row.
+Each caller gets its ID back only after the batch holding its entry has been committed.
+"""
+
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 64))  # Max entries per commit
+WRITE_MAX_LATENCY_MS = float(os.getenv("WRITE_MAX_LATENCY_MS", 2))  # Max wait for a batch to fill
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Queue of pending inserts drained by one writer task.
+
+    `commit` is an async callable taking a list of entries and returning one result per
+    entry: the new ID, or an exception for an entry that failed on its own. If `commit`
+    raises, every entry in the batch fails with that error.
+    """
+
+    def __init__(self, commit, batch_size=WRITE_BATCH_SIZE, max_latency=WRITE_MAX_LATENCY_MS / 1000):
+        self.commit = commit
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Start the writer task on the running loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit whatever is queued, then stop the writer task."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+
+    async def submit(self, entry):
+        """Queue an entry and wait until it is committed; returns its ID."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((entry, future))
+        return await future
+
+    async def _collect(self, first):
+        """Build a batch: everything already queued, then wait up to max_latency for more."""
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch, stopping = await self._collect(first)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch):
+        try:
+            results = await self.commit([entry for entry, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to commit batch of {len(batch)} entries: {e}")
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)